@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Registro write-behind de acessos (accessed_at) do tracking_mapping
+"""
+
+import time
+import atexit
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class AccessTracker:
+    """Acumula acessos em memória e grava em lote periodicamente.
+
+    `record(key)` só guarda o instante (monotônico) do último acesso. A thread
+    de flush chama `flush_fn([(key, idade_em_segundos), ...])` a cada
+    `interval` segundos, ou antes se o buffer passar de `max_pending` chaves.
+    A idade (e não um datetime local) deixa o banco calcular o timestamp com o
+    próprio relógio/timezone. Em caso de erro os acessos voltam ao buffer.
+    """
+
+    def __init__(self, flush_fn, interval=5.0, max_pending=5000, name='access-tracker'):
+        self.flush_fn = flush_fn
+        self.interval = interval
+        self.max_pending = max_pending
+        self.name = name
+
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = None
+        self.start()
+        atexit.register(self.stop)
+
+    def start(self):
+        """Inicia (ou reinicia, ex.: após fork) a thread de flush"""
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def record(self, key):
+        with self._lock:
+            self._pending[key] = time.monotonic()
+            full = len(self._pending) >= self.max_pending
+        if full:
+            self._wakeup.set()
+
+    def flush(self):
+        """Grava os acessos pendentes. Retorna quantas chaves foram enviadas."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        now = time.monotonic()
+        batch = [(key, max(0.0, now - seen)) for key, seen in pending.items()]
+        try:
+            self.flush_fn(batch)
+            return len(batch)
+        except Exception as e:
+            logger.error(f"❌ Erro no flush de acessos ({len(batch)} pendentes): {e}")
+            with self._lock:
+                for key, seen in pending.items():
+                    # Mantém o acesso mais recente se houve novo record durante o flush
+                    if self._pending.get(key, 0) < seen:
+                        self._pending[key] = seen
+            return 0
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def stop(self):
+        """Para a thread e grava o que restou no buffer"""
+        self._stopped = True
+        self._wakeup.set()
+        self.flush()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Acesso assíncrono (asyncpg) ao PostgreSQL para o caminho do PIX
+
+Usado pelo modo GATEWAY_MODE=async (async_gateway.py): gerar PIX, verificar PIX
+e webhook da TriboPay consultam o banco sem bloquear o event loop. O SQL e a
+conversão das linhas são os mesmos do DatabaseManager (database.py), só com os
+placeholders em $1..$n. O asyncpg prepara e guarda em cache cada statement por
+conexão - desligado com DB_PREPARED_STATEMENTS=0, como no modo síncrono.
+
+O circuit breaker é o mesmo objeto do DatabaseManager: falhas vistas por
+qualquer um dos modos abrem o circuito 'payment' para os dois.
+"""
+
+import os
+import asyncio
+import logging
+from decimal import Decimal
+from contextlib import asynccontextmanager
+
+import asyncpg
+
+from database import (
+    GET_USER_SQL, GET_ACTIVE_PIX_SQL, GET_ACTIVE_PIX_ANY_PLAN_SQL, APPEND_WEBHOOK_SQL,
+    user_with_tracking, generated_pix_statement, pix_update_statement, valid_pix_payload
+)
+from circuit_breaker import DatabaseUnavailable
+from statements import numbered
+
+logger = logging.getLogger(__name__)
+
+
+def is_database_failure(error):
+    """Banco lento/fora (e não erro da própria query) - equivalente assíncrono do circuit_breaker"""
+    return isinstance(error, (
+        asyncpg.QueryCanceledError,  # statement_timeout
+        asyncpg.PostgresConnectionError,
+        asyncpg.InterfaceError,
+        asyncio.TimeoutError,  # conexão ou checkout do pool
+        OSError
+    ))
+
+
+class AsyncPaymentStore:
+    """Pool asyncpg com as queries do caminho do PIX"""
+
+    def __init__(self, dsn, capabilities, breaker, min_size=1, max_size=20, checkout_timeout=10.0,
+                 statement_timeout_ms=3000, connect_timeout=5, sslmode='require', prepared=True):
+        self.dsn = dsn
+        self.capabilities = capabilities
+        self.breaker = breaker
+        self.min_size = min_size
+        self.max_size = max_size
+        self.checkout_timeout = checkout_timeout
+        self.statement_timeout_ms = statement_timeout_ms
+        self.connect_timeout = connect_timeout
+        self.sslmode = sslmode
+        self.prepared = prepared
+        self._pool = None
+
+    async def open(self):
+        self._pool = await asyncpg.create_pool(
+            self.dsn,
+            min_size=self.min_size,
+            max_size=self.max_size,
+            timeout=self.connect_timeout,
+            ssl=self.sslmode,
+            # 0 desliga o cache de prepared statements (PgBouncer em modo transação)
+            statement_cache_size=100 if self.prepared else 0,
+            server_settings={'statement_timeout': str(self.statement_timeout_ms)}
+        )
+        logger.info(f"✅ Pool assíncrono do PostgreSQL aberto ({self.min_size}-{self.max_size} conexões)")
+
+    async def close(self):
+        pool, self._pool = self._pool, None
+        if pool:
+            await pool.close()
+
+    @asynccontextmanager
+    async def connection(self):
+        """Conexão emprestada do pool; levanta DatabaseUnavailable com o circuito aberto"""
+        probe = self.breaker.before()
+        settled = False
+        try:
+            async with self._pool.acquire(timeout=self.checkout_timeout) as conn:
+                yield conn
+        except Exception as e:
+            if is_database_failure(e):
+                self.breaker.record_failure(e)
+            else:
+                # O banco respondeu (erro da própria query ou da aplicação)
+                self.breaker.record_success()
+            settled = True
+            logger.error(f"❌ Erro no database: {e}")
+            raise
+        else:
+            self.breaker.record_success()
+            settled = True
+        finally:
+            if probe and not settled:
+                # Request cancelado (cliente desconectou): sem veredito sobre o banco
+                self.breaker.release_probe()
+
+    async def get_user(self, telegram_id):
+        """Buscar usuário por telegram_id"""
+        try:
+            async with self.connection() as conn:
+                user = await conn.fetchrow(numbered(GET_USER_SQL), telegram_id)
+            return user_with_tracking(dict(user)) if user else None
+        except DatabaseUnavailable:
+            raise
+        except Exception as e:
+            logger.error(f"❌ Erro buscando usuário {telegram_id}: {e}")
+            return None
+
+    async def record_generated_pix(self, transaction_id, telegram_id, amount, tracking_data, plano_id=None, pix_code=None, qr_code=None):
+        """Persiste um PIX recém-gerado (ver DatabaseManager.record_generated_pix)"""
+        sql, params = generated_pix_statement(
+            self.capabilities.has_plano_id, str(transaction_id), telegram_id,
+            # amount é DECIMAL(10,2); o asyncpg não converte float implicitamente
+            Decimal(str(amount)), tracking_data, plano_id=plano_id, pix_code=pix_code, qr_code=qr_code
+        )
+        async with self.connection() as conn:
+            return await conn.fetchval(numbered(sql), *params)
+
+    async def update_pix_transaction(self, transaction_id, status=None, pix_code=None, qr_code=None, enqueue_conversion=False):
+        """Atualizar transação PIX (ver DatabaseManager.update_pix_transaction)"""
+        statement = pix_update_statement(str(transaction_id), status=status, pix_code=pix_code, qr_code=qr_code,
+                                         enqueue_conversion=enqueue_conversion)
+        if statement is None:
+            return None
+        _, sql, params = statement
+        async with self.connection() as conn:
+            return await conn.fetchval(numbered(sql), *params)
+
+    async def append_webhook(self, transaction_id, payload):
+        """Grava o corpo bruto de um webhook no inbox. Retorna o id da entrada."""
+        async with self.connection() as conn:
+            return await conn.fetchval(numbered(APPEND_WEBHOOK_SQL), transaction_id, payload)
+
+    async def get_valid_pix(self, telegram_id, plano_id):
+        """PIX ativo (pending/waiting_payment, últimos 15 minutos) no formato de /api/pix/verificar"""
+        try:
+            async with self.connection() as conn:
+                if self.capabilities.has_plano_id:
+                    logger.info(f"🔍 Buscando PIX para user {telegram_id}, plano {plano_id} (com coluna plano_id)")
+                    result = await conn.fetchrow(numbered(GET_ACTIVE_PIX_SQL), telegram_id, plano_id)
+                else:
+                    logger.warning("⚠️ Coluna plano_id não existe - usando fallback SEM filtro de plano")
+                    result = await conn.fetchrow(numbered(GET_ACTIVE_PIX_ANY_PLAN_SQL), telegram_id)
+        except DatabaseUnavailable:
+            raise
+        except Exception as e:
+            logger.error(f"❌ Erro em get_active_pix: {e}")
+            return None
+
+        if not result:
+            logger.info(f"❌ Nenhum PIX ativo encontrado para user {telegram_id}, plano {plano_id}")
+            return None
+        logger.info(f"✅ PIX ativo encontrado: {result['transaction_id']} - Status: {result['status']}")
+        return valid_pix_payload(dict(result))
+
+    def stats(self):
+        pool = self._pool
+        if pool is None:
+            return None
+        return {
+            'size': pool.get_size(),
+            'idle': pool.get_idle_size(),
+            'min_size': pool.get_min_size(),
+            'max_size': pool.get_max_size(),
+            'prepared_statements': self.prepared
+        }
+
+
+def create_store(capabilities, breaker):
+    """AsyncPaymentStore configurado pelas mesmas variáveis do pool síncrono do pagamento"""
+    return AsyncPaymentStore(
+        os.getenv('DATABASE_URL'),
+        capabilities,
+        breaker,
+        min_size=int(os.getenv('DB_POOL_MIN', '1')),
+        max_size=int(os.getenv('DB_ASYNC_POOL_MAX', '20')),
+        checkout_timeout=float(os.getenv('DB_POOL_CHECKOUT_TIMEOUT', '10')),
+        statement_timeout_ms=int(os.getenv('DB_PAYMENT_STATEMENT_TIMEOUT_MS', '3000')),
+        connect_timeout=int(os.getenv('DB_CONNECT_TIMEOUT', '5')),
+        sslmode=os.getenv('DATABASE_SSLMODE', 'require'),
+        prepared=os.getenv('DB_PREPARED_STATEMENTS', '1') != '0'
+    )
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+Modo assíncrono do API Gateway (GATEWAY_MODE=async)
+
+No modo Flask cada checkout segura uma thread durante o POST para a TriboPay
+(até 20s), então PSP lento limita os checkouts simultâneos ao número de
+workers. Aqui o caminho do pagamento roda num event loop aiohttp: chamada à
+TriboPay com aiohttp.ClientSession e banco com asyncpg (async_database.py) -
+um processo sustenta centenas de checkouts em andamento. As conversões da
+Xtracky saem pelo outbox (outbox.py) e, com WEBHOOK_MODE=inbox, o webhook só
+grava no inbox (inbox.py), como no modo Flask.
+
+Rotas nativas (mesmos caminhos e JSON do main.py, mesmas regras via tribopay.py):
+    POST /api/pix/gerar
+    GET  /api/pix/verificar/<user_id>/<plano_id>
+    POST /webhook/tribopay
+    GET  /health
+As três primeiras passam pelo bulkhead do pagamento do modo async
+(BULKHEAD_ASYNC_PAYMENT_*): excedente recebe 503 com Retry-After, como no Flask.
+Todas as outras rotas continuam sendo as views Flask, servidas pela ponte WSGI
+(wsgi_bridge.py) num pool de threads.
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+from functools import wraps
+
+import aiohttp
+from aiohttp import web
+
+import tribopay
+import upstream
+import inbox
+import bulkhead
+from bulkhead import BulkheadFull
+from circuit_breaker import DatabaseUnavailable
+from date_filters import business_today, business_day
+from response_cache import dashboard_cache
+from async_database import create_store
+from wsgi_bridge import WSGIBridge
+
+logger = logging.getLogger(__name__)
+
+STORE = web.AppKey('store', object)
+HTTP = web.AppKey('http', aiohttp.ClientSession)
+DUMPS = web.AppKey('dumps', object)
+WARMUP = web.AppKey('warmup', asyncio.Task)
+CONVERSIONS = web.AppKey('conversions', object)
+INBOX = web.AppKey('inbox', object)
+PAYMENT = web.AppKey('payment', bulkhead.AsyncBulkhead)
+
+DB_UNAVAILABLE = {'success': False, 'error': 'Serviço indisponível (sem conexão com o banco de dados)'}
+
+
+def _json(request, data, status=200):
+    # Mesmo serializador do Flask (datas, Decimal...) para manter o contrato das respostas
+    return web.json_response(data, status=status, dumps=request.app[DUMPS])
+
+
+async def _post(app, name, url, **kwargs):
+    """POST na sessão keep-alive do worker: (status, corpo). Latência vai para o histograma do upstream."""
+    api = upstream.get(name)
+    # `total` limita o request inteiro (TRIBOPAY_TIMEOUT, por padrão): sem ele um
+    # upstream que pinga bytes devagar nunca estoura o sock_read
+    timeout = aiohttp.ClientTimeout(total=api.read_timeout, sock_connect=api.connect_timeout,
+                                    sock_read=api.read_timeout)
+    started = time.perf_counter()
+    try:
+        async with app[HTTP].post(url, timeout=timeout, **kwargs) as response:
+            body = await response.text()
+    except asyncio.TimeoutError:
+        api.histogram.observe(time.perf_counter() - started, 'timeout')
+        raise
+    except aiohttp.ClientError:
+        api.histogram.observe(time.perf_counter() - started, 'error')
+        raise
+    api.histogram.observe(time.perf_counter() - started, upstream.outcome_of(response.status))
+    return response.status, body
+
+
+async def _warm(app):
+    """Abre as conexões com a TriboPay antes do primeiro checkout do worker"""
+    async def open_one(api):
+        try:
+            async with app[HTTP].head(api.base_url, timeout=aiohttp.ClientTimeout(total=api.connect_timeout)):
+                pass
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning(f"⚠️ Pré-aquecimento de {api.name} falhou: {e}")
+
+    api = upstream.get('tribopay')
+    await asyncio.gather(*(open_one(api) for _ in range(api.warm_connections)))
+
+
+def payment_route(handler):
+    """Handler nativo do pagamento: roda ocupando uma vaga do bulkhead `payment` do modo async"""
+    @wraps(handler)
+    async def wrapper(request):
+        async with request.app[PAYMENT]:
+            return await handler(request)
+    return wrapper
+
+
+#======== MIDDLEWARE (CIRCUITO DO BANCO, BULKHEAD E CORS) =============
+@web.middleware
+async def gateway_middleware(request, handler):
+    try:
+        response = await handler(request)
+    except DatabaseUnavailable as e:
+        logger.warning(f"⚠️ {e} - request recusado ({request.path})")
+        response = _json(request, {'success': False, 'error': str(e)}, status=503)
+        response.headers['Retry-After'] = str(e.retry_after)
+    except BulkheadFull as e:
+        logger.warning(f"⚠️ {e} - request descartado ({request.path})")
+        response = _json(request, {'success': False, 'error': str(e)}, status=503)
+        response.headers['Retry-After'] = str(e.retry_after)
+    # Rotas da ponte WSGI já vêm com os cabeçalhos do Flask-CORS
+    if ('Origin' in request.headers and not response.prepared
+            and 'Access-Control-Allow-Origin' not in response.headers):
+        response.headers['Access-Control-Allow-Origin'] = '*'
+    return response
+#================= FECHAMENTO ======================
+
+#======== ROTAS NATIVAS =============
+async def health(request):
+    """Endpoint de verificação de saúde do serviço."""
+    db_status = 'conectado' if request.app[STORE] else 'indisponível'
+    return _json(request, {
+        'status': 'ok',
+        'service': 'API Gateway',
+        'database': f'PostgreSQL ({db_status})'
+    })
+
+
+async def async_stats(request):
+    """Pool asyncpg, bulkhead do pagamento e conexões HTTP de saída do modo assíncrono."""
+    store = request.app[STORE]
+    connector = request.app[HTTP].connector
+    return _json(request, {
+        'success': True,
+        'db_pool': store.stats() if store else None,
+        'payment_bulkhead': request.app[PAYMENT].stats(),
+        'http': {'limit': connector.limit, 'limit_per_host': connector.limit_per_host}
+    })
+
+
+@payment_route
+async def gerar_pix(request):
+    """Gera uma transação PIX na TriboPay (mesmo contrato de main.gerar_pix)."""
+    store = request.app[STORE]
+    try:
+        # 1. Validação da entrada de dados
+        try:
+            data = await request.json()
+        except ValueError:
+            data = None
+        if not data:
+            return _json(request, {'success': False, 'error': 'Corpo da requisição não é um JSON válido'}, 400)
+
+        user_id = data.get('user_id')
+        valor = data.get('valor')
+        plano_id = data.get('plano_id', 'default')
+
+        if not all([user_id, valor, plano_id]):
+            return _json(request, {'success': False, 'error': 'Campos obrigatórios ausentes: user_id, valor, plano_id'}, 400)
+
+        customer_data, error = tribopay.build_customer_data(user_id, data.get('customer'))
+        if error:
+            return _json(request, {'success': False, 'error': error}, 400)
+
+        if not store:
+            return _json(request, DB_UNAVAILABLE, 503)
+
+        # 2. Tracking do usuário
+        tracking_data = tribopay.log_tracking(user_id, await store.get_user(int(user_id)))
+
+        # 3. Payload da TriboPay
+        tribopay_payload = tribopay.build_payload(valor, plano_id, customer_data, tracking_data)
+        logger.info(f"🚀 Enviando payload para TriboPay para o cliente {customer_data['email']}.")
+        logger.debug(f"Payload: {json.dumps(tribopay_payload, indent=2)}")
+
+        # 4. Requisição à TriboPay sem bloquear o event loop
+        status_code, body = await _post(request.app, 'tribopay', tribopay.transactions_url(),
+                                        json=tribopay_payload, headers=tribopay.REQUEST_HEADERS)
+        if status_code >= 400:
+            return _json(request, tribopay.gateway_error_body(status_code, body), status_code)
+
+        # 5. Processamento da resposta de sucesso
+        transaction_id, pix_code, qr_code = tribopay.parse_pix_response(json.loads(body))
+
+        # 6. Salva a transação no banco de dados local
+        await store.record_generated_pix(
+            transaction_id=transaction_id, telegram_id=int(user_id), amount=float(valor),
+            tracking_data=tracking_data, plano_id=plano_id, pix_code=pix_code, qr_code=qr_code
+        )
+        logger.info(f"💾 Transação {transaction_id} salva no banco de dados.")
+        dashboard_cache.invalidate_day(business_today())
+
+        return _json(request, {
+            'success': True,
+            'transaction_id': transaction_id,
+            'pix_copia_cola': pix_code,
+            'qr_code': qr_code
+        })
+
+    except DatabaseUnavailable:
+        raise
+    except Exception as e:
+        logger.error(f"❌ Erro inesperado em /api/pix/gerar: {e}", exc_info=True)
+        return _json(request, {'success': False, 'error': 'Ocorreu um erro interno no servidor.'}, 500)
+
+
+@payment_route
+async def verificar_pix_existente(request):
+    """Verifica se existe PIX válido para o usuário e plano."""
+    user_id = int(request.match_info['user_id'])
+    plano_id = request.match_info['plano_id']
+    store = request.app[STORE]
+    try:
+        logger.info(f"🔍 ENDPOINT VERIFICAR PIX: user_id={user_id}, plano_id={plano_id}")
+        if not store:
+            logger.error("❌ Database não disponível")
+            return _json(request, DB_UNAVAILABLE, 503)
+
+        pix_data = await store.get_valid_pix(user_id, plano_id)
+        logger.info(f"📦 Resultado get_valid_pix: {pix_data}")
+        return _json(request, tribopay.pix_verification(user_id, plano_id, pix_data))
+
+    except DatabaseUnavailable:
+        raise
+    except Exception as e:
+        logger.error(f"❌ Erro ao verificar PIX do usuário {user_id}: {e}", exc_info=True)
+        return _json(request, {'success': False, 'error': 'Erro interno do servidor'}, 500)
+
+
+@payment_route
+async def tribopay_webhook(request):
+    """Webhook para receber e processar notificações da TriboPay."""
+    store = request.app[STORE]
+    try:
+        if store and request.app[INBOX]:
+            # Modo inbox (WEBHOOK_MODE=inbox): só o INSERT do corpo bruto antes da resposta
+            payload = await request.text()
+            if not payload.strip():
+                return _json(request, {'status': 'ignorado', 'reason': 'payload vazio'}, 400)
+            entry_id = await store.append_webhook(inbox.ordering_key(payload), payload)
+            request.app[INBOX].wake()
+            logger.info(f"📥 Webhook da TriboPay gravado no inbox (#{entry_id}).")
+            return _json(request, {'status': 'recebido', 'inbox_id': entry_id})
+
+        try:
+            webhook_data = await request.json()
+        except ValueError:
+            webhook_data = None
+        if not webhook_data:
+            return _json(request, {'status': 'ignorado', 'reason': 'payload vazio'}, 400)
+
+        logger.info(f"📥 Webhook da TriboPay recebido.")
+        logger.debug(f"Webhook Payload: {json.dumps(webhook_data)}")
+
+        transaction_id = tribopay.extract_transaction_id(webhook_data)
+        if not transaction_id:
+            logger.warning("⚠️ Webhook recebido sem 'transaction.id' ou 'transaction.hash'. Ignorando.")
+            return _json(request, {'status': 'ignorado', 'reason': 'missing transaction.id'})
+
+        status = webhook_data.get('status')
+        logger.info(f"🔍 Processando webhook para transação {transaction_id} com status '{status}'.")
+
+        if store:
+            # Pagamento aprovado: conversão da Xtracky entra no outbox na mesma transação
+            paid = status in tribopay.PAID_STATUSES
+            created_at = await store.update_pix_transaction(transaction_id, status=status, enqueue_conversion=paid)
+            logger.info(f"💾 Status da transação {transaction_id} atualizado para '{status}' no banco de dados.")
+            if created_at:
+                # Só períodos que contêm o dia da transação (ou hoje, dia da conversão) expiram
+                dashboard_cache.invalidate_day(business_day(created_at), business_today())
+                if paid and request.app[CONVERSIONS]:
+                    request.app[CONVERSIONS].wake()
+        else:
+            logger.error("❌ Banco de dados indisponível. Não foi possível processar o webhook.")
+
+        return _json(request, {'status': 'recebido'})
+
+    except DatabaseUnavailable:
+        raise
+    except Exception as e:
+        logger.error(f"❌ Erro crítico no processamento do webhook: {e}", exc_info=True)
+        return _json(request, {'error': 'Internal server error'}, 500)
+#================= FECHAMENTO ======================
+
+#======== APLICAÇÃO =============
+def create_app(flask_app, db, conversions=None, webhook_inbox=None):
+    """Aplicação aiohttp: rotas do pagamento nativas, o resto pelo app Flask.
+
+    `conversions` é o dispatcher do outbox do processo (acordado a cada pagamento);
+    com `webhook_inbox` (WEBHOOK_MODE=inbox) o webhook só grava no inbox.
+    """
+    app = web.Application(middlewares=[gateway_middleware])
+    app[DUMPS] = flask_app.json.dumps
+    app[CONVERSIONS] = conversions
+    app[INBOX] = webhook_inbox
+    app[PAYMENT] = bulkhead.async_payment()
+    bridge = WSGIBridge(flask_app, threads=int(os.getenv('GATEWAY_WSGI_THREADS', '32')))
+
+    async def startup(app):
+        app[HTTP] = aiohttp.ClientSession(connector=aiohttp.TCPConnector(
+            limit=int(os.getenv('GATEWAY_HTTP_LIMIT', '200')),
+            ttl_dns_cache=300
+        ))
+        app[WARMUP] = asyncio.create_task(_warm(app))
+        app[STORE] = None
+        if db is None:
+            logger.error("❌ Banco indisponível - rotas de pagamento responderão 503")
+            return
+        # Mesmo circuito e mesmas capacidades de schema do DatabaseManager
+        store = create_store(db.capabilities, db.breaker)
+        try:
+            await store.open()
+            app[STORE] = store
+        except Exception as e:
+            logger.error(f"❌ Falha ao abrir o pool assíncrono do PostgreSQL: {e}")
+
+    async def cleanup(app):
+        app[WARMUP].cancel()
+        await app[HTTP].close()
+        if app[STORE]:
+            await app[STORE].close()
+        bridge.close()
+
+    app.on_startup.append(startup)
+    app.on_cleanup.append(cleanup)
+
+    app.router.add_get('/health', health)
+    app.router.add_get('/api/async/stats', async_stats)
+    app.router.add_post('/api/pix/gerar', gerar_pix)
+    app.router.add_get(r'/api/pix/verificar/{user_id:\d+}/{plano_id}', verificar_pix_existente)
+    app.router.add_post('/webhook/tribopay', tribopay_webhook)
+    # Demais rotas (e métodos, ex.: preflight OPTIONS do CORS) vão para o Flask
+    app.router.add_route('*', '/{tail:.*}', bridge)
+    return app
+
+
+def run(flask_app, db, port, conversions=None, webhook_inbox=None):
+    logger.info("⚡ Modo assíncrono (aiohttp): TriboPay e banco sem bloquear workers")
+    web.run_app(create_app(flask_app, db, conversions, webhook_inbox), host='0.0.0.0', port=port, access_log=None)
+#================= FECHAMENTO ======================
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Benchmark das queries quentes do gateway com e sem prepared statements
+
+Roda cada método do DatabaseManager coberto pelo StatementRegistry N vezes
+com o registro desligado (SQL completo: parse + plan a cada chamada) e ligado
+(PREPARE uma vez por conexão, depois só EXECUTE) e imprime a latência média,
+p50 e p95 de cada modo.
+
+Uso (mesmo banco descartável de tests/test_explain_plans.py):
+    EXPLAIN_CHECK_DATABASE_URL=postgresql://postgres@localhost/trackamento_check \\
+        python3 bench_prepared.py [--iterations 2000] [--users 50000]
+
+NUNCA aponte para o banco de produção: o script aplica migrações e insere dados.
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+
+import psycopg2
+
+import migrate
+from explain_check import seed
+
+logger = logging.getLogger(__name__)
+
+
+def build_cases(db):
+    """(nome, função) - mesmos dados semeados por explain_check.seed"""
+    uid = 1000000 + 42
+    return [
+        ('get_user', lambda: db.get_user(uid)),
+        ('get_active_pix', lambda: db.get_active_pix(uid, 'plano_1mes')),
+        ('get_pix_transaction', lambda: db.get_pix_transaction('tx42')),
+        ('update_pix_transaction', lambda: db.update_pix_transaction('tx42', status='waiting_payment')),
+        ('save_user_step', lambda: db.save_user_step(uid, 'bench', 9, 'benchmark')),
+        ('save_tracking_mapping', lambda: db.save_tracking_mapping('safe42', '{"bench": true}')),
+    ]
+
+
+def measure(run, iterations, warmup=50):
+    """Latências em ms de `iterations` chamadas (após aquecer pool/cache)"""
+    for _ in range(warmup):
+        run()
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        run()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        'mean': sum(samples) / len(samples),
+        'p50': samples[len(samples) // 2],
+        'p95': samples[int(len(samples) * 0.95)]
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de prepared statements do API Gateway")
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--users', type=int, default=int(os.getenv('EXPLAIN_CHECK_USERS', '50000')))
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    check_url = os.getenv('EXPLAIN_CHECK_DATABASE_URL')
+    if not check_url:
+        logger.error("❌ EXPLAIN_CHECK_DATABASE_URL não configurado!")
+        return 2
+    if check_url == os.getenv('DATABASE_URL'):
+        logger.error("❌ EXPLAIN_CHECK_DATABASE_URL não pode ser o DATABASE_URL do serviço")
+        return 2
+
+    sslmode = os.getenv('DATABASE_SSLMODE', 'prefer')
+    os.environ['DATABASE_URL'] = check_url
+    os.environ['DATABASE_SSLMODE'] = sslmode
+    # Uma conexão só: todas as chamadas reaproveitam os statements preparados nela
+    os.environ['DB_POOL_MIN'] = '1'
+    os.environ['DB_POOL_MAX'] = '1'
+
+    admin = psycopg2.connect(check_url, sslmode=sslmode)
+    migrate.apply_pending(admin)
+    seed(admin, args.users)
+    admin.close()
+
+    import database
+    db = database.DatabaseManager()
+
+    print(f"{'query':<26}{'sem PREPARE (ms)':>24}{'com PREPARE (ms)':>24}{'ganho':>9}")
+    print(f"{'':<26}{'média / p50 / p95':>24}{'média / p50 / p95':>24}")
+    for name, run in build_cases(db):
+        db.statements.enabled = False
+        plain = measure(run, args.iterations)
+        db.statements.enabled = True
+        prepared = measure(run, args.iterations)
+        gain = (1 - prepared['mean'] / plain['mean']) * 100 if plain['mean'] else 0.0
+        print(f"{name:<26}"
+              f"{plain['mean']:>10.3f} / {plain['p50']:.3f} / {plain['p95']:.3f}"
+              f"{prepared['mean']:>10.3f} / {prepared['p50']:.3f} / {prepared['p95']:.3f}"
+              f"{gain:>8.1f}%")
+
+    print(f"\n{db.statements.stats()}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
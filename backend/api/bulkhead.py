@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Bulkheads do API Gateway: orçamentos de concorrência separados por classe de rota
+
+O caminho do pagamento (`payment`: gerar/verificar PIX, webhook TriboPay) e as
+rotas pesadas da dashboard (`dashboard`) têm cada um seu limite de requests
+simultâneos, sua fila e, no DatabaseManager, seu próprio pool de conexões.
+Uma consulta lenta da dashboard ocupa no máximo as vagas da classe dela e o
+excedente recebe 503 com Retry-After na hora, sem tomar threads nem conexões
+do pagamento.
+
+No gunicorn gthread um request parado na fila de um bulkhead já segura uma
+thread do worker: GUNICORN_THREADS precisa cobrir vagas + fila de todas as
+classes (thread_budget), senão a fila de uma classe come as threads da outra
+e o limite do pagamento nunca chega a valer.
+"""
+
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from functools import wraps
+
+logger = logging.getLogger(__name__)
+
+
+class BulkheadFull(Exception):
+    """Classe de rota sem vaga dentro do tempo de fila (ou com a fila cheia)"""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"Capacidade da classe '{name}' esgotada")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class Bulkhead:
+    """Semáforo com fila limitada e métricas de tempo de fila"""
+
+    def __init__(self, name, max_concurrent, max_queue, queue_timeout, retry_after=None, samples=1000):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after if retry_after is not None else max(1, int(queue_timeout))
+
+        self._lock = threading.Lock()
+        self._slot_free = threading.Condition(self._lock)
+        self._in_flight = 0
+        self._queued = 0
+        self._waits = deque(maxlen=samples)  # tempos de fila recentes (s)
+        self._stats = {'admitted': 0, 'rejected_queue_full': 0, 'rejected_timeout': 0,
+                       'wait_time_total': 0.0, 'wait_time_max': 0.0}
+
+    def acquire(self):
+        """Ocupa uma vaga (esperando na fila) ou levanta BulkheadFull"""
+        started = time.monotonic()
+        with self._lock:
+            if self._in_flight >= self.max_concurrent:
+                if self._queued >= self.max_queue:
+                    self._stats['rejected_queue_full'] += 1
+                    raise BulkheadFull(self.name, self.retry_after)
+                self._queued += 1
+                try:
+                    deadline = started + self.queue_timeout
+                    while self._in_flight >= self.max_concurrent:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._stats['rejected_timeout'] += 1
+                            raise BulkheadFull(self.name, self.retry_after)
+                        self._slot_free.wait(remaining)
+                finally:
+                    self._queued -= 1
+
+            self._in_flight += 1
+            waited = time.monotonic() - started
+            self._waits.append(waited)
+            self._stats['admitted'] += 1
+            self._stats['wait_time_total'] += waited
+            self._stats['wait_time_max'] = max(self._stats['wait_time_max'], waited)
+
+    def release(self):
+        with self._lock:
+            self._in_flight -= 1
+            self._slot_free.notify()
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+            waits = sorted(self._waits)
+            data.update({
+                'max_concurrent': self.max_concurrent,
+                'max_queue': self.max_queue,
+                'queue_timeout': self.queue_timeout,
+                'in_flight': self._in_flight,
+                'queued': self._queued
+            })
+        admitted = data['admitted']
+        data['avg_wait_ms'] = round(data.pop('wait_time_total') / admitted * 1000, 2) if admitted else 0.0
+        data['max_wait_ms'] = round(data.pop('wait_time_max') * 1000, 2)
+        data['p50_wait_ms'] = round(waits[len(waits) // 2] * 1000, 2) if waits else 0.0
+        data['p95_wait_ms'] = round(waits[int(len(waits) * 0.95)] * 1000, 2) if waits else 0.0
+        return data
+
+
+class AsyncBulkhead:
+    """Bulkhead para handlers asyncio (rotas nativas do GATEWAY_MODE=async).
+
+    Mesma regra do Bulkhead - vagas, fila limitada, espera máxima, BulkheadFull -
+    com asyncio.Semaphore: quem espera na fila é uma corrotina, não uma thread.
+    """
+
+    def __init__(self, name, max_concurrent, max_queue, queue_timeout, retry_after=None):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after if retry_after is not None else max(1, int(queue_timeout))
+
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._in_flight = 0
+        self._queued = 0
+        self._stats = {'admitted': 0, 'rejected_queue_full': 0, 'rejected_timeout': 0}
+
+    async def acquire(self):
+        """Ocupa uma vaga (esperando na fila) ou levanta BulkheadFull"""
+        if self._semaphore.locked():
+            if self._queued >= self.max_queue:
+                self._stats['rejected_queue_full'] += 1
+                raise BulkheadFull(self.name, self.retry_after)
+            self._queued += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self._stats['rejected_timeout'] += 1
+                raise BulkheadFull(self.name, self.retry_after) from None
+            finally:
+                self._queued -= 1
+        else:
+            await self._semaphore.acquire()
+        self._in_flight += 1
+        self._stats['admitted'] += 1
+
+    def release(self):
+        self._in_flight -= 1
+        self._semaphore.release()
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
+
+    def stats(self):
+        data = dict(self._stats)
+        data.update({
+            'max_concurrent': self.max_concurrent,
+            'max_queue': self.max_queue,
+            'queue_timeout': self.queue_timeout,
+            'in_flight': self._in_flight,
+            'queued': self._queued
+        })
+        return data
+
+
+def _from_env(name, concurrency, queue, timeout, cls=Bulkhead):
+    prefix = f"BULKHEAD_{name.upper()}_"
+    return cls(
+        name,
+        max_concurrent=int(os.getenv(prefix + 'CONCURRENCY', str(concurrency))),
+        max_queue=int(os.getenv(prefix + 'QUEUE', str(queue))),
+        queue_timeout=float(os.getenv(prefix + 'QUEUE_TIMEOUT', str(timeout)))
+    )
+
+
+# Pagamento: uma vaga por conexão do pool (DB_POOL_MAX) e fila para rajadas;
+# dashboard: vagas do pool próprio e sem fila - excedente é descartado na hora,
+# sem segurar thread esperando
+BULKHEADS = {
+    'payment': _from_env('payment', concurrency=10, queue=16, timeout=30),
+    'dashboard': _from_env('dashboard', concurrency=4, queue=0, timeout=5)
+}
+
+# Threads para as rotas fora dos bulkheads (health, métricas, stats)
+RESERVED_THREADS = int(os.getenv('BULKHEAD_RESERVED_THREADS', '4'))
+
+
+def bulkhead(name):
+    """Decorator de rota Flask: a view roda ocupando uma vaga da classe `name`.
+
+    Respostas em streaming (exportações) seguram a vaga até o fim do stream.
+    """
+    compartment = BULKHEADS[name]
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            compartment.acquire()
+            release_now = True
+            try:
+                response = view(*args, **kwargs)
+                if getattr(response, 'is_streamed', False):
+                    response.call_on_close(compartment.release)
+                    release_now = False
+                return response
+            finally:
+                if release_now:
+                    compartment.release()
+        return wrapper
+    return decorator
+
+
+def async_payment():
+    """Bulkhead das rotas nativas de pagamento do modo async (BULKHEAD_ASYNC_PAYMENT_*).
+
+    Sem threads para segurar, as vagas acompanham as conexões HTTP de saída
+    (GATEWAY_HTTP_LIMIT) e o pool asyncpg em vez do gthread.
+    """
+    return _from_env('async_payment', concurrency=100, queue=200, timeout=30, cls=AsyncBulkhead)
+
+
+def thread_budget(bulkheads=None):
+    """Threads por worker para nenhuma classe esperar por thread presa em outra:
+    vagas + fila de cada classe (quem espera na fila segura a thread) + reserva"""
+    bulkheads = BULKHEADS if bulkheads is None else bulkheads
+    return sum(b.max_concurrent + b.max_queue for b in bulkheads.values()) + RESERVED_THREADS
+
+
+def stats():
+    return {name: compartment.stats() for name, compartment in BULKHEADS.items()}
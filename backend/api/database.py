@@ -9,145 +9,373 @@ import psycopg2.extras
 import logging
 from datetime import datetime
 from contextlib import contextmanager
+from pool import ConnectionPool
+from replica import create_router
+from statements import StatementRegistry
+from circuit_breaker import CircuitBreaker, DatabaseUnavailable, is_database_failure, is_broken_connection
+from schema import SchemaCapabilities
+from migrate import discover_migrations, pending_migrations
+from access_tracker import AccessTracker
+import dashboard_queries
 
 logger = logging.getLogger(__name__)
 
+# Queries do caminho do PIX compartilhadas com o modo assíncrono (async_database.py)
+GET_USER_SQL = "SELECT * FROM bot_users WHERE telegram_id = %s"
+GET_PIX_TRANSACTION_SQL = "SELECT * FROM pix_transactions WHERE transaction_id = %s"
+GET_ACTIVE_PIX_SQL = """
+    SELECT * FROM pix_transactions 
+    WHERE telegram_id = %s 
+    AND plano_id = %s 
+    AND status IN ('pending', 'waiting_payment') 
+    AND created_at > NOW() - INTERVAL '15 minutes'
+    ORDER BY created_at DESC 
+    LIMIT 1
+"""
+# Caminho do webhook no modo inbox: um único INSERT antes de responder à TriboPay
+APPEND_WEBHOOK_SQL = "INSERT INTO webhook_inbox (transaction_id, payload) VALUES (%s, %s) RETURNING id"
+GET_ACTIVE_PIX_ANY_PLAN_SQL = """
+    SELECT * FROM pix_transactions 
+    WHERE telegram_id = %s 
+    AND status IN ('pending', 'waiting_payment') 
+    AND created_at > NOW() - INTERVAL '15 minutes'
+    ORDER BY created_at DESC 
+    LIMIT 1
+"""
+
+
+def user_with_tracking(user):
+    """Linha de bot_users no formato esperado pela API (com tracking_data)"""
+    tracking_data = {
+        'click_id': user.get('click_id'),
+        'utm_source': user.get('utm_source'),
+        'utm_medium': user.get('utm_medium'),
+        'utm_campaign': user.get('utm_campaign'),
+        'utm_term': user.get('utm_term'),
+        'utm_content': user.get('utm_content')
+    }
+    # Remove valores None do tracking_data
+    tracking_data = {k: v for k, v in tracking_data.items() if v is not None}
+    
+    return {
+        'id': user.get('id'),
+        'telegram_id': user.get('telegram_id'),
+        'username': user.get('username'),
+        'first_name': user.get('first_name'),
+        'last_name': user.get('last_name'),
+        'tracking_data': tracking_data,
+        'created_at': user.get('created_at'),
+        'updated_at': user.get('updated_at')
+    }
+
+
+def generated_pix_statement(has_plano_id, transaction_id, telegram_id, amount, tracking_data, plano_id=None, pix_code=None, qr_code=None):
+    """(sql, params) que cancela os PIX pendentes do usuário e insere o novo PIX"""
+    columns = ['transaction_id', 'telegram_id', 'amount']
+    values = [transaction_id, telegram_id, amount]
+    if has_plano_id:
+        columns.append('plano_id')
+        values.append(plano_id)
+    else:
+        logger.warning("⚠️ Coluna plano_id não existe - inserindo sem plano_id")
+    
+    columns += ['status', 'pix_code', 'qr_code',
+                'click_id', 'utm_source', 'utm_medium', 'utm_campaign', 'utm_term', 'utm_content']
+    values += ['waiting_payment', pix_code, qr_code,
+               tracking_data.get('click_id'),
+               tracking_data.get('utm_source'),
+               tracking_data.get('utm_medium'),
+               tracking_data.get('utm_campaign'),
+               tracking_data.get('utm_term'),
+               tracking_data.get('utm_content')]
+    
+    sql = f"""
+        WITH cancelled AS (
+            UPDATE pix_transactions 
+            SET status = 'cancelled', updated_at = CURRENT_TIMESTAMP 
+            WHERE telegram_id = %s AND status = 'pending'
+            RETURNING 1
+        )
+        INSERT INTO pix_transactions ({', '.join(columns)})
+        VALUES ({', '.join(['%s'] * len(values))})
+        RETURNING (SELECT COUNT(*) FROM cancelled)
+    """
+    return sql, [telegram_id] + values
+
+
+def pix_update_statement(transaction_id, status=None, pix_code=None, qr_code=None, enqueue_conversion=False):
+    """(nome, sql, params) do UPDATE de uma transação PIX, ou None sem campos a atualizar.
+
+    O nome identifica a combinação de campos (um prepared statement por combinação).
+    Com `enqueue_conversion` (pagamento confirmado) o mesmo statement - e portanto a
+    mesma transação - grava a conversão da Xtracky em conversion_outbox (outbox.py).
+    """
+    updates = []
+    params = []
+    
+    if status:
+        updates.append("status = %s")
+        params.append(status)
+    if pix_code:
+        updates.append("pix_code = %s")
+        params.append(pix_code)
+    if qr_code:
+        updates.append("qr_code = %s")
+        params.append(qr_code)
+    
+    if not updates:
+        return None
+    fields = '_'.join(update.split(' ', 1)[0] for update in updates)
+    updates.append("updated_at = CURRENT_TIMESTAMP")
+    params.append(transaction_id)
+    
+    sql = f"UPDATE pix_transactions SET {', '.join(updates)} WHERE transaction_id = %s RETURNING created_at"
+    if not enqueue_conversion:
+        return f"update_pix_transaction_{fields}", sql, params
+    
+    # Webhook repetido não duplica a conversão (transaction_id é UNIQUE no outbox)
+    sql = f"""
+        WITH updated AS (
+            UPDATE pix_transactions SET {', '.join(updates)}
+            WHERE transaction_id = %s
+            RETURNING transaction_id, created_at
+        ), queued AS (
+            INSERT INTO conversion_outbox (transaction_id)
+            SELECT transaction_id FROM updated
+            ON CONFLICT (transaction_id) DO NOTHING
+        )
+        SELECT created_at FROM updated
+    """
+    return f"update_pix_transaction_{fields}_outbox", sql, params
+
+
+def valid_pix_payload(result):
+    """Linha de pix_transactions no formato de /api/pix/verificar (created_at em ISO)"""
+    created_at = result.get('created_at')
+    if created_at:
+        # Se é string, converte para datetime e depois para ISO
+        if isinstance(created_at, str):
+            try:
+                from email.utils import parsedate_to_datetime
+                
+                # Se é formato GMT, converte
+                if 'GMT' in created_at or 'UTC' in created_at:
+                    created_at = parsedate_to_datetime(created_at)
+                else:
+                    # Tenta parsing direto
+                    created_at = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
+                    
+                # Converte para string ISO
+                created_at = created_at.isoformat()
+                logger.info(f"🔄 Data convertida para ISO: {created_at}")
+                
+            except Exception as e:
+                logger.warning(f"⚠️ Erro convertendo data {created_at}: {e}")
+                # Mantém original se falhar
+                pass
+        elif hasattr(created_at, 'isoformat'):
+            # Se é datetime object, converte para ISO string
+            created_at = created_at.isoformat()
+            logger.info(f"🔄 Datetime convertido para ISO: {created_at}")
+    
+    # Converte para formato esperado pela API
+    return {
+        'pix_copia_cola': result.get('pix_code'),
+        'qr_code': result.get('qr_code'),
+        'transaction_id': result.get('transaction_id'),
+        'created_at': created_at,
+        'status': result.get('status')
+    }
+
+
 class DatabaseManager:
-    def __init__(self):
+    def __init__(self, connection_factory=None):
         self.database_url = os.getenv('DATABASE_URL')
         if not self.database_url:
             logger.error("❌ DATABASE_URL não configurado!")
             raise ValueError("DATABASE_URL é obrigatório")
         
-        # Criar tabelas se não existirem
-        self.init_tables()
+        # statement_timeout por classe de consulta (gravado na sessão de cada
+        # conexão do pool): apertado no caminho do PIX, folgado nas analíticas
+        connect_timeout = int(os.getenv('DB_CONNECT_TIMEOUT', '5'))
+        payment_timeout_ms = int(os.getenv('DB_PAYMENT_STATEMENT_TIMEOUT_MS', '3000'))
+        dashboard_timeout_ms = int(os.getenv('DB_DASHBOARD_STATEMENT_TIMEOUT_MS', '15000'))
+        
+        # Pool de conexões (evita handshake TCP+TLS a cada query)
+        self.pool = ConnectionPool(
+            self.database_url,
+            min_size=int(os.getenv('DB_POOL_MIN', '1')),
+            max_size=int(os.getenv('DB_POOL_MAX', '10')),
+            idle_timeout=float(os.getenv('DB_POOL_IDLE_TIMEOUT', '300')),
+            checkout_timeout=float(os.getenv('DB_POOL_CHECKOUT_TIMEOUT', '10')),
+            sslmode=os.getenv('DATABASE_SSLMODE', 'require'),
+            connect_timeout=connect_timeout,
+            options=f"-c statement_timeout={payment_timeout_ms}",
+            connection_factory=connection_factory
+        )
+        
+        # Orçamento de conexões próprio das rotas da dashboard (bulkhead.py):
+        # consultas lentas esgotam este pool, nunca o do caminho do PIX
+        self.dashboard_pool = ConnectionPool(
+            self.database_url,
+            min_size=int(os.getenv('DB_DASHBOARD_POOL_MIN', '0')),
+            max_size=int(os.getenv('DB_DASHBOARD_POOL_MAX', '4')),
+            idle_timeout=float(os.getenv('DB_POOL_IDLE_TIMEOUT', '300')),
+            checkout_timeout=float(os.getenv('DB_POOL_CHECKOUT_TIMEOUT', '10')),
+            sslmode=os.getenv('DATABASE_SSLMODE', 'require'),
+            connect_timeout=connect_timeout,
+            options=f"-c statement_timeout={dashboard_timeout_ms}",
+            connection_factory=connection_factory
+        )
+        
+        # Falhas seguidas do banco abrem o circuito do pool: os requests passam
+        # a falhar na hora (503) em vez de esperar o timeout inteiro
+        self.breaker = CircuitBreaker(
+            'payment',
+            failure_threshold=int(os.getenv('DB_BREAKER_FAILURES', '5')),
+            reset_timeout=float(os.getenv('DB_BREAKER_RESET_TIMEOUT', '30'))
+        )
+        self.dashboard_breaker = CircuitBreaker(
+            'dashboard',
+            failure_threshold=int(os.getenv('DB_BREAKER_FAILURES', '5')),
+            reset_timeout=float(os.getenv('DB_BREAKER_RESET_TIMEOUT', '30'))
+        )
+        
+        # Leituras analíticas da dashboard vão para a réplica, se configurada
+        self.replica = create_router(
+            os.getenv('DATABASE_REPLICA_URL'),
+            sslmode=os.getenv('DATABASE_SSLMODE', 'require'),
+            connect_timeout=connect_timeout,
+            options=f"-c statement_timeout={dashboard_timeout_ms}",
+            connection_factory=connection_factory
+        )
+        
+        # Queries quentes do caminho do PIX/bot preparadas uma vez por conexão
+        self.statements = StatementRegistry(enabled=os.getenv('DB_PREPARED_STATEMENTS', '1') != '0')
+        
+        # Schema é versionado por migrations/ (python3 migrate.py apply);
+        # no boot apenas verificamos se está atualizado
+        self.capabilities = SchemaCapabilities()
+        self.check_schema()
+        
+        # accessed_at do tracking_mapping é gravado em lote (fora do caminho do /start)
+        self.tracking_access = AccessTracker(
+            self.flush_tracking_access,
+            interval=float(os.getenv('TRACKING_ACCESS_FLUSH_INTERVAL', '5'))
+        )
         logger.info("✅ Database PostgreSQL inicializado")
 
     @contextmanager
-    def get_connection(self):
-        """Context manager para conexões PostgreSQL"""
+    def get_connection(self, pool=None, breaker=None):
+        """Context manager para conexões PostgreSQL (emprestadas do pool; padrão: o do pagamento).
+
+        Levanta DatabaseUnavailable sem tocar no banco enquanto o circuito do pool estiver aberto.
+        """
+        pool = pool or self.pool
+        breaker = breaker or self.breaker
+        probe = breaker.before()
         conn = None
+        broken = False
+        settled = False
         try:
-            conn = psycopg2.connect(self.database_url, sslmode='require')
+            conn = pool.getconn()
             yield conn
             conn.commit()
         except Exception as e:
             if conn:
-                conn.rollback()
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    broken = True
+            if is_broken_connection(e):
+                broken = True
+            if is_database_failure(e):
+                breaker.record_failure(e)
+            else:
+                # O banco respondeu (erro da própria query ou da aplicação)
+                breaker.record_success()
+            settled = True
             logger.error(f"❌ Erro no database: {e}")
             raise
+        else:
+            breaker.record_success()
+            settled = True
         finally:
+            if probe and not settled:
+                # GeneratorExit (streaming interrompido), KeyboardInterrupt...: sem veredito
+                breaker.release_probe()
             if conn:
-                conn.close()
-
-    def init_tables(self):
-        """Criar tabelas necessárias"""
-        tables_sql = [
-            # Tabela de usuários do bot
-            """
-            CREATE TABLE IF NOT EXISTS bot_users (
-                id SERIAL PRIMARY KEY,
-                telegram_id BIGINT UNIQUE NOT NULL,
-                username VARCHAR(255),
-                first_name VARCHAR(255),
-                last_name VARCHAR(255),
-                click_id VARCHAR(255),
-                utm_source TEXT,
-                utm_medium VARCHAR(255),
-                utm_campaign VARCHAR(255),
-                utm_term VARCHAR(255),
-                utm_content VARCHAR(255),
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-            """,
-            
-            # Tabela de transações PIX
-            """
-            CREATE TABLE IF NOT EXISTS pix_transactions (
-                id SERIAL PRIMARY KEY,
-                transaction_id VARCHAR(255) UNIQUE NOT NULL,
-                telegram_id BIGINT NOT NULL,
-                amount DECIMAL(10,2) NOT NULL,
-                plano_id VARCHAR(100),
-                status VARCHAR(50) DEFAULT 'pending',
-                pix_code TEXT,
-                qr_code TEXT,
-                click_id VARCHAR(255),
-                utm_source TEXT,
-                utm_medium VARCHAR(255),
-                utm_campaign VARCHAR(255),
-                utm_term VARCHAR(255),
-                utm_content VARCHAR(255),
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (telegram_id) REFERENCES bot_users(telegram_id)
-            );
-            """,
-            
-            # Tabela de mapeamento de tracking IDs
-            """
-            CREATE TABLE IF NOT EXISTS tracking_mapping (
-                id SERIAL PRIMARY KEY,
-                safe_id VARCHAR(50) UNIQUE NOT NULL,
-                original_data TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                accessed_at TIMESTAMP
-            );
-            """,
-            
-            # Tabela de logs de conversões
-            """
-            CREATE TABLE IF NOT EXISTS conversion_logs (
-                id SERIAL PRIMARY KEY,
-                transaction_id VARCHAR(255),
-                click_id VARCHAR(255),
-                utm_source TEXT,
-                utm_campaign VARCHAR(255),
-                conversion_value DECIMAL(10,2),
-                status VARCHAR(50),
-                xtracky_response TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-            """,
-            
-            # Tabela de cache de produtos TriboPay
-            """
-            CREATE TABLE IF NOT EXISTS tribopay_products_cache (
-                id SERIAL PRIMARY KEY,
-                cache_key VARCHAR(100) UNIQUE NOT NULL,
-                product_hash VARCHAR(255) NOT NULL,
-                plano VARCHAR(50),
-                valor DECIMAL(10,2),
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-            """,
-            
-            # Tabela de etapas dos usuários para dashboard logs
-            """
-            CREATE TABLE IF NOT EXISTS user_steps (
-                id SERIAL PRIMARY KEY,
-                telegram_id BIGINT NOT NULL,
-                step_name VARCHAR(100) NOT NULL,
-                step_number INTEGER NOT NULL,
-                step_description TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (telegram_id) REFERENCES bot_users(telegram_id)
-            );
-            """,
-            
-            # Índice para performance na busca de última etapa
-            """
-            CREATE INDEX IF NOT EXISTS idx_user_steps_telegram_created 
-            ON user_steps(telegram_id, created_at DESC);
-            """
-        ]
+                # Transação aberta (saída sem commit/rollback) é descartada pelo pool
+                pool.putconn(conn, discard=broken)
+
+    def after_fork(self):
+        """Reabre tudo num worker do gunicorn (preload_app), depois de `close()` no master.
+
+        Pools, prepared statements e thread de acessos passam a ser do processo:
+        nenhuma conexão é compartilhada entre forks.
+        """
+        self.pool.after_fork()
+        self.dashboard_pool.after_fork()
+        if self.replica:
+            self.replica.after_fork()
+        self.statements = StatementRegistry(enabled=self.statements.enabled)
+        self.tracking_access.start()
+
+    def close(self):
+        """Grava acessos pendentes e fecha as conexões (master antes do fork, worker ao encerrar)"""
+        self.tracking_access.stop()
+        self.pool.closeall()
+        self.dashboard_pool.closeall()
+        if self.replica:
+            self.replica.close()
+
+    def dashboard_connection(self):
+        """Conexão do primário emprestada do pool da dashboard"""
+        return self.get_connection(self.dashboard_pool, self.dashboard_breaker)
+
+    def breaker_stats(self):
+        """Estado dos circuit breakers do banco"""
+        return {'payment': self.breaker.stats(), 'dashboard': self.dashboard_breaker.stats()}
+
+    def check_schema(self):
+        """Verifica migrações pendentes e resolve as capacidades do schema numa só conexão"""
+        with self.get_connection() as conn:
+            pending = pending_migrations(conn, discover_migrations())
+            self.capabilities.refresh(conn)
         
+        if pending:
+            names = ', '.join(f"{m.version:04d}_{m.name}" for m in pending)
+            logger.warning(f"⚠️ Schema desatualizado - migrações pendentes: {names}. Execute: python3 migrate.py apply")
+        else:
+            logger.info("✅ Schema PostgreSQL atualizado")
+        return pending
+
+    def refresh_capabilities(self):
+        """Relê as capacidades do schema (ex.: após uma migração)"""
         with self.get_connection() as conn:
-            cursor = conn.cursor()
-            for table_sql in tables_sql:
-                cursor.execute(table_sql)
-            logger.info("✅ Tabelas PostgreSQL criadas/verificadas")
+            return self.capabilities.refresh(conn)
+
+    @contextmanager
+    def read_connection(self):
+        """Conexão para leituras analíticas: réplica saudável ou, na falta dela, o primário"""
+        if self.replica is None:
+            with self.dashboard_connection() as conn:
+                yield conn
+            return
+        with self.replica.connection(self.dashboard_connection) as conn:
+            yield conn
+
+    def pool_stats(self):
+        """Estatísticas do pool de conexões"""
+        return self.pool.stats()
+
+    def dashboard_pool_stats(self):
+        """Estatísticas do pool de conexões da dashboard"""
+        return self.dashboard_pool.stats()
+
+    def replica_stats(self):
+        """Estado da réplica de leitura (None quando não configurada)"""
+        return self.replica.stats() if self.replica else None
 
     def save_user(self, telegram_id, username, first_name, last_name, tracking_data):
         """Salvar/atualizar usuário"""
@@ -181,6 +409,8 @@ class DatabaseManager:
                 ))
                 logger.info(f"✅ Usuário {telegram_id} salvo/atualizado com sucesso no PostgreSQL")
                 return True
+        except DatabaseUnavailable:
+            raise
         except Exception as e:
             logger.error(f"❌ Erro salvando usuário {telegram_id}: {e}")
             return False
@@ -190,33 +420,15 @@ class DatabaseManager:
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-                cursor.execute("SELECT * FROM bot_users WHERE telegram_id = %s", (telegram_id,))
+                self.statements.execute(cursor, 'get_user', GET_USER_SQL, (telegram_id,))
                 user = cursor.fetchone()
                 
                 if user:
                     # Converte para formato esperado pela API com tracking_data
-                    tracking_data = {
-                        'click_id': user.get('click_id'),
-                        'utm_source': user.get('utm_source'),
-                        'utm_medium': user.get('utm_medium'),
-                        'utm_campaign': user.get('utm_campaign'),
-                        'utm_term': user.get('utm_term'),
-                        'utm_content': user.get('utm_content')
-                    }
-                    # Remove valores None do tracking_data
-                    tracking_data = {k: v for k, v in tracking_data.items() if v is not None}
-                    
-                    return {
-                        'id': user.get('id'),
-                        'telegram_id': user.get('telegram_id'),
-                        'username': user.get('username'),
-                        'first_name': user.get('first_name'),
-                        'last_name': user.get('last_name'),
-                        'tracking_data': tracking_data,
-                        'created_at': user.get('created_at'),
-                        'updated_at': user.get('updated_at')
-                    }
+                    return user_with_tracking(user)
                 return None
+        except DatabaseUnavailable:
+            raise
         except Exception as e:
             logger.error(f"❌ Erro buscando usuário {telegram_id}: {e}")
             return None
@@ -225,7 +437,7 @@ class DatabaseManager:
         """Salvar mapeamento de tracking ID"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("""
+            self.statements.execute(cursor, 'save_tracking_mapping', """
                 INSERT INTO tracking_mapping (safe_id, original_data)
                 VALUES (%s, %s)
                 ON CONFLICT (safe_id) 
@@ -233,17 +445,27 @@ class DatabaseManager:
             """, (safe_id, original_data))
 
     def get_tracking_mapping(self, safe_id):
-        """Buscar dados por safe_id"""
+        """Buscar dados por safe_id (somente leitura; accessed_at é gravado em lote)"""
         with self.get_connection() as conn:
             cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-            cursor.execute("""
-                UPDATE tracking_mapping 
-                SET accessed_at = CURRENT_TIMESTAMP 
-                WHERE safe_id = %s
-            """, (safe_id,))
-            
             cursor.execute("SELECT * FROM tracking_mapping WHERE safe_id = %s", (safe_id,))
-            return cursor.fetchone()
+            mapping = cursor.fetchone()
+        
+        if mapping:
+            self.tracking_access.record(safe_id)
+        return mapping
+
+    def flush_tracking_access(self, accesses):
+        """Grava accessed_at em lote: accesses = [(safe_id, segundos_desde_o_acesso), ...]"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            psycopg2.extras.execute_values(cursor, """
+                UPDATE tracking_mapping t
+                SET accessed_at = CURRENT_TIMESTAMP - v.age * INTERVAL '1 second'
+                FROM (VALUES %s) AS v(safe_id, age)
+                WHERE t.safe_id = v.safe_id
+            """, accesses, template="(%s, %s::float8)", page_size=500)
+        logger.info(f"✅ accessed_at gravado para {len(accesses)} tracking(s)")
 
     def get_latest_tracking(self, minutes=10):
         """Buscar último tracking criado nos últimos X minutos"""
@@ -257,85 +479,43 @@ class DatabaseManager:
             """, (minutes,))
             return cursor.fetchone()
 
-    def save_pix_transaction(self, transaction_id, telegram_id, amount, tracking_data, plano_id=None):
-        """Salvar transação PIX"""
+    def record_generated_pix(self, transaction_id, telegram_id, amount, tracking_data, plano_id=None, pix_code=None, qr_code=None):
+        """Persiste um PIX recém-gerado num único statement/transação.
+
+        Cancela os PIX pendentes do usuário e insere a nova transação já com
+        status='waiting_payment', pix_code e qr_code - a linha nunca fica visível
+        sem os dados do PIX. Retorna quantos PIX pendentes foram cancelados.
+        """
+        sql, params = generated_pix_statement(
+            self.capabilities.has_plano_id, transaction_id, telegram_id, amount, tracking_data,
+            plano_id=plano_id, pix_code=pix_code, qr_code=qr_code
+        )
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            
-            # Verifica se a coluna plano_id existe
-            try:
-                cursor.execute("""
-                    SELECT column_name 
-                    FROM information_schema.columns 
-                    WHERE table_name='pix_transactions' AND column_name='plano_id'
-                """)
-                plano_id_exists = cursor.fetchone()
-                
-                if plano_id_exists:
-                    # Se a coluna existe, insere com plano_id
-                    cursor.execute("""
-                        INSERT INTO pix_transactions 
-                        (transaction_id, telegram_id, amount, plano_id, click_id, utm_source, utm_medium, utm_campaign, utm_term, utm_content)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    """, (
-                        transaction_id, telegram_id, amount, plano_id,
-                        tracking_data.get('click_id'),
-                        tracking_data.get('utm_source'),
-                        tracking_data.get('utm_medium'),
-                        tracking_data.get('utm_campaign'),
-                        tracking_data.get('utm_term'),
-                        tracking_data.get('utm_content')
-                    ))
-                else:
-                    # Fallback: insere sem plano_id
-                    logger.warning("⚠️ Coluna plano_id não existe - inserindo sem plano_id")
-                    cursor.execute("""
-                        INSERT INTO pix_transactions 
-                        (transaction_id, telegram_id, amount, click_id, utm_source, utm_medium, utm_campaign, utm_term, utm_content)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    """, (
-                        transaction_id, telegram_id, amount,
-                        tracking_data.get('click_id'),
-                        tracking_data.get('utm_source'),
-                        tracking_data.get('utm_medium'),
-                        tracking_data.get('utm_campaign'),
-                        tracking_data.get('utm_term'),
-                        tracking_data.get('utm_content')
-                    ))
-                    
-            except Exception as e:
-                logger.error(f"❌ Erro em save_pix_transaction: {e}")
-                raise
+            cursor.execute(sql, params)
+            return cursor.fetchone()[0]
+
+    def update_pix_transaction(self, transaction_id, status=None, pix_code=None, qr_code=None, enqueue_conversion=False):
+        """Atualizar transação PIX. Retorna o created_at da transação (None se não encontrada).
 
-    def update_pix_transaction(self, transaction_id, status=None, pix_code=None, qr_code=None):
-        """Atualizar transação PIX"""
+        Com `enqueue_conversion` a conversão da Xtracky entra no outbox na mesma transação.
+        """
+        statement = pix_update_statement(transaction_id, status=status, pix_code=pix_code, qr_code=qr_code,
+                                         enqueue_conversion=enqueue_conversion)
+        if statement is None:
+            return None
+        name, sql, params = statement
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            updates = []
-            params = []
-            
-            if status:
-                updates.append("status = %s")
-                params.append(status)
-            if pix_code:
-                updates.append("pix_code = %s")
-                params.append(pix_code)
-            if qr_code:
-                updates.append("qr_code = %s")
-                params.append(qr_code)
-            
-            if updates:
-                updates.append("updated_at = CURRENT_TIMESTAMP")
-                params.append(transaction_id)
-                
-                sql = f"UPDATE pix_transactions SET {', '.join(updates)} WHERE transaction_id = %s"
-                cursor.execute(sql, params)
+            self.statements.execute(cursor, name, sql, params)
+            row = cursor.fetchone()
+            return row[0] if row else None
 
     def get_pix_transaction(self, transaction_id):
         """Buscar transação PIX"""
         with self.get_connection() as conn:
             cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-            cursor.execute("SELECT * FROM pix_transactions WHERE transaction_id = %s", (transaction_id,))
+            self.statements.execute(cursor, 'get_pix_transaction', GET_PIX_TRANSACTION_SQL, (transaction_id,))
             return cursor.fetchone()
 
     def get_active_pix(self, telegram_id, plano_id):
@@ -343,38 +523,15 @@ class DatabaseManager:
         with self.get_connection() as conn:
             cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
             
-            # Primeiro verifica se a coluna plano_id existe
             try:
-                cursor.execute("""
-                    SELECT column_name 
-                    FROM information_schema.columns 
-                    WHERE table_name='pix_transactions' AND column_name='plano_id'
-                """)
-                plano_id_exists = cursor.fetchone()
-                
-                if plano_id_exists:
+                if self.capabilities.has_plano_id:
                     # CORREÇÃO: Busca PIX válidos (pending OU waiting_payment) para plano específico
-                    cursor.execute("""
-                        SELECT * FROM pix_transactions 
-                        WHERE telegram_id = %s 
-                        AND plano_id = %s 
-                        AND status IN ('pending', 'waiting_payment') 
-                        AND created_at > NOW() - INTERVAL '15 minutes'
-                        ORDER BY created_at DESC 
-                        LIMIT 1
-                    """, (telegram_id, plano_id))
+                    self.statements.execute(cursor, 'get_active_pix', GET_ACTIVE_PIX_SQL, (telegram_id, plano_id))
                     logger.info(f"🔍 Buscando PIX para user {telegram_id}, plano {plano_id} (com coluna plano_id)")
                 else:
                     # CORREÇÃO: Mesmo sem coluna plano_id, busca status corretos
                     logger.warning("⚠️ Coluna plano_id não existe - usando fallback SEM filtro de plano")
-                    cursor.execute("""
-                        SELECT * FROM pix_transactions 
-                        WHERE telegram_id = %s 
-                        AND status IN ('pending', 'waiting_payment') 
-                        AND created_at > NOW() - INTERVAL '15 minutes'
-                        ORDER BY created_at DESC 
-                        LIMIT 1
-                    """, (telegram_id,))
+                    self.statements.execute(cursor, 'get_active_pix_any_plan', GET_ACTIVE_PIX_ANY_PLAN_SQL, (telegram_id,))
                 
                 result = cursor.fetchone()
                 if result:
@@ -394,42 +551,7 @@ class DatabaseManager:
         result = self.get_active_pix(telegram_id, plano_id)
         if result:
             # Padroniza formato de data para ISO
-            created_at = result.get('created_at')
-            if created_at:
-                # Se é string, converte para datetime e depois para ISO
-                if isinstance(created_at, str):
-                    try:
-                        from datetime import datetime
-                        from email.utils import parsedate_to_datetime
-                        
-                        # Se é formato GMT, converte
-                        if 'GMT' in created_at or 'UTC' in created_at:
-                            created_at = parsedate_to_datetime(created_at)
-                        else:
-                            # Tenta parsing direto
-                            created_at = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
-                            
-                        # Converte para string ISO
-                        created_at = created_at.isoformat()
-                        logger.info(f"🔄 Data convertida para ISO: {created_at}")
-                        
-                    except Exception as e:
-                        logger.warning(f"⚠️ Erro convertendo data {created_at}: {e}")
-                        # Mantém original se falhar
-                        pass
-                elif hasattr(created_at, 'isoformat'):
-                    # Se é datetime object, converte para ISO string
-                    created_at = created_at.isoformat()
-                    logger.info(f"🔄 Datetime convertido para ISO: {created_at}")
-            
-            # Converte para formato esperado pela API
-            return {
-                'pix_copia_cola': result.get('pix_code'),
-                'qr_code': result.get('qr_code'),
-                'transaction_id': result.get('transaction_id'),
-                'created_at': created_at,
-                'status': result.get('status')
-            }
+            return valid_pix_payload(result)
         return None
     
     def invalidate_user_pix(self, telegram_id):
@@ -453,6 +575,147 @@ class DatabaseManager:
                 VALUES (%s, %s, %s, %s, %s, %s, %s)
             """, (transaction_id, click_id, utm_source, utm_campaign, conversion_value, status, xtracky_response))
     
+    def claim_conversions(self, limit, lease_seconds):
+        """Reserva até `limit` conversões vencidas do outbox, com os dados da transação.
+
+        FOR UPDATE SKIP LOCKED: dispatchers de outros workers pegam outras linhas.
+        A reserva conta a tentativa e adia next_attempt_at pelo lease - se o worker
+        morrer no meio do envio, a linha volta a vencer sozinha.
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+            cursor.execute("""
+                WITH due AS (
+                    SELECT id FROM conversion_outbox
+                    WHERE status = 'pending' AND next_attempt_at <= CURRENT_TIMESTAMP
+                    ORDER BY next_attempt_at
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                ), claimed AS (
+                    UPDATE conversion_outbox o
+                    SET attempts = o.attempts + 1,
+                        next_attempt_at = CURRENT_TIMESTAMP + %s::float8 * INTERVAL '1 second',
+                        updated_at = CURRENT_TIMESTAMP
+                    FROM due WHERE o.id = due.id
+                    RETURNING o.id, o.transaction_id, o.attempts
+                )
+                SELECT c.id, c.transaction_id, c.attempts,
+                       p.click_id, p.amount, p.utm_source, p.utm_campaign
+                FROM claimed c
+                LEFT JOIN pix_transactions p ON p.transaction_id = c.transaction_id
+                ORDER BY c.id
+            """, (limit, lease_seconds))
+            return cursor.fetchall()
+
+    def finish_conversions(self, outcomes):
+        """Grava o resultado de um lote do outbox numa transação.
+
+        outcomes = [{'id', 'status', 'retry_in', 'error', 'log'}, ...]: status
+        'pending' reagenda para daqui a `retry_in` segundos; `log` (tupla na ordem
+        de log_conversion) vai para conversion_logs.
+        """
+        logs = [outcome['log'] for outcome in outcomes if outcome.get('log')]
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            psycopg2.extras.execute_values(cursor, """
+                UPDATE conversion_outbox o
+                SET status = v.status,
+                    next_attempt_at = CASE WHEN v.status = 'pending'
+                        THEN CURRENT_TIMESTAMP + v.retry_in * INTERVAL '1 second'
+                        ELSE o.next_attempt_at END,
+                    last_error = v.error,
+                    updated_at = CURRENT_TIMESTAMP
+                FROM (VALUES %s) AS v(id, status, retry_in, error)
+                WHERE o.id = v.id
+            """, [(outcome['id'], outcome['status'], outcome.get('retry_in', 0), outcome.get('error'))
+                  for outcome in outcomes], template="(%s::bigint, %s, %s::float8, %s)")
+            if logs:
+                psycopg2.extras.execute_values(cursor, """
+                    INSERT INTO conversion_logs 
+                    (transaction_id, click_id, utm_source, utm_campaign, conversion_value, status, xtracky_response)
+                    VALUES %s
+                """, logs)
+
+    def append_webhook(self, transaction_id, payload):
+        """Grava o corpo bruto de um webhook no inbox. Retorna o id da entrada."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            self.statements.execute(cursor, 'append_webhook', APPEND_WEBHOOK_SQL, (transaction_id, payload))
+            return cursor.fetchone()[0]
+
+    def claim_webhooks(self, limit, lease_seconds):
+        """Reserva até `limit` entradas do inbox, no máximo uma por transação.
+
+        Só a entrada pendente mais antiga de cada transação é elegível: a seguinte
+        espera ela ser concluída (ou desistida), então as notificações de uma
+        transação são aplicadas na ordem de chegada. status/next_attempt_at são
+        rechecados no lock - uma entrada concluída por outro worker é pulada.
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+            cursor.execute("""
+                WITH heads AS (
+                    SELECT DISTINCT ON (COALESCE(transaction_id, id::text)) id
+                    FROM webhook_inbox
+                    WHERE status = 'pending'
+                    ORDER BY COALESCE(transaction_id, id::text), id
+                ), due AS (
+                    SELECT i.id FROM webhook_inbox i
+                    JOIN heads h ON h.id = i.id
+                    WHERE i.status = 'pending' AND i.next_attempt_at <= CURRENT_TIMESTAMP
+                    ORDER BY i.id
+                    LIMIT %s
+                    FOR UPDATE OF i SKIP LOCKED
+                )
+                UPDATE webhook_inbox i
+                SET attempts = i.attempts + 1,
+                    next_attempt_at = CURRENT_TIMESTAMP + %s::float8 * INTERVAL '1 second'
+                FROM due WHERE i.id = due.id
+                RETURNING i.id, i.transaction_id, i.payload, i.attempts
+            """, (limit, lease_seconds))
+            return sorted(cursor.fetchall(), key=lambda row: row['id'])
+
+    def finish_webhooks(self, outcomes):
+        """Grava o resultado de um lote do inbox: outcomes = [{'id', 'status', 'retry_in', 'error'}, ...]"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            psycopg2.extras.execute_values(cursor, """
+                UPDATE webhook_inbox i
+                SET status = v.status,
+                    next_attempt_at = CASE WHEN v.status = 'pending'
+                        THEN CURRENT_TIMESTAMP + v.retry_in * INTERVAL '1 second'
+                        ELSE i.next_attempt_at END,
+                    last_error = v.error,
+                    processed_at = CASE WHEN v.status = 'pending' THEN NULL ELSE CURRENT_TIMESTAMP END
+                FROM (VALUES %s) AS v(id, status, retry_in, error)
+                WHERE i.id = v.id
+            """, [(outcome['id'], outcome['status'], outcome.get('retry_in', 0), outcome.get('error'))
+                  for outcome in outcomes], template="(%s::bigint, %s, %s::float8, %s)")
+
+    def webhook_inbox_stats(self):
+        """Entradas pendentes no inbox (total, já vencidas e o atraso da mais antiga)"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+            cursor.execute("""
+                SELECT COUNT(*) AS pending,
+                       COUNT(*) FILTER (WHERE next_attempt_at <= CURRENT_TIMESTAMP) AS due,
+                       MIN(received_at) AS oldest_received_at
+                FROM webhook_inbox WHERE status = 'pending'
+            """)
+            return cursor.fetchone()
+
+    def conversion_outbox_stats(self):
+        """Conversões pendentes no outbox (total, já vencidas e a mais antiga)"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+            cursor.execute("""
+                SELECT COUNT(*) AS pending,
+                       COUNT(*) FILTER (WHERE next_attempt_at <= CURRENT_TIMESTAMP) AS due,
+                       MIN(created_at) AS oldest_created_at
+                FROM conversion_outbox WHERE status = 'pending'
+            """)
+            return cursor.fetchone()
+    
     def save_cached_product(self, cache_key, product_hash, plano, valor):
         """Salva produto no cache TriboPay"""
         with self.get_connection() as conn:
@@ -479,12 +742,14 @@ class DatabaseManager:
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute("""
+                self.statements.execute(cursor, 'save_user_step', """
                     INSERT INTO user_steps (telegram_id, step_name, step_number, step_description)
                     VALUES (%s, %s, %s, %s)
                 """, (telegram_id, step_name, step_number, step_description))
                 logger.info(f"✅ Etapa {step_name} salva para usuário {telegram_id}")
                 return True
+        except DatabaseUnavailable:
+            raise
         except Exception as e:
             logger.error(f"❌ Erro salvando etapa para usuário {telegram_id}: {e}")
             return False
@@ -502,99 +767,63 @@ class DatabaseManager:
                     LIMIT 1
                 """, (telegram_id,))
                 return cursor.fetchone()
+        except DatabaseUnavailable:
+            raise
         except Exception as e:
             logger.error(f"❌ Erro buscando última etapa do usuário {telegram_id}: {e}")
             return None
     
-    def get_users_with_steps_and_pix(self, start_date=None, end_date=None, limit=100):
-        """Busca usuários com suas etapas e status PIX para dashboard logs"""
+    def get_users_with_steps_and_pix(self, start_date=None, end_date=None, limit=100, after=None):
+        """Busca usuários com suas etapas e status PIX para dashboard logs (paginação por keyset)"""
         try:
-            date_filter = ""
-            date_params = []
-            
-            if start_date and end_date:
-                date_filter = "AND bu.created_at::date BETWEEN %s AND %s"
-                date_params = [start_date, end_date]
-            
-            with self.get_connection() as conn:
+            with self.read_connection() as conn:
                 cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-                query = f"""
-                    SELECT DISTINCT
-                        bu.telegram_id,
-                        bu.first_name,
-                        bu.last_name,
-                        bu.username,
-                        bu.created_at as user_created_at,
-                        bu.updated_at as last_activity,
-                        
-                        -- Última etapa do usuário
-                        last_step.step_name as last_step_name,
-                        last_step.step_number as last_step_number,
-                        last_step.step_description as last_step_description,
-                        last_step.created_at as last_step_at,
-                        
-                        -- Status do PIX (se gerou PIX e se pagou)
-                        CASE 
-                            WHEN pix_gerado.total_pix > 0 THEN 'PIX_GERADO'
-                            ELSE 'SEM_PIX'
-                        END as pix_status,
-                        
-                        CASE 
-                            WHEN pix_pago.total_paid > 0 THEN 'PAGO'
-                            WHEN pix_gerado.total_pix > 0 THEN 'PENDENTE'
-                            ELSE 'SEM_PIX'
-                        END as pix_payment_status,
-                        
-                        pix_gerado.total_pix,
-                        pix_pago.total_paid,
-                        pix_pago.total_amount_paid
-                        
-                    FROM bot_users bu
-                    
-                    -- Última etapa (LEFT JOIN para pegar usuários mesmo sem etapa)
-                    LEFT JOIN (
-                        SELECT DISTINCT ON (telegram_id) 
-                            telegram_id, step_name, step_number, step_description, created_at
-                        FROM user_steps
-                        ORDER BY telegram_id, created_at DESC
-                    ) last_step ON bu.telegram_id = last_step.telegram_id
-                    
-                    -- PIX gerados por usuário
-                    LEFT JOIN (
-                        SELECT telegram_id, COUNT(*) as total_pix
-                        FROM pix_transactions
-                        GROUP BY telegram_id
-                    ) pix_gerado ON bu.telegram_id = pix_gerado.telegram_id
-                    
-                    -- PIX pagos por usuário  
-                    LEFT JOIN (
-                        SELECT 
-                            telegram_id, 
-                            COUNT(*) as total_paid,
-                            SUM(amount) as total_amount_paid
-                        FROM pix_transactions
-                        WHERE status = 'paid'
-                        GROUP BY telegram_id
-                    ) pix_pago ON bu.telegram_id = pix_pago.telegram_id
-                    
-                    WHERE 1=1 {date_filter}
-                    ORDER BY COALESCE(bu.updated_at, bu.created_at) DESC
-                    LIMIT %s
-                """
-                
-                cursor.execute(query, date_params + [limit])
-                return cursor.fetchall()
+                return dashboard_queries.users_with_steps_and_pix(cursor, start_date, end_date, limit, after)
+        except DatabaseUnavailable:
+            raise
         except Exception as e:
             logger.error(f"❌ Erro buscando usuários com etapas: {e}")
             return []
 
+    def get_member_logs(self, start_date=None, end_date=None, limit=100, after=None, since=None):
+        """Página (ou delta, com `since`) de /api/logs: membros com última etapa e status PIX"""
+        with self.read_connection() as conn:
+            cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+            return dashboard_queries.member_logs(cursor, start_date, end_date, limit, after, since=since)
+
+    def get_overview(self, start_date=None, end_date=None):
+        """Payload da aba Visão Geral (um statement, uma conexão; da réplica, se houver)"""
+        with self.read_connection() as conn:
+            cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+            return dashboard_queries.overview(cursor, start_date, end_date)
+
+    def get_sales(self, start_date=None, end_date=None, since=None):
+        """Payload da aba Vendas (da réplica, se houver)"""
+        with self.read_connection() as conn:
+            cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+            return dashboard_queries.sales(cursor, start_date, end_date,
+                                           has_plano_id=self.capabilities.has_plano_id, since=since)
+
+    def get_dashboard(self, panels, start_date=None, end_date=None, logs_limit=100, since=None):
+        """Painéis de /api/dashboard num único snapshot (da réplica, se houver)"""
+        with self.read_connection() as conn:
+            return dashboard_queries.dashboard(
+                conn, panels, start_date, end_date,
+                has_plano_id=self.capabilities.has_plano_id,
+                logs=lambda cursor, since, watermark: dashboard_queries.member_logs(
+                    cursor, start_date, end_date, logs_limit, since=since, watermark=watermark),
+                since=since
+            )
+
     def execute_query(self, query, params=None):
-        """Executa query SQL e retorna resultados"""
+        """Executa query SQL de leitura (na réplica, se configurada) e retorna resultados"""
         try:
-            with self.get_connection() as conn:
+            with self.read_connection() as conn:
                 cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
                 cursor.execute(query, params or [])
                 return cursor.fetchall()
+        except DatabaseUnavailable:
+            raise
         except Exception as e:
             logger.error(f"❌ Erro executando query: {e}")
             return []
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Verificação de planos (EXPLAIN) das queries do API Gateway
+
+Dados e utilitários de tests/test_explain_plans.py: popula um PostgreSQL
+descartável com volumes realistas, captura o SQL real que cada query do
+DatabaseManager (e as rotas da dashboard) envia ao banco e procura Seq Scan
+nas tabelas populadas no EXPLAIN de cada statement.
+
+Uso (sem banco configurado o teste é pulado; EXPLAIN_CHECK_USERS=50000 por padrão):
+    EXPLAIN_CHECK_DATABASE_URL=postgresql://postgres@localhost/trackamento_check \\
+        python -m pytest tests/test_explain_plans.py
+
+NUNCA aponte para o banco de produção: o teste aplica migrações e insere dados.
+"""
+
+import json
+import logging
+from datetime import datetime, timedelta
+
+import psycopg2.extensions
+
+from pagination import encode_watermark
+
+logger = logging.getLogger(__name__)
+
+# Tabelas populadas pelo seed - Seq Scan nelas é regressão
+SEEDED_TABLES = {'bot_users', 'pix_transactions', 'tracking_mapping', 'user_steps', 'conversion_logs',
+                 'user_funnel_summary'}
+
+# Statements aceitos por EXPLAIN
+EXPLAINABLE = {'SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH'}
+
+# Statements capturados durante o caso em execução
+RECORDED = []
+
+_cursor_classes = {}
+
+
+def _recording_cursor(base):
+    """Subclasse do cursor que registra o SQL final (com parâmetros) antes de executar"""
+    if base not in _cursor_classes:
+        class RecordingCursor(base):
+            def execute(self, query, vars=None):
+                RECORDED.append(self.mogrify(query, vars).decode())
+                return super().execute(query, vars)
+        _cursor_classes[base] = RecordingCursor
+    return _cursor_classes[base]
+
+
+class RecordingConnection(psycopg2.extensions.connection):
+    def cursor(self, *args, **kwargs):
+        base = kwargs.pop('cursor_factory', None) or psycopg2.extensions.cursor
+        return super().cursor(*args, cursor_factory=_recording_cursor(base), **kwargs)
+
+
+SEED_SQL = """
+INSERT INTO bot_users (telegram_id, username, first_name, click_id, utm_source, created_at, updated_at)
+SELECT 1000000 + g, 'user' || g, 'Nome' || g, 'click' || g, 'facebook',
+       NOW() - INTERVAL '180 days' + g * (INTERVAL '180 days' / %(users)s),
+       NOW() - INTERVAL '180 days' + g * (INTERVAL '180 days' / %(users)s) + random() * INTERVAL '2 hours'
+FROM generate_series(1, %(users)s) g;
+
+INSERT INTO tracking_mapping (safe_id, original_data, created_at)
+SELECT 'safe' || g, '{"click_id": "click' || g || '"}',
+       NOW() - INTERVAL '180 days' + g * (INTERVAL '180 days' / (%(users)s * 2))
+FROM generate_series(1, %(users)s * 2) g;
+
+INSERT INTO user_steps (telegram_id, step_name, step_number, created_at)
+SELECT 1000000 + (g %% %(users)s) + 1, 'etapa_' || (g %% 5 + 1), g %% 5 + 1,
+       NOW() - INTERVAL '180 days' + g * (INTERVAL '180 days' / (%(users)s * 4))
+FROM generate_series(1, %(users)s * 4) g;
+
+INSERT INTO pix_transactions (transaction_id, telegram_id, amount, plano_id, status, click_id, created_at, updated_at)
+SELECT 'tx' || g, 1000000 + (g %% %(users)s) + 1, 24.90,
+       (ARRAY['plano_1mes', 'plano_3meses', 'plano_1ano'])[g %% 3 + 1],
+       (ARRAY['cancelled', 'cancelled', 'waiting_payment', 'expired', 'paid', 'cancelled', 'paid'])[g %% 7 + 1],
+       'click' || g,
+       NOW() - INTERVAL '180 days' + g * (INTERVAL '180 days' / %(users)s),
+       NOW() - INTERVAL '180 days' + g * (INTERVAL '180 days' / %(users)s)
+FROM generate_series(1, %(users)s) g;
+
+INSERT INTO conversion_logs (transaction_id, click_id, utm_source, conversion_value, status, created_at)
+SELECT 'tx' || g, 'click' || g, 'facebook', 24.90, 'sent',
+       NOW() - INTERVAL '180 days' + g * (INTERVAL '180 days' / %(users)s)
+FROM generate_series(1, %(users)s) g
+WHERE g %% 7 IN (4, 6);
+"""
+
+
+def seed(conn, users):
+    """Popula as tabelas (uma vez) e atualiza estatísticas"""
+    conn.autocommit = False
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM bot_users")
+    if cursor.fetchone()[0] >= users:
+        logger.info("✅ Banco de verificação já populado")
+    else:
+        logger.info(f"⏳ Populando banco de verificação ({users} usuários)...")
+        cursor.execute(SEED_SQL, {'users': users})
+    conn.commit()
+    conn.autocommit = True
+    # user_funnel_summary é populada pelos triggers durante o seed
+    for table in sorted(SEEDED_TABLES):
+        cursor.execute(f"ANALYZE {table}")
+
+
+UID = 1000000 + 42
+RANGE_QS = 'start_date=2025-01-01&end_date=2025-01-31'
+
+
+def _since():
+    return encode_watermark(datetime.now() - timedelta(minutes=5))
+
+
+# (nome, função(db, client), motivo_para_permitir_seq_scan_ou_None)
+CASES = [
+    ('get_user', lambda db, client: db.get_user(UID), None),
+    ('get_tracking_mapping', lambda db, client: db.get_tracking_mapping('safe42'), None),
+    ('flush_tracking_access', lambda db, client: db.flush_tracking_access([('safe42', 0.0)]), None),
+    ('get_latest_tracking', lambda db, client: db.get_latest_tracking(), None),
+    ('get_pix_transaction', lambda db, client: db.get_pix_transaction('tx42'), None),
+    ('get_active_pix', lambda db, client: db.get_active_pix(UID, 'plano_1mes'), None),
+    ('update_pix_transaction', lambda db, client: db.update_pix_transaction('tx42', status='waiting_payment'), None),
+    ('invalidate_user_pix', lambda db, client: db.invalidate_user_pix(UID), None),
+    ('record_generated_pix', lambda db, client: db.record_generated_pix(
+        'tx-explain-check', UID, 24.90, {'click_id': 'click42'}, 'plano_1mes', 'pix', 'qr'), None),
+    ('get_user_last_step', lambda db, client: db.get_user_last_step(UID), None),
+    ('get_cached_product', lambda db, client: db.get_cached_product('explain-check'), None),
+    ('get_users_with_steps_and_pix', lambda db, client: db.get_users_with_steps_and_pix(limit=100), None),
+    ('GET /api/overview (período)', lambda db, client: client.get(f'/api/overview?{RANGE_QS}'), None),
+    ('GET /api/overview (total)', lambda db, client: client.get('/api/overview'), None),
+    ('GET /api/sales (período)', lambda db, client: client.get(f'/api/sales?{RANGE_QS}'), None),
+    ('GET /api/sales (últimos 30 dias)', lambda db, client: client.get('/api/sales'), None),
+    ('GET /api/logs (período)', lambda db, client: client.get(f'/api/logs?{RANGE_QS}&limit=100'), None),
+    ('GET /api/dashboard (período)', lambda db, client: client.get(f'/api/dashboard?{RANGE_QS}&limit=100'), None),
+    ('GET /api/dashboard (total)', lambda db, client: client.get('/api/dashboard?limit=100'), None),
+    ('GET /api/logs (delta-sync)', lambda db, client: client.get(f'/api/logs?since={_since()}'), None),
+    ('GET /api/sales (delta-sync)', lambda db, client: client.get(f'/api/sales?since={_since()}'), None),
+]
+
+
+def explainable(statements):
+    """Statements com plano (SET/BEGIN etc. não têm)"""
+    return [st for st in statements if st.lstrip().split(None, 1)[0].upper() in EXPLAINABLE]
+
+
+def find_seq_scans(plan, found=None):
+    """Lista as tabelas populadas lidas por Seq Scan num plano EXPLAIN (FORMAT JSON)"""
+    found = [] if found is None else found
+    if plan.get('Node Type') == 'Seq Scan' and plan.get('Relation Name') in SEEDED_TABLES:
+        found.append(plan['Relation Name'])
+    for child in plan.get('Plans', []):
+        find_seq_scans(child, found)
+    return found
+
+
+def explain(conn, statement):
+    cursor = conn.cursor()
+    cursor.execute(f"EXPLAIN (FORMAT JSON) {statement}")
+    plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Gunicorn do API Gateway (produção): gunicorn -c gunicorn.conf.py
+
+- Um worker por core (WEB_CONCURRENCY), cada um com GUNICORN_THREADS threads;
+  no GATEWAY_MODE=async os workers são aiohttp (async_gateway.py)
+- preload_app: o master importa main.py uma vez e os workers nascem por fork.
+  O master fecha pools e threads em when_ready e cada worker abre os seus em
+  post_fork - nenhuma conexão PostgreSQL é compartilhada entre processos
+- SIGTERM: o worker para de aceitar conexões e termina os requests em andamento
+  (até GUNICORN_GRACEFUL_TIMEOUT segundos) antes de fechar os pools
+
+Limites como DB_POOL_MAX e BULKHEAD_* valem por worker; sem GUNICORN_THREADS, as
+threads por worker saem de bulkhead.thread_budget().
+"""
+
+import os
+import sys
+
+GATEWAY_MODE = os.getenv('GATEWAY_MODE', 'sync')
+
+
+def _cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+workers = int(os.getenv('WEB_CONCURRENCY', str(_cores())))
+if GATEWAY_MODE == 'async':
+    worker_class = 'aiohttp.GunicornWebWorker'
+    wsgi_app = 'main:async_app'
+else:
+    # Threads: streams SSE e exportações não seguram o worker inteiro. Padrão:
+    # o orçamento dos bulkheads (vagas + filas + reserva), para a fila de uma
+    # classe nunca ocupar as threads da outra
+    import bulkhead
+    worker_class = 'gthread'
+    threads = int(os.getenv('GUNICORN_THREADS') or bulkhead.thread_budget())
+    wsgi_app = 'main:app'
+
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') != '0'
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '60'))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '0'))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', '0'))
+
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+
+
+def on_starting(server):
+    if GATEWAY_MODE != 'async' and threads < bulkhead.thread_budget():
+        server.log.warning(f"⚠️ GUNICORN_THREADS={threads} abaixo do orçamento dos bulkheads "
+                           f"({bulkhead.thread_budget()}): requests na fila de uma classe podem "
+                           "esperar por threads presas em outra")
+
+
+def when_ready(server):
+    # Com preload o master já importou main.py (pools abertos, threads rodando)
+    if server.cfg.preload_app:
+        import main
+        main.before_fork()
+        server.log.info("✅ App pré-carregado; conexões do master fechadas antes dos forks")
+
+
+def post_fork(server, worker):
+    # Sem preload cada worker importa main.py do zero e já nasce com tudo próprio
+    if server.cfg.preload_app:
+        import main
+        main.after_fork()
+        server.log.info(f"🔄 Worker {worker.pid}: pools e threads próprios abertos")
+
+
+def post_worker_init(worker):
+    if GATEWAY_MODE == 'async':
+        # O aiohttp trata o SIGTERM no event loop e encerra os handlers sozinho;
+        # a sessão HTTP do worker é aberta (e pré-aquecida) no on_startup
+        return
+    import main
+    main.warm_upstreams()
+
+
+def worker_exit(server, worker):
+    main = sys.modules.get('main')
+    if main is None:
+        # Worker caiu antes de carregar o app
+        return
+    main.shutdown()
+    server.log.info(f"👋 Worker {worker.pid} encerrado (requests drenados, pools fechados)")
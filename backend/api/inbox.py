@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Inbox dos webhooks da TriboPay (WEBHOOK_MODE=inbox)
+
+Em rajadas de pagamentos o webhook síncrono (atualizar banco, enfileirar
+conversão) responde devagar e a TriboPay reenvia, dobrando a carga. No modo
+inbox o endpoint só grava o corpo bruto em webhook_inbox - um INSERT - e
+responde 200. Uma thread por worker aplica as entradas em lotes:
+- no máximo uma entrada por transação em andamento, sempre a mais antiga
+  pendente (database.claim_webhooks): notificações de uma transação são
+  aplicadas na ordem em que chegaram, transações diferentes em paralelo;
+- erro ao aplicar (banco fora, timeout) = nova tentativa com backoff; a
+  transação fica parada até a entrada passar ou ser dada como 'failed';
+- corpo sem id de transação ou de transação desconhecida = 'ignored'.
+
+O payload nunca é alterado, então entradas podem ser reprocessadas depois de
+uma correção:
+    python3 inbox.py status
+    python3 inbox.py replay [--status failed,ignored] [--since 2024-05-01T00:00]
+                            [--until ...] [--transaction-id ID] [--dry-run]
+O replay volta as entradas para 'pending' (junto com as entradas seguintes da
+mesma transação, para o último status recebido continuar valendo); os workers
+de um gateway em WEBHOOK_MODE=inbox aplicam na próxima passada.
+"""
+
+import os
+import sys
+import json
+import logging
+import argparse
+
+import psycopg2
+
+import tribopay
+from outbox import QueueDrainer
+
+logger = logging.getLogger(__name__)
+
+REPLAYABLE_STATUSES = ('processed', 'ignored', 'failed')
+
+
+def ordering_key(payload):
+    """transaction_id do corpo (chave de ordenação do inbox), ou None se não der para extrair"""
+    try:
+        webhook_data = json.loads(payload)
+    except ValueError:
+        return None
+    if not isinstance(webhook_data, dict):
+        return None
+    transaction_id = tribopay.extract_transaction_id(webhook_data)
+    return str(transaction_id) if transaction_id else None
+
+
+class WebhookInboxProcessor(QueueDrainer):
+    """Aplica as entradas do webhook_inbox com `apply(transaction_id, status)`.
+
+    `apply` é o mesmo caminho do webhook síncrono (main.apply_payment_status) e
+    retorna o created_at da transação, ou None se ela não existir.
+    """
+
+    OUTCOMES = ('processed', 'ignored', 'failed')
+
+    def __init__(self, db, apply, name='webhook-inbox', **kwargs):
+        super().__init__(name=name, **kwargs)
+        self.db = db
+        self.apply = apply
+
+    def claim(self, limit):
+        return self.db.claim_webhooks(limit, self.lease)
+
+    def finish(self, outcomes):
+        self.db.finish_webhooks(outcomes)
+
+    def process(self, row):
+        outcome = {'id': row['id'], 'status': 'processed', 'retry_in': 0, 'error': None}
+        try:
+            webhook_data = json.loads(row['payload'])
+        except ValueError as e:
+            logger.error(f"❌ Entrada #{row['id']} do inbox não é JSON válido: {e}")
+            outcome.update(status='failed', error=f"JSON inválido: {e}")
+            return outcome
+
+        transaction_id = tribopay.extract_transaction_id(webhook_data) if isinstance(webhook_data, dict) else None
+        if not transaction_id:
+            logger.warning(f"⚠️ Entrada #{row['id']} do inbox sem 'transaction.id' ou 'transaction.hash'. Ignorando.")
+            outcome.update(status='ignored', error='missing transaction.id')
+            return outcome
+
+        status = webhook_data.get('status')
+        if not status:
+            outcome.update(status='ignored', error='sem status')
+            return outcome
+        try:
+            created_at = self.apply(transaction_id, status)
+        except Exception as e:
+            if row['attempts'] < self.max_attempts:
+                retry_in = self.backoff(row['attempts'])
+                logger.warning(f"⚠️ Entrada #{row['id']} ({transaction_id}) falhou: {e}. Tentativa "
+                               f"{row['attempts']}/{self.max_attempts} - nova tentativa em {retry_in:.0f}s")
+                outcome.update(status='pending', retry_in=retry_in, error=str(e))
+            else:
+                logger.error(f"❌ Entrada #{row['id']} ({transaction_id}) desistida após {row['attempts']} tentativas: {e}")
+                outcome.update(status='failed', error=str(e))
+            return outcome
+
+        if created_at is None:
+            outcome.update(status='ignored', error='transação não encontrada')
+        return outcome
+
+
+def create_processor(db, apply):
+    """Workers do inbox do processo, configurados por WEBHOOK_INBOX_* e já iniciados"""
+    processor = WebhookInboxProcessor(
+        db,
+        apply,
+        batch_size=int(os.getenv('WEBHOOK_INBOX_BATCH_SIZE', '100')),
+        concurrency=int(os.getenv('WEBHOOK_INBOX_CONCURRENCY', '4')),
+        interval=float(os.getenv('WEBHOOK_INBOX_POLL_INTERVAL', '1')),
+        max_attempts=int(os.getenv('WEBHOOK_INBOX_MAX_ATTEMPTS', '10')),
+        base_delay=float(os.getenv('WEBHOOK_INBOX_BACKOFF_BASE', '2')),
+        max_delay=float(os.getenv('WEBHOOK_INBOX_BACKOFF_MAX', '600')),
+        lease=float(os.getenv('WEBHOOK_INBOX_LEASE_SECONDS', '120'))
+    )
+    processor.start()
+    return processor
+
+
+def replay(conn, statuses, since=None, until=None, transaction_id=None):
+    """Volta para 'pending' as entradas do filtro e as seguintes das mesmas transações.
+
+    Retorna quantas entradas foram reabertas (sem commit: quem chama decide).
+    """
+    filters = ["status = ANY(%s)"]
+    params = [list(statuses)]
+    if since:
+        filters.append("received_at >= %s")
+        params.append(since)
+    if until:
+        filters.append("received_at < %s")
+        params.append(until)
+    if transaction_id:
+        filters.append("transaction_id = %s")
+        params.append(transaction_id)
+
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        WITH selected AS (
+            SELECT id, transaction_id FROM webhook_inbox WHERE {' AND '.join(filters)}
+        ), firsts AS (
+            SELECT transaction_id, MIN(id) AS first_id
+            FROM selected WHERE transaction_id IS NOT NULL
+            GROUP BY transaction_id
+        )
+        UPDATE webhook_inbox i
+        SET status = 'pending', attempts = 0, next_attempt_at = CURRENT_TIMESTAMP,
+            last_error = NULL, processed_at = NULL
+        WHERE i.status <> 'pending'
+        AND (i.id IN (SELECT id FROM selected)
+             OR EXISTS (SELECT 1 FROM firsts f WHERE f.transaction_id = i.transaction_id AND i.id > f.first_id))
+    """, params)
+    return cursor.rowcount
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inbox dos webhooks da TriboPay")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('status', help="entradas por status")
+    replay_parser = commands.add_parser('replay', help="reprocessa entradas do inbox")
+    replay_parser.add_argument('--status', default='failed,ignored',
+                               help=f"status a reprocessar, separados por vírgula ({', '.join(REPLAYABLE_STATUSES)})")
+    replay_parser.add_argument('--since', help="recebidas a partir de (ISO 8601)")
+    replay_parser.add_argument('--until', help="recebidas antes de (ISO 8601)")
+    replay_parser.add_argument('--transaction-id')
+    replay_parser.add_argument('--dry-run', action='store_true', help="só conta, sem alterar")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    database_url = os.getenv('DATABASE_URL')
+    if not database_url:
+        logger.error("❌ DATABASE_URL não configurado!")
+        return 1
+
+    conn = psycopg2.connect(database_url, sslmode=os.getenv('DATABASE_SSLMODE', 'require'))
+    try:
+        if args.command == 'status':
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT status, COUNT(*), MIN(received_at), MAX(received_at)
+                FROM webhook_inbox GROUP BY status ORDER BY status
+            """)
+            for status, total, first, last in cursor.fetchall():
+                print(f"{status}: {total} (de {first} a {last})")
+            return 0
+
+        statuses = [status.strip() for status in args.status.split(',') if status.strip()]
+        unknown = set(statuses) - set(REPLAYABLE_STATUSES)
+        if unknown:
+            logger.error(f"❌ Status inválido(s) para replay: {', '.join(sorted(unknown))}")
+            return 2
+
+        reopened = replay(conn, statuses, since=args.since, until=args.until, transaction_id=args.transaction_id)
+        if args.dry_run:
+            conn.rollback()
+            logger.info(f"🔍 {reopened} entrada(s) seriam reprocessadas (dry-run, nada alterado)")
+        else:
+            conn.commit()
+            logger.info(f"🔄 {reopened} entrada(s) de volta para o inbox")
+        return 0
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -8,13 +8,26 @@ import os
 import logging
 import json
 import requests
-import random
 import hashlib
 from datetime import datetime
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
 from database import get_db
+from pagination import decode_cursor, decode_watermark, InvalidCursor
+from dashboard_queries import parse_panels
+from date_filters import business_today, business_day
+from response_cache import dashboard_cache
+from event_bus import create_bus
+import exports
+import bulkhead
+from bulkhead import BulkheadFull
+from circuit_breaker import DatabaseUnavailable
+import tribopay
+import upstream
+import outbox
+import inbox
+import rollups
 
 # Carrega variáveis de ambiente do arquivo .env
 load_dotenv()
@@ -27,7 +40,8 @@ logger = logging.getLogger(__name__)
 WEBHOOK_PORT = int(os.getenv('PORT', '8080'))
 DATABASE_URL = os.getenv('DATABASE_URL')
 TRIBOPAY_API_KEY = os.getenv('TRIBOPAY_API_KEY')
-TRIBOPAY_API_URL = "https://api.tribopay.com.br/api/public/v1/transactions"
+# inline: webhook aplicado antes da resposta; inbox: só gravado e aplicado pelos workers (inbox.py)
+WEBHOOK_MODE = os.getenv('WEBHOOK_MODE', 'inline')
 #================= FECHAMENTO ======================
 
 #======== INICIALIZAÇÃO DO FLASK E BANCO DE DADOS =============
@@ -40,45 +54,18 @@ try:
 except Exception as e:
     logger.error(f"❌ Falha crítica ao conectar com o PostgreSQL: {e}")
     db = None
-#================= FECHAMENTO ======================
 
-#======== MAPEAMENTO DE OFERTAS TRIBOPAY (CORRIGIDO CONFORME DOCUMENTAÇÃO) =============
-def get_tribopay_offer_mapping():
-    """Retorna um mapeamento limpo de plano_id para offer_hash com dados completos."""
-    return {
-        "plano_1mes": {
-            "offer_hash": os.getenv('TRIBOPAY_OFFER_VIP_BASICO', 'deq4y2wybn'),
-            "price": 2490,  # R$ 24,90
-            "title": "Acesso VIP - Ana Cardoso (1 mês)"
-        },
-        "plano_3meses": {
-            "offer_hash": os.getenv('TRIBOPAY_OFFER_VIP_PREMIUM', 'zawit'),
-            "price": 4990,  # R$ 49,90
-            "title": "Acesso VIP - Ana Cardoso (3 meses)"
-        },
-        "plano_1ano": {
-            "offer_hash": os.getenv('TRIBOPAY_OFFER_VIP_COMPLETO', '8qbmp'),
-            "price": 6700,  # R$ 67,00
-            "title": "Acesso VIP - Ana Cardoso (1 ano)"
-        },
-        "default": {
-            "offer_hash": os.getenv('TRIBOPAY_OFFER_DEFAULT', 'deq4y2wybn'),
-            "price": 2490,  # R$ 24,90
-            "title": "Acesso VIP - Ana Cardoso"
-        }
-    }
-
-def get_offer_data_by_plano_id(plano_id):
-    """Retorna dados completos da oferta baseado no plano_id. Usa 'default' se não encontrar."""
-    mapping = get_tribopay_offer_mapping()
-    offer_data = mapping.get(plano_id, mapping["default"])
-    logger.info(f"📦 Mapeamento de oferta: {plano_id} -> {offer_data['offer_hash']} (R$ {offer_data['price']/100:.2f})")
-    return offer_data
-
-# Função para backward compatibility
-def get_offer_hash_by_plano_id(plano_id):
-    """DEPRECATED: Use get_offer_data_by_plano_id() instead."""
-    return get_offer_data_by_plano_id(plano_id)["offer_hash"]
+# Eventos do funil (LISTEN/NOTIFY) expiram o cache da dashboard deste worker. O
+# stream SSE (GET /api/events) é servido só pela dashboard-api: um stream segura
+# uma thread e aqui ela sairia do orçamento das rotas de pagamento
+events = create_bus(DATABASE_URL, os.getenv('DATABASE_SSLMODE', 'require'), cache=dashboard_cache) if DATABASE_URL else None
+
+# Entrega em segundo plano das conversões gravadas no outbox pelo webhook
+conversions = outbox.create_dispatcher(db) if db else None
+
+# Fechamento periódico do rollup diário no primário: as leituras da dashboard
+# só leem (e podem ir para a réplica)
+rollup_refresher = rollups.create_refresher(db.dashboard_connection) if db else None
 #================= FECHAMENTO ======================
 
 #======== ENDPOINTS DE UTILIDADE (HEALTH CHECK, ETC) =============
@@ -93,6 +80,78 @@ def health():
     })
 
 
+@app.route('/api/db/pool', methods=['GET'])
+def db_pool_stats():
+    """Estatísticas do pool de conexões PostgreSQL."""
+    if not db:
+        return jsonify({'success': False, 'error': 'Serviço indisponível (sem conexão com o banco de dados)'}), 503
+    return jsonify({'success': True, 'pool': db.pool_stats(), 'dashboard_pool': db.dashboard_pool_stats(),
+                    'replica': db.replica_stats(), 'statements': db.statements.stats()})
+
+
+@app.route('/api/metrics/upstreams', methods=['GET'])
+def upstream_metrics():
+    """Histograma de latência e resultados das chamadas à TriboPay e à Xtracky."""
+    return jsonify({'success': True, 'upstreams': upstream.stats()})
+
+
+@app.route('/api/bulkheads', methods=['GET'])
+def bulkhead_stats():
+    """Vagas, fila e tempo de fila por classe de rota (payment / dashboard)."""
+    return jsonify({'success': True, 'bulkheads': bulkhead.stats()})
+
+
+@app.route('/api/db/breaker', methods=['GET'])
+def db_breaker_stats():
+    """Estado dos circuit breakers do banco (payment / dashboard)."""
+    if not db:
+        return jsonify({'success': False, 'error': 'Serviço indisponível (sem conexão com o banco de dados)'}), 503
+    return jsonify({'success': True, 'breakers': db.breaker_stats()})
+
+
+@app.errorhandler(DatabaseUnavailable)
+def database_unavailable(e):
+    """Circuito do banco aberto: falha imediata em vez de esperar o timeout"""
+    logger.warning(f"⚠️ {e} - request recusado ({request.path})")
+    response = jsonify({'success': False, 'error': str(e)})
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, 503
+
+
+@app.errorhandler(BulkheadFull)
+def bulkhead_full(e):
+    """Classe de rota sem capacidade: 503 para o cliente tentar de novo depois"""
+    logger.warning(f"⚠️ {e} - request descartado ({request.path})")
+    response = jsonify({'success': False, 'error': str(e)})
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, 503
+
+
+@app.route('/api/cache/dashboard', methods=['GET'])
+def dashboard_cache_stats():
+    """Estatísticas do cache de respostas da dashboard."""
+    return jsonify({'success': True, 'cache': dashboard_cache.stats()})
+
+
+@app.route('/api/db/capabilities', methods=['GET', 'POST'])
+def db_capabilities():
+    """Capacidades do schema em cache. POST relê o catálogo (ex.: após migração) sem reiniciar."""
+    if not db:
+        return jsonify({'success': False, 'error': 'Serviço indisponível (sem conexão com o banco de dados)'}), 503
+    try:
+        if request.method == 'POST':
+            capabilities = db.refresh_capabilities()
+            logger.info(f"🔄 Capacidades do schema recarregadas: {capabilities}")
+        else:
+            capabilities = db.capabilities.as_dict()
+        return jsonify({'success': True, 'capabilities': capabilities})
+    except DatabaseUnavailable:
+        raise
+    except Exception as e:
+        logger.error(f"❌ Erro ao recarregar capacidades do schema: {e}")
+        return jsonify({'success': False, 'error': 'Erro interno do servidor'}), 500
+
+
 @app.route('/', methods=['GET'])
 def index():
     """Endpoint raiz com informações básicas."""
@@ -105,6 +164,7 @@ def index():
 
 #======== LÓGICA PRINCIPAL: GERAÇÃO DE PIX (REFEITA) =============
 @app.route('/api/pix/gerar', methods=['POST'])
+@bulkhead.bulkhead('payment')
 def gerar_pix():
     """
     Gera uma transação PIX na TriboPay utilizando dados reais do cliente.
@@ -124,175 +184,43 @@ def gerar_pix():
         if not all([user_id, valor, plano_id]):
             return jsonify({'success': False, 'error': 'Campos obrigatórios ausentes: user_id, valor, plano_id'}), 400
 
-        # Se customer_data não foi fornecido, gera dados únicos realistas
-        if not customer_data:
-            customer_data = generate_unique_customer_data(user_id)
-            logger.info(f"🎲 Dados únicos gerados para user_id {user_id}")
-        else:
-            # NOVO: Dados do Telegram fornecidos - usa dados REAIS + randomiza apenas PIX data
-            if 'username_telegram' in customer_data:
-                logger.info(f"📱 Usando dados REAIS do Telegram para user_id {user_id}")
-                
-                # Dados REAIS do Telegram
-                username_telegram = customer_data.get('username_telegram')
-                first_name_telegram = customer_data.get('first_name_telegram')
-                last_name_telegram = customer_data.get('last_name_telegram', '')
-                
-                # Gera nome real do Telegram
-                nome_real = f"{first_name_telegram} {last_name_telegram}".strip()
-                
-                # Gera apenas dados randomizados para PIX (document, phone, email)
-                import time
-                seed = int(str(user_id) + str(int(time.time() * 1000))[-6:])
-                random.seed(seed)
-                
-                # Gera CPF aleatório
-                def gerar_cpf():
-                    cpf = [random.randint(0, 9) for _ in range(9)]
-                    soma = sum(cpf[i] * (10 - i) for i in range(9))
-                    digito1 = (soma * 10 % 11) % 10
-                    cpf.append(digito1)
-                    soma = sum(cpf[i] * (11 - i) for i in range(10))
-                    digito2 = (soma * 10 % 11) % 10
-                    cpf.append(digito2)
-                    return ''.join(map(str, cpf))
-                
-                # Gera telefone aleatório
-                def gerar_telefone():
-                    ddds = ['11', '21', '31', '41', '51', '61', '71', '81', '85', '91']
-                    ddd = random.choice(ddds)
-                    numero = '9' + ''.join([str(random.randint(0, 9)) for _ in range(8)])
-                    return f"{ddd}{numero}"
-                
-                # Gera email baseado no nome real
-                import re
-                email_base = re.sub(r'[^a-z]', '', first_name_telegram.lower())
-                if len(email_base) < 3:
-                    email_base = f"user{user_id}"
-                email_real = f"{email_base}{random.randint(100, 999)}@gmail.com"
-                
-                # Monta customer_data com dados REAIS do Telegram + dados PIX randomizados
-                customer_data = {
-                    'name': nome_real,  # REAL do Telegram
-                    'email': email_real,  # Baseado no nome real
-                    'document': gerar_cpf(),  # Randomizado para PIX
-                    'phone_number': gerar_telefone()  # Randomizado para PIX
-                }
-                
-                logger.info(f"✅ Customer data montado: Nome REAL='{nome_real}', Username='{username_telegram}'")
-                
-            else:
-                # Valida campos obrigatórios apenas se customer_data foi fornecido no formato antigo
-                required_customer_fields = ['name', 'email', 'document', 'phone_number']
-                if not all(k in customer_data for k in required_customer_fields):
-                    return jsonify({'success': False, 'error': f'Dados do cliente incompletos. Obrigatórios: {required_customer_fields}'}), 400
+        # Dados REAIS do Telegram (+ dados PIX randomizados) ou dados únicos gerados
+        customer_data, error = tribopay.build_customer_data(user_id, customer_data)
+        if error:
+            return jsonify({'success': False, 'error': error}), 400
 
         if not db:
             return jsonify({'success': False, 'error': 'Serviço indisponível (sem conexão com o banco de dados)'}), 503
 
         # 2. Busca de dados de tracking com logs detalhados
-        tracking_data = {}
-        user_data = db.get_user(int(user_id))
-        if user_data:
-            tracking_data = user_data.get('tracking_data', {})
-            logger.info(f"🎯 Tracking encontrado para usuário {user_id}: {tracking_data}")
-            
-            # Log detalhado dos dados de tracking para debug PIX
-            click_id = tracking_data.get('click_id')
-            utm_source = tracking_data.get('utm_source')
-            utm_medium = tracking_data.get('utm_medium')
-            utm_campaign = tracking_data.get('utm_campaign')
-            
-            logger.info(f"📊 Dados tracking detalhados PIX:")
-            logger.info(f"   - click_id: {click_id}")
-            logger.info(f"   - utm_source: {utm_source}")
-            logger.info(f"   - utm_medium: {utm_medium}")
-            logger.info(f"   - utm_campaign: {utm_campaign}")
-            logger.info(f"   - Total campos tracking: {len(tracking_data)}")
-        else:
-            logger.warning(f"⚠️ Usuário {user_id} não encontrado no banco. Tracking não será enviado.")
-            logger.warning(f"💡 Dica: Usuário pode não ter passado pelo /start ou dados não foram salvos corretamente")
+        tracking_data = tribopay.log_tracking(user_id, db.get_user(int(user_id)))
 
         # 3. Preparação do Payload para a TriboPay, EXATAMENTE conforme a documentação oficial
-        offer_data = get_offer_data_by_plano_id(plano_id)
-        offer_hash = offer_data["offer_hash"]
-        offer_price = offer_data["price"]
-        offer_title = offer_data["title"]
-        product_hash = "a8c1r56cgy"  # Product hash fixo do produto "Acesso VIP - Ana Cardoso"
-        postback_url = "https://api-gateway-production-22bb.up.railway.app/webhook/tribopay"
-
-        # Validação crítica: valor solicitado deve coincidir com o preço da oferta
-        valor_centavos = int(float(valor) * 100)
-        if valor_centavos != offer_price:
-            logger.warning(f"⚠️ Valor solicitado ({valor_centavos}) diferente do preço da oferta ({offer_price}). Usando preço da oferta.")
-            valor_centavos = offer_price
-
-        tribopay_payload = {
-            "amount": valor_centavos,
-            "offer_hash": offer_hash,
-            "payment_method": "pix",
-            "installments": 1,  # CRÍTICO: Campo obrigatório conforme teste da API
-            "postback_url": postback_url,
-            "customer": customer_data,
-            "cart": [{
-                "product_hash": product_hash,  # CRÍTICO: Usar product_hash, não offer_hash
-                "title": offer_title,          # CRÍTICO: Campo obrigatório
-                "price": valor_centavos,       # CRÍTICO: Campo obrigatório
-                "quantity": 1,
-                "operation_type": 1,           # CRÍTICO: Campo obrigatório (1 = sale)
-                "tangible": False              # CRÍTICO: Campo obrigatório (produto digital)
-            }],
-            "tracking": {
-                "src": tracking_data.get('click_id'),
-                "utm_source": tracking_data.get('utm_source'),
-                "utm_campaign": tracking_data.get('utm_campaign'),
-                "utm_medium": tracking_data.get('utm_medium'),
-                "utm_term": tracking_data.get('utm_term'),
-                "utm_content": tracking_data.get('utm_content')
-            }
-        }
+        tribopay_payload = tribopay.build_payload(valor, plano_id, customer_data, tracking_data)
 
         logger.info(f"🚀 Enviando payload para TriboPay para o cliente {customer_data['email']}.")
         logger.debug(f"Payload: {json.dumps(tribopay_payload, indent=2)}")
 
-        # 4. Requisição à API da TriboPay com tratamento de erro robusto
-        response = requests.post(
-            f"{TRIBOPAY_API_URL}?api_token={TRIBOPAY_API_KEY}",
+        # 4. Requisição à API da TriboPay (conexão keep-alive do pool) com tratamento de erro robusto
+        response = upstream.get('tribopay').post(
+            tribopay.transactions_url(),
             json=tribopay_payload,
-            headers={"Content-Type": "application/json", "Accept": "application/json"},
-            timeout=20
+            headers=tribopay.REQUEST_HEADERS
         )
         
         # Lança uma exceção para erros HTTP (4xx ou 5xx), permitindo um catch mais limpo
         response.raise_for_status()
 
         # 5. Processamento da resposta de sucesso
-        tribopay_data = response.json()
-        transaction_id = tribopay_data.get('hash')
-        pix_data = tribopay_data.get('pix', {})
-        
-        # CORREÇÃO: Tornar a validação de dados PIX mais flexível
-        pix_code = pix_data.get('pix_qr_code')      # Código PIX copia e cola (Prioridade 1)
-        qr_code = pix_data.get('pix_url')           # URL para pagamento (Opcional)
-        qr_code_b64 = pix_data.get('qr_code_base64') # Base64 (Opcional)
-
-        # A condição para falha é não ter ID da transação ou não ter NENHUMA forma de PIX.
-        if not transaction_id or not (pix_code or qr_code or qr_code_b64):
-            logger.error(f"❌ Resposta da TriboPay bem-sucedida, mas sem dados PIX utilizáveis: {tribopay_data}")
-            raise ValueError("Resposta da TriboPay não contém dados PIX utilizáveis (pix_qr_code, pix_url, ou qr_code_base64)")
-
-        logger.info(f"✅ PIX gerado com sucesso! Transaction ID: {transaction_id}")
+        transaction_id, pix_code, qr_code = tribopay.parse_pix_response(response.json())
 
         # 6. Salva a transação no banco de dados local
-        db.invalidate_user_pix(int(user_id))
-        db.save_pix_transaction(
+        db.record_generated_pix(
             transaction_id=transaction_id, telegram_id=int(user_id), amount=float(valor),
-            tracking_data=tracking_data, plano_id=plano_id
-        )
-        db.update_pix_transaction(
-            transaction_id=transaction_id, status='waiting_payment', pix_code=pix_code, qr_code=qr_code
+            tracking_data=tracking_data, plano_id=plano_id, pix_code=pix_code, qr_code=qr_code
         )
         logger.info(f"💾 Transação {transaction_id} salva no banco de dados.")
+        dashboard_cache.invalidate_day(business_today())
 
         return jsonify({
             'success': True,
@@ -302,12 +230,10 @@ def gerar_pix():
         })
 
     except requests.exceptions.HTTPError as http_err:
-        error_body = http_err.response.text
-        logger.error(f"❌ ERRO HTTP da API TriboPay: {http_err.response.status_code} - {error_body}")
-        return jsonify({
-            'success': False, 'error': 'Erro de comunicação com o gateway de pagamento.',
-            'gateway_message': error_body
-        }), http_err.response.status_code
+        status_code = http_err.response.status_code
+        return jsonify(tribopay.gateway_error_body(status_code, http_err.response.text)), status_code
+    except DatabaseUnavailable:
+        raise
     except Exception as e:
         logger.error(f"❌ Erro inesperado em /api/pix/gerar: {e}", exc_info=True)
         return jsonify({'success': False, 'error': 'Ocorreu um erro interno no servidor.'}), 500
@@ -315,6 +241,7 @@ def gerar_pix():
 
 #======== ENDPOINTS AUSENTES - INVALIDAR PIX =============
 @app.route('/api/pix/invalidar/<int:user_id>', methods=['POST'])
+@bulkhead.bulkhead('payment')
 def invalidar_pix_usuario(user_id):
     """Invalida todos os PIX pendentes do usuário."""
     try:
@@ -331,6 +258,8 @@ def invalidar_pix_usuario(user_id):
             logger.warning(f"⚠️ Nenhum PIX encontrado para invalidar do usuário {user_id}")
             return jsonify({'success': True, 'message': f'Nenhum PIX encontrado para o usuário {user_id}'})
             
+    except DatabaseUnavailable:
+        raise
     except Exception as e:
         logger.error(f"❌ Erro ao invalidar PIX do usuário {user_id}: {e}")
         return jsonify({'success': False, 'error': 'Erro interno do servidor'}), 500
@@ -356,6 +285,8 @@ def get_latest_tracking():
             logger.warning("⚠️ Nenhum tracking encontrado")
             return jsonify({'success': False, 'error': 'Nenhum tracking encontrado'}), 404
             
+    except DatabaseUnavailable:
+        raise
     except Exception as e:
         logger.error(f"❌ Erro ao buscar último tracking: {e}")
         return jsonify({'success': False, 'error': 'Erro interno do servidor'}), 500
@@ -391,6 +322,8 @@ def save_user():
             logger.error(f"❌ Falha ao salvar usuário {data['telegram_id']}")
             return jsonify({'success': False, 'error': 'Falha ao salvar usuário'}), 500
             
+    except DatabaseUnavailable:
+        raise
     except Exception as e:
         logger.error(f"❌ Erro ao salvar usuário: {e}")
         return jsonify({'success': False, 'error': 'Erro interno do servidor'}), 500
@@ -425,6 +358,8 @@ def save_user_step():
             logger.error(f"❌ Falha ao salvar etapa para usuário {data['telegram_id']}")
             return jsonify({'success': False, 'error': 'Falha ao salvar etapa'}), 500
             
+    except DatabaseUnavailable:
+        raise
     except Exception as e:
         logger.error(f"❌ Erro ao salvar etapa: {e}")
         return jsonify({'success': False, 'error': 'Erro interno do servidor'}), 500
@@ -464,6 +399,8 @@ def save_tracking():
             'safe_id': safe_id
         })
             
+    except DatabaseUnavailable:
+        raise
     except Exception as e:
         logger.error(f"❌ Erro ao salvar tracking: {e}")
         return jsonify({'success': False, 'error': 'Erro interno do servidor'}), 500
@@ -490,11 +427,14 @@ def get_tracking(safe_id):
             logger.warning(f"⚠️ Tracking {safe_id} não encontrado")
             return jsonify({'success': False, 'error': 'Tracking não encontrado'}), 404
             
+    except DatabaseUnavailable:
+        raise
     except Exception as e:
         logger.error(f"❌ Erro ao buscar tracking {safe_id}: {e}")
         return jsonify({'success': False, 'error': 'Erro interno do servidor'}), 500
 
 @app.route('/api/pix/verificar/<int:user_id>/<plano_id>', methods=['GET'])
+@bulkhead.bulkhead('payment')
 def verificar_pix_existente(user_id, plano_id):
     """Verifica se existe PIX válido para o usuário e plano."""
     try:
@@ -509,196 +449,57 @@ def verificar_pix_existente(user_id, plano_id):
         pix_data = db.get_valid_pix(user_id, plano_id)
         logger.info(f"📦 Resultado db.get_valid_pix: {pix_data}")
         
-        if pix_data:
-            # Calcula tempo restante
-            from datetime import datetime, timedelta
-            created_at = pix_data.get('created_at')
-            logger.info(f"⏰ PIX created_at: {created_at} (tipo: {type(created_at)})")
-            
-            if isinstance(created_at, str):
-                created_at = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
-            
-            if created_at:
-                expire_time = created_at + timedelta(minutes=15)
-                now = datetime.now(created_at.tzinfo) if created_at.tzinfo else datetime.now()
-                tempo_restante = expire_time - now
-                logger.info(f"⏰ Tempo restante calculado: {tempo_restante.total_seconds()} segundos")
-                
-                if tempo_restante.total_seconds() > 0:
-                    tempo_min = int(tempo_restante.total_seconds() / 60)
-                    pix_data['tempo_restante'] = f"{tempo_min} minutos"
-                    
-                    logger.info(f"✅ PIX VÁLIDO encontrado para usuário {user_id}, plano {plano_id} - {tempo_min} min restantes")
-                    return jsonify({
-                        'success': True,
-                        'pix_valido': True,
-                        'pix_data': pix_data
-                    })
-                else:
-                    logger.info(f"⏰ PIX EXPIRADO para usuário {user_id}, plano {plano_id}")
-            else:
-                logger.warning(f"⚠️ PIX sem created_at válido para usuário {user_id}")
-        
-        logger.info(f"❌ Nenhum PIX válido encontrado para usuário {user_id}, plano {plano_id}")
-        return jsonify({
-            'success': True,
-            'pix_valido': False,
-            'pix_data': None
-        })
+        return jsonify(tribopay.pix_verification(user_id, plano_id, pix_data))
         
+    except DatabaseUnavailable:
+        raise
     except Exception as e:
         logger.error(f"❌ Erro ao verificar PIX do usuário {user_id}: {e}", exc_info=True)
         return jsonify({'success': False, 'error': 'Erro interno do servidor'}), 500
 #================= FECHAMENTO ======================
 
-#======== SISTEMA DE GERAÇÃO DE DADOS ÚNICOS =============
-def generate_unique_customer_data(user_id):
-    """Gera dados únicos de cliente para PIX - nunca repete"""
-    
-    # Listas de nomes brasileiros comuns
-    primeiros_nomes = [
-        "Ana", "Maria", "João", "Pedro", "Lucas", "Gabriel", "Rafael", "Daniel", "Bruno", "Felipe",
-        "Fernanda", "Juliana", "Camila", "Amanda", "Beatriz", "Carolina", "Larissa", "Mariana",
-        "André", "Diego", "Marcos", "Thiago", "Rodrigo", "Mateus", "Gustavo", "Ricardo",
-        "Patrícia", "Renata", "Sandra", "Vanessa", "Claudia", "Mônica", "Silvia", "Adriana",
-        "Carlos", "Fernando", "Eduardo", "Marcelo", "Paulo", "Roberto", "Leonardo", "Vinicius"
-    ]
-    
-    sobrenomes = [
-        "Silva", "Santos", "Oliveira", "Souza", "Lima", "Ferreira", "Costa", "Pereira", "Almeida",
-        "Martins", "Araújo", "Melo", "Barbosa", "Ribeiro", "Monteiro", "Cardoso", "Carvalho",
-        "Gomes", "Nascimento", "Moreira", "Reis", "Freitas", "Campos", "Cunha", "Pinto", "Farias",
-        "Batista", "Vieira", "Mendes", "Castro", "Rocha", "Dias", "Moura", "Correia", "Teixeira"
-    ]
-    
-    # Usa user_id + timestamp para garantir unicidade
-    import time
-    seed = int(str(user_id) + str(int(time.time() * 1000))[-6:])
-    random.seed(seed)
-    
-    # Gera nome único
-    primeiro = random.choice(primeiros_nomes)
-    sobrenome = random.choice(sobrenomes)
-    nome_completo = f"{primeiro} {sobrenome}"
-    
-    # Gera CPF válido único
-    def gerar_cpf():
-        # Gera 9 primeiros dígitos
-        cpf = [random.randint(0, 9) for _ in range(9)]
-        
-        # Calcula primeiro dígito verificador
-        soma = sum(cpf[i] * (10 - i) for i in range(9))
-        digito1 = (soma * 10 % 11) % 10
-        cpf.append(digito1)
-        
-        # Calcula segundo dígito verificador
-        soma = sum(cpf[i] * (11 - i) for i in range(10))
-        digito2 = (soma * 10 % 11) % 10
-        cpf.append(digito2)
-        
-        return ''.join(map(str, cpf))
-    
-    # Gera telefone celular válido
-    def gerar_telefone():
-        # DDD válidos brasileiros
-        ddds = ['11', '12', '13', '14', '15', '16', '17', '18', '19', '21', '22', '24', '27', '28',
-                '31', '32', '33', '34', '35', '37', '38', '41', '42', '43', '44', '45', '46', '47',
-                '48', '49', '51', '53', '54', '55', '61', '62', '63', '64', '65', '66', '67', '68',
-                '69', '71', '73', '74', '75', '77', '79', '81', '82', '83', '84', '85', '86', '87',
-                '88', '89', '91', '92', '93', '94', '95', '96', '97', '98', '99']
-        
-        ddd = random.choice(ddds)
-        # Celular sempre começa com 9
-        numero = '9' + ''.join([str(random.randint(0, 9)) for _ in range(8)])
-        return f"{ddd}{numero}"
-    
-    cpf = gerar_cpf()
-    telefone = gerar_telefone()
-    
-    # Gera email seguro removendo acentos e caracteres especiais
-    import re
-    email_base = re.sub(r'[^a-z]', '', primeiro.lower() + sobrenome.lower())
-    if len(email_base) < 3:  # Fallback se nome muito curto
-        email_base = f"user{user_id}"
-    email = f"{email_base}{random.randint(100, 999)}@gmail.com"
-    
-    logger.info(f"🎲 Dados FALLBACK gerados para user {user_id}: {nome_completo}, CPF: {cpf[:3]}*** (sem dados Telegram)")
-    
-    return {
-        'name': nome_completo,
-        'email': email,
-        'document': cpf,
-        'phone_number': telefone
-    }
-#================= FECHAMENTO ======================
-
-#======== FUNÇÃO DE CONVERSÃO XTRACKY =============
-def send_conversion_to_xtracky(transaction_id):
-    """Envia conversão para Xtracky quando pagamento é aprovado"""
-    try:
-        if not db:
-            logger.error("❌ Banco indisponível - conversão não enviada")
-            return False
-            
-        # Busca dados da transação
-        transaction = db.get_pix_transaction(transaction_id)
-        if not transaction:
-            logger.error(f"❌ Transação {transaction_id} não encontrada")
-            return False
-            
-        # Busca click_id diretamente da transação (está armazenado como campo separado)
-        click_id = transaction.get('click_id')
-        tracking_data = transaction.get('tracking_data', {})
-        
-        # Debug: Log detalhado dos dados de tracking da transação
-        logger.info(f"🔍 Dados transação {transaction_id}:")
-        logger.info(f"   - click_id direto: {click_id}")
-        logger.info(f"   - tracking_data: {tracking_data}")
-        logger.info(f"   - tracking_data.click_id: {tracking_data.get('click_id') if isinstance(tracking_data, dict) else 'N/A'}")
-        
-        # Fallback: se click_id não está direto, tenta extrair do tracking_data
-        if not click_id and isinstance(tracking_data, dict):
-            click_id = tracking_data.get('click_id')
-            logger.info(f"🔄 Usando click_id do tracking_data: {click_id}")
-        
-        if not click_id:
-            logger.warning(f"⚠️ Transação {transaction_id} sem click_id - conversão não enviada")
-            logger.warning(f"   Dados disponíveis: {list(transaction.keys())}")
-            return False
-            
-        # Dados da conversão para Xtracky
-        conversion_data = {
-            'token': '72701474-7e6c-4c87-b84f-836d4547a4bd',
-            'click_id': click_id,
-            'value': float(transaction.get('amount', 0)),
-            'currency': 'BRL',
-            'status': 'paid'
-        }
-        
-        # Envia para Xtracky
-        response = requests.post(
-            'https://api.xtracky.com/api/integrations/tribopay',
-            json=conversion_data,
-            timeout=10
-        )
-        
-        if response.status_code == 200:
-            logger.info(f"✅ Conversão enviada para Xtracky: {click_id} - R$ {transaction.get('amount', 0)}")
-            return True
-        else:
-            logger.error(f"❌ Erro ao enviar conversão para Xtracky: {response.status_code} - {response.text}")
-            return False
-            
-    except Exception as e:
-        logger.error(f"❌ Erro crítico ao enviar conversão para Xtracky: {e}")
-        return False
+#======== OUTBOX DE CONVERSÕES XTRACKY =============
+@app.route('/api/metrics/conversions', methods=['GET'])
+def conversion_metrics():
+    """Conversões pendentes no outbox e resultados do dispatcher deste worker."""
+    if not db:
+        return jsonify({'success': False, 'error': 'Serviço indisponível (sem conexão com o banco de dados)'}), 503
+    return jsonify({'success': True, 'outbox': db.conversion_outbox_stats(), 'dispatcher': conversions.stats()})
 #================= FECHAMENTO ======================
 
 #======== LÓGICA DO WEBHOOK (CORRIGIDA) =============
+def apply_payment_status(transaction_id, status):
+    """Aplica o status de uma notificação da TriboPay. Retorna o created_at (None se a transação não existir)."""
+    # Pagamento aprovado: conversão da Xtracky entra no outbox na mesma transação
+    paid = status in tribopay.PAID_STATUSES
+    created_at = db.update_pix_transaction(transaction_id, status=status, enqueue_conversion=paid)
+    logger.info(f"💾 Status da transação {transaction_id} atualizado para '{status}' no banco de dados.")
+    if created_at:
+        # Só períodos que contêm o dia da transação (ou hoje, dia da conversão) expiram
+        dashboard_cache.invalidate_day(business_day(created_at), business_today())
+        if paid:
+            conversions.wake()
+    return created_at
+
+# Modo inbox: workers que aplicam as notificações gravadas pelo webhook
+webhook_inbox = inbox.create_processor(db, apply_payment_status) if db and WEBHOOK_MODE == 'inbox' else None
+
+
 @app.route('/webhook/tribopay', methods=['POST'])
+@bulkhead.bulkhead('payment')
 def tribopay_webhook():
     """Webhook para receber e processar notificações da TriboPay."""
     try:
+        if webhook_inbox:
+            # Resposta imediata: só o INSERT do corpo bruto; a aplicação fica com os workers
+            payload = request.get_data(as_text=True)
+            if not payload.strip():
+                return jsonify({'status': 'ignorado', 'reason': 'payload vazio'}), 400
+            entry_id = db.append_webhook(inbox.ordering_key(payload), payload)
+            webhook_inbox.wake()
+            logger.info(f"📥 Webhook da TriboPay gravado no inbox (#{entry_id}).")
+            return jsonify({'status': 'recebido', 'inbox_id': entry_id})
+
         webhook_data = request.get_json()
         if not webhook_data:
             return jsonify({'status': 'ignorado', 'reason': 'payload vazio'}), 400
@@ -707,36 +508,7 @@ def tribopay_webhook():
         logger.debug(f"Webhook Payload: {json.dumps(webhook_data)}")
 
         # CORREÇÃO CRÍTICA: Múltiplos formatos de webhook da TriboPay
-        transaction_data = webhook_data.get('transaction')
-        transaction_id = None
-        
-        # Formato 1: transaction é um objeto (dict)
-        if isinstance(transaction_data, dict):
-            transaction_id = transaction_data.get('id') or transaction_data.get('hash')
-        # Formato 2: transaction é uma string (pode ser JSON ou hash direto)
-        elif isinstance(transaction_data, str):
-            try:
-                # Tenta decodificar como JSON
-                data = json.loads(transaction_data)
-                transaction_id = data.get('id') or data.get('hash')
-            except json.JSONDecodeError:
-                # Se não for JSON, assume que é o hash/ID direto
-                if len(transaction_data) > 5:
-                    transaction_id = transaction_data
-                    logger.info(f"🔍 transaction_data é uma string (hash direto): {transaction_data}")
-                else:
-                    logger.warning(f"⚠️ transaction_data é uma string curta e não-JSON: {transaction_data}")
-        # Formato 3 (NOVO): transaction é um número inteiro (ID direto)
-        elif isinstance(transaction_data, int):
-            transaction_id = transaction_data
-            logger.info(f"🔍 transaction_data é um inteiro (ID direto): {transaction_data}")
-        # Formato 4: transaction não existe, busca ID no root do webhook
-        elif not transaction_data:
-            transaction_id = webhook_data.get('id') or webhook_data.get('hash')
-            
-        # Formato 5: Fallback - tenta outros campos comuns da TriboPay
-        if not transaction_id:
-            transaction_id = webhook_data.get('transaction_id') or webhook_data.get('txn_id')
+        transaction_id = tribopay.extract_transaction_id(webhook_data)
         
         if not transaction_id:
             logger.warning("⚠️ Webhook recebido sem 'transaction.id' ou 'transaction.hash'. Ignorando.")
@@ -746,204 +518,89 @@ def tribopay_webhook():
         logger.info(f"🔍 Processando webhook para transação {transaction_id} com status '{status}'.")
 
         if db:
-            db.update_pix_transaction(transaction_id, status=status)
-            logger.info(f"💾 Status da transação {transaction_id} atualizado para '{status}' no banco de dados.")
-            
-            # Envia conversão para Xtracky se pagamento foi aprovado
-            if status == 'paid' or status == 'approved':
-                send_conversion_to_xtracky(transaction_id)
+            apply_payment_status(transaction_id, status)
         else:
             logger.error("❌ Banco de dados indisponível. Não foi possível processar o webhook.")
 
         return jsonify({'status': 'recebido'})
 
+    except DatabaseUnavailable:
+        raise
     except Exception as e:
         logger.error(f"❌ Erro crítico no processamento do webhook: {e}", exc_info=True)
         return jsonify({'error': 'Internal server error'}), 500
+
+
+@app.route('/api/metrics/webhooks', methods=['GET'])
+def webhook_metrics():
+    """Entradas pendentes no inbox de webhooks e resultados dos workers deste processo."""
+    if not db:
+        return jsonify({'success': False, 'error': 'Serviço indisponível (sem conexão com o banco de dados)'}), 503
+    return jsonify({'success': True, 'mode': WEBHOOK_MODE, 'inbox': db.webhook_inbox_stats(),
+                    'workers': webhook_inbox.stats() if webhook_inbox else None})
 #================= FECHAMENTO ======================
 
 #======== ENDPOINTS DASHBOARD =============
 @app.route('/api/overview', methods=['GET'])
+@bulkhead.bulkhead('dashboard')
 def get_overview():
     """Dados para aba Visão Geral da Dashboard"""
     try:
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
         
-        data = {}
-        
         if not db:
             return jsonify({'error': 'Database indisponível'}), 500
-            
-        # Base query for date filtering
-        date_filter = ""
-        date_params = []
         
-        if start_date and end_date:
-            date_filter = "WHERE created_at::date BETWEEN %s AND %s"
-            date_params = [start_date, end_date]
-        
-        # 1. Entradas na presell (tracking_mapping)
-        try:
-            presell_entries = db.execute_query(f"""
-                SELECT COUNT(*) as total 
-                FROM tracking_mapping {date_filter}
-            """, date_params)
-            data['presell_entries'] = presell_entries[0]['total'] if presell_entries else 0
-        except:
-            data['presell_entries'] = 0
-        
-        # 2. /start no bot (bot_users)
-        try:
-            bot_starts = db.execute_query(f"""
-                SELECT COUNT(*) as total 
-                FROM bot_users {date_filter}
-            """, date_params)
-            data['bot_starts'] = bot_starts[0]['total'] if bot_starts else 0
-        except:
-            data['bot_starts'] = 0
-        
-        # 3. PIX gerados (pix_transactions)
-        try:
-            pix_generated = db.execute_query(f"""
-                SELECT COUNT(*) as total 
-                FROM pix_transactions {date_filter}
-            """, date_params)
-            data['pix_generated'] = pix_generated[0]['total'] if pix_generated else 0
-            
-            # PIX pagos
-            pix_paid = db.execute_query(f"""
-                SELECT COUNT(*) as total 
-                FROM pix_transactions 
-                WHERE status = 'paid' {' AND ' + date_filter.replace('WHERE ', '') if date_filter else ''}
-            """, date_params)
-            data['pix_paid'] = pix_paid[0]['total'] if pix_paid else 0
-        except:
-            data['pix_generated'] = 0
-            data['pix_paid'] = 0
-        
-        # 4. Conversões (conversion_logs) 
-        try:
-            conversions = db.execute_query(f"""
-                SELECT COUNT(*) as total 
-                FROM conversion_logs {date_filter}
-            """, date_params)
-            data['conversions'] = conversions[0]['total'] if conversions else 0
-        except:
-            data['conversions'] = 0
-            
-        # Etapas do funil (simulado por enquanto)
-        data['step_1_welcome'] = data['bot_starts']
-        data['step_2_preview'] = int(data['bot_starts'] * 0.8)
-        data['step_3_gallery'] = int(data['bot_starts'] * 0.6)
-        data['step_4_vip_plans'] = int(data['bot_starts'] * 0.4)
-        data['step_5_payment'] = data['pix_generated']
-        
-        # Dados adicionais
-        data['blocked_users'] = 0  # Implementar quando houver tabela
-        data['joined_group'] = 0   # Implementar quando houver tabela
-        data['left_group'] = 0     # Implementar quando houver tabela
+        # Funil inteiro num único statement sobre o rollup diário (compartilhado com a dashboard-api)
+        data = dashboard_cache.get_or_compute(
+            'overview', start_date, end_date, lambda: db.get_overview(start_date, end_date))
         
         logger.info(f"✅ Dashboard overview: {data}")
         return jsonify(data)
         
+    except DatabaseUnavailable:
+        raise
     except Exception as e:
         logger.error(f"❌ Erro em get_overview: {e}")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/sales', methods=['GET'])
+@bulkhead.bulkhead('dashboard')
 def get_sales():
     """Dados para aba Vendas da Dashboard"""
     try:
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
         
-        data = {
-            'total_revenue': 0,
-            'total_transactions': 0,
-            'conversion_rate': 0,
-            'average_ticket': 0,
-            'sales_by_date': [],
-            'sales_by_plan': []
-        }
-        
         if not db:
             return jsonify({'error': 'Database indisponível'}), 500
         
-        # Base query for date filtering
-        date_filter = ""
-        date_params = []
-        
-        if start_date and end_date:
-            date_filter = "WHERE created_at::date BETWEEN %s AND %s"
-            date_params = [start_date, end_date]
-        
         try:
-            # Total de vendas
-            sales_data = db.execute_query(f"""
-                SELECT 
-                    SUM(amount) as total_revenue,
-                    COUNT(*) as total_transactions,
-                    AVG(amount) as average_ticket
-                FROM pix_transactions 
-                WHERE status = 'paid' {' AND ' + date_filter.replace('WHERE ', '') if date_filter else ''}
-            """, date_params)
-            
-            if sales_data and sales_data[0]:
-                result = sales_data[0]
-                data['total_revenue'] = float(result['total_revenue'] or 0)
-                data['total_transactions'] = result['total_transactions']
-                data['average_ticket'] = float(result['average_ticket'] or 0)
-            
-            # Taxa de conversão
-            total_pix_data = db.execute_query(f"""
-                SELECT COUNT(*) as total_pix 
-                FROM pix_transactions {date_filter}
-            """, date_params)
-            
-            total_pix = total_pix_data[0]['total_pix'] if total_pix_data else 0
-            if total_pix > 0:
-                data['conversion_rate'] = (data['total_transactions'] / total_pix) * 100
-            
-            # Vendas por data (últimos 30 dias ou período selecionado)
-            if not start_date or not end_date:
-                from datetime import datetime, timedelta
-                start_date = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
-                end_date = datetime.now().strftime('%Y-%m-%d')
-            
-            sales_by_date = db.execute_query("""
-                SELECT 
-                    created_at::date as date,
-                    SUM(amount) as revenue,
-                    COUNT(*) as transactions
-                FROM pix_transactions 
-                WHERE status = 'paid' 
-                AND created_at::date BETWEEN %s AND %s
-                GROUP BY created_at::date
-                ORDER BY date DESC
-            """, [start_date, end_date])
-            
-            data['sales_by_date'] = [
-                {
-                    'date': row['date'].strftime('%Y-%m-%d'),
-                    'revenue': float(row['revenue']),
-                    'transactions': row['transactions']
-                } for row in sales_by_date
-            ] if sales_by_date else []
-            
-        except Exception as e:
-            logger.warning(f"⚠️ Erro ao buscar dados de vendas: {e}")
+            since = decode_watermark(request.args['since']) if request.args.get('since') else None
+        except InvalidCursor as e:
+            return jsonify({'error': str(e)}), 400
+        
+        if since:
+            # Delta-sync: só os dias alterados desde a marca d'água (não passa pelo cache)
+            data = db.get_sales(start_date, end_date, since=since)
+        else:
+            data = dashboard_cache.get_or_compute(
+                'sales', start_date, end_date, lambda: db.get_sales(start_date, end_date))
         
         logger.info(f"✅ Dashboard sales: {data}")
         return jsonify(data)
         
+    except DatabaseUnavailable:
+        raise
     except Exception as e:
         logger.error(f"❌ Erro em get_sales: {e}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/logs', methods=['GET'])
-def get_logs():
-    """Logs de membros/usuários com informações específicas para Dashboard"""
+@app.route('/api/dashboard', methods=['GET'])
+@bulkhead.bulkhead('dashboard')
+def get_dashboard():
+    """Painéis da dashboard (?panels=overview,sales,logs) num único request e snapshot"""
     try:
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
@@ -952,61 +609,149 @@ def get_logs():
         if not db:
             return jsonify({'error': 'Database indisponível'}), 500
         
-        # Busca usuários com suas etapas e status PIX
-        users_data = db.get_users_with_steps_and_pix(start_date, end_date, limit)
+        try:
+            panels = parse_panels(request.args.get('panels'))
+            since = decode_watermark(request.args['since']) if request.args.get('since') else None
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        logs = []
+        if since:
+            data = db.get_dashboard(panels, start_date, end_date, logs_limit=limit, since=since)
+        else:
+            data = dashboard_cache.get_or_compute(
+                'dashboard', start_date, end_date,
+                lambda: db.get_dashboard(panels, start_date, end_date, logs_limit=limit),
+                tuple(panels), limit,
+                ttl=dashboard_cache.open_ttl if 'logs' in panels else None)
         
-        for user in users_data:
-            # Nome completo do usuário
-            first_name = user.get('first_name') or 'Usuário'
-            last_name = user.get('last_name') or ''
-            full_name = f"{first_name} {last_name}".strip()
-            
-            # Determina tipo de usuário/interação
-            user_type = "Bot User"
-            if user.get('username'):
-                user_type = f"@{user.get('username')}"
-            
-            # Última etapa
-            last_step = "Etapa 1 (Boas-vindas)"  # Default
-            if user.get('last_step_name'):
-                step_num = user.get('last_step_number', 1)
-                step_desc = user.get('last_step_description') or user.get('last_step_name')
-                last_step = f"Etapa {step_num} ({step_desc})"
-            
-            # Status PIX
-            pix_status = "Não gerou PIX"
-            if user.get('pix_payment_status') == 'PAGO':
-                pix_status = "PAGO"
-            elif user.get('pix_payment_status') == 'PENDENTE':
-                pix_status = "PIX gerado"
-            
-            # Data da última atividade
-            last_activity = user.get('last_activity') or user.get('user_created_at')
-            
-            logs.append({
-                'date': last_activity.isoformat() if last_activity else None,
-                'full_name': full_name,
-                'user_type': user_type,
-                'last_step': last_step,
-                'pix_status': pix_status,
-                'telegram_id': user.get('telegram_id'),
-                'total_pix': user.get('total_pix', 0),
-                'total_paid': user.get('total_paid', 0),
-                'total_amount_paid': float(user.get('total_amount_paid', 0)) if user.get('total_amount_paid') else 0
-            })
+        logger.info(f"✅ Dashboard bundle: {', '.join(panels)}")
+        return jsonify(data)
+        
+    except DatabaseUnavailable:
+        raise
+    except Exception as e:
+        logger.error(f"❌ Erro em get_dashboard: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/events/stats', methods=['GET'])
+def dashboard_events_stats():
+    """Estatísticas do barramento de eventos da dashboard."""
+    if not events:
+        return jsonify({'success': False, 'error': 'Serviço indisponível (sem conexão com o banco de dados)'}), 503
+    return jsonify({'success': True, 'events': events.stats()})
+
+@app.route('/api/logs', methods=['GET'])
+@bulkhead.bulkhead('dashboard')
+def get_logs():
+    """Logs de membros/usuários com informações específicas para Dashboard"""
+    try:
+        start_date = request.args.get('start_date')
+        end_date = request.args.get('end_date')
+        limit = int(request.args.get('limit', 100))
+        cursor = request.args.get('cursor')
+        
+        if not db:
+            return jsonify({'error': 'Database indisponível'}), 500
         
-        # Ordena por data mais recente
-        logs.sort(key=lambda x: x['date'] or '', reverse=True)
+        try:
+            after = decode_cursor(cursor) if cursor else None
+            since = decode_watermark(request.args['since']) if request.args.get('since') else None
+        except InvalidCursor as e:
+            return jsonify({'error': str(e)}), 400
+        
+        if since:
+            # Delta-sync: só membros alterados desde a marca d'água (não passa pelo cache)
+            data = db.get_member_logs(start_date, end_date, since=since)
+        else:
+            # Listagem muda mesmo em períodos encerrados (atividade/pagamentos): sempre TTL curto
+            data = dashboard_cache.get_or_compute(
+                'logs', start_date, end_date,
+                lambda: db.get_member_logs(start_date, end_date, limit, after),
+                limit, cursor, ttl=dashboard_cache.open_ttl)
         
-        logger.info(f"✅ Dashboard logs membros: {len(logs)} usuários encontrados")
-        return jsonify({'logs': logs})
+        logger.info(f"✅ Dashboard logs membros: {len(data['logs'])} usuários encontrados")
+        return jsonify(data)
         
+    except DatabaseUnavailable:
+        raise
     except Exception as e:
         logger.error(f"❌ Erro em get_logs: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/export/<table>', methods=['GET'])
+@bulkhead.bulkhead('dashboard')
+def export_table(table):
+    """Exportação em streaming (?format=csv|ndjson&columns=a,b&start_date=&end_date=)"""
+    if not db:
+        return jsonify({'error': 'Database indisponível'}), 500
+    
+    try:
+        columns, fmt, start_date, end_date = exports.parse_request(table, request.args)
+    except exports.InvalidExport as e:
+        return jsonify({'error': str(e)}), 400
+    
+    logger.info(f"📤 Exportando {table} ({fmt}): {start_date or 'início'} - {end_date or 'hoje'}")
+    return Response(
+        stream_with_context(exports.stream_export(db.read_connection, table, columns, fmt, start_date, end_date)),
+        mimetype=exports.FORMATS[fmt],
+        headers={
+            'Content-Disposition': f'attachment; filename="{exports.filename(table, fmt, start_date, end_date)}"',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+#================= FECHAMENTO ======================
+
+#======== CICLO DE VIDA DOS WORKERS (gunicorn.conf.py) =============
+def before_fork():
+    """Master do gunicorn com preload_app: fecha conexões e threads antes dos forks"""
+    if events:
+        events.stop(timeout=10)
+    if webhook_inbox:
+        webhook_inbox.stop(timeout=10)
+    if conversions:
+        conversions.stop(timeout=10)
+    if rollup_refresher:
+        rollup_refresher.stop(timeout=10)
+    if db:
+        db.close()
+
+def after_fork():
+    """Cada worker abre seus próprios pools e threads (nada herdado do master)"""
+    if db:
+        db.after_fork()
+    if events:
+        events.start()
+    if conversions:
+        conversions.start()
+    if webhook_inbox:
+        webhook_inbox.start()
+    if rollup_refresher:
+        rollup_refresher.start()
+
+def warm_upstreams():
+    """Início do worker (modo sync): abre as conexões com TriboPay e Xtracky antes do primeiro checkout"""
+    upstream.warm_all()
+
+def shutdown():
+    """Worker encerrando, depois do drain dos requests em andamento"""
+    if events:
+        events.stop()
+    if webhook_inbox:
+        # Lotes interrompidos não se perdem: voltam a vencer quando o lease expirar
+        webhook_inbox.stop(timeout=10)
+    if conversions:
+        conversions.stop(timeout=10)
+    if rollup_refresher:
+        rollup_refresher.stop(timeout=10)
+    upstream.close_all()
+    if db:
+        db.close()
+
+async def async_app():
+    """Fábrica da aplicação aiohttp para o worker aiohttp.GunicornWebWorker (GATEWAY_MODE=async)"""
+    import async_gateway
+    return async_gateway.create_app(app, db, conversions, webhook_inbox)
 #================= FECHAMENTO ======================
 
 #======== EXECUÇÃO PRINCIPAL =============
@@ -1016,6 +761,12 @@ if __name__ == '__main__':
     else:
         logger.info("🚀 === API GATEWAY TRIBOPAY INICIANDO ===")
         logger.info(f"🌐 Escutando em http://0.0.0.0:{WEBHOOK_PORT}")
-        # Em um ambiente de produção real, use um servidor WSGI como Gunicorn ou uWSGI
-        app.run(host='0.0.0.0', port=WEBHOOK_PORT, debug=False)
+        if os.getenv('GATEWAY_MODE', 'sync') == 'async':
+            # Pagamento (TriboPay, Xtracky, banco) em I/O não bloqueante; demais rotas via Flask
+            import async_gateway
+            async_gateway.run(app, db, WEBHOOK_PORT, conversions, webhook_inbox)
+        else:
+            warm_upstreams()
+            # Em produção: gunicorn -c gunicorn.conf.py
+            app.run(host='0.0.0.0', port=WEBHOOK_PORT, debug=False)
 #================= FECHAMENTO ======================
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Migrações versionadas do schema PostgreSQL do API Gateway
+
+Uso:
+    python3 migrate.py status   # lista migrações aplicadas/pendentes
+    python3 migrate.py apply    # aplica as migrações pendentes em ordem
+
+Arquivos em migrations/ seguem o padrão NNNN_descricao.sql e são aplicados em
+ordem numérica, cada um em sua própria transação. Arquivos que começam com a
+linha `-- migrate:no-transaction` rodam em autocommit, um statement por vez
+(necessário para CREATE INDEX CONCURRENTLY, que não bloqueia escrita, e para
+backfills em lotes com COMMIT dentro de um bloco DO). Uma migração dessas que
+falhe no meio não é registrada e roda de novo inteira: precisa ser idempotente.
+"""
+
+import os
+import re
+import sys
+import logging
+from collections import namedtuple
+
+import psycopg2
+import psycopg2.errors
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+NO_TRANSACTION_MARKER = '-- migrate:no-transaction'
+MIGRATION_FILE_RE = re.compile(r'^(\d{4})_([a-z0-9_]+)\.sql$')
+DOLLAR_QUOTE_RE = re.compile(r'\$([A-Za-z_][A-Za-z0-9_]*)?\$')
+
+# Chave do advisory lock que serializa execuções concorrentes do `apply`
+MIGRATION_LOCK_KEY = 720150001
+
+Migration = namedtuple('Migration', ['version', 'name', 'path', 'transactional'])
+
+
+def discover_migrations(directory=MIGRATIONS_DIR):
+    """Lista as migrações disponíveis em ordem de versão"""
+    migrations = []
+    for filename in sorted(os.listdir(directory)):
+        match = MIGRATION_FILE_RE.match(filename)
+        if not match:
+            continue
+        path = os.path.join(directory, filename)
+        with open(path, encoding='utf-8') as f:
+            first_line = f.readline().strip()
+        migrations.append(Migration(
+            version=int(match.group(1)),
+            name=match.group(2),
+            path=path,
+            transactional=first_line != NO_TRANSACTION_MARKER
+        ))
+
+    versions = [m.version for m in migrations]
+    if len(versions) != len(set(versions)):
+        raise ValueError(f"Versões de migração duplicadas em {directory}")
+    return migrations
+
+
+def applied_versions(conn):
+    """Versões já aplicadas (uma única query; tabela ausente = nenhuma)"""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT version FROM schema_migrations")
+        return {row[0] for row in cursor.fetchall()}
+    except psycopg2.errors.UndefinedTable:
+        conn.rollback()
+        return set()
+
+
+def pending_migrations(conn, migrations=None):
+    """Migrações disponíveis que ainda não foram aplicadas"""
+    migrations = migrations if migrations is not None else discover_migrations()
+    applied = applied_versions(conn)
+    return [m for m in migrations if m.version not in applied]
+
+
+def split_statements(sql):
+    """Separa os statements para execução em autocommit (corpos $$...$$ ficam inteiros)"""
+    lines = [line for line in sql.splitlines() if not line.strip().startswith('--')]
+    text = '\n'.join(lines)
+
+    statements, start, pos = [], 0, 0
+    while True:
+        semicolon = text.find(';', pos)
+        quote = DOLLAR_QUOTE_RE.search(text, pos)
+        if quote and (semicolon == -1 or quote.start() < semicolon):
+            # ';' dentro de uma função/DO não encerra o statement
+            end = text.find(quote.group(0), quote.end())
+            if end == -1:
+                raise ValueError(f"Bloco {quote.group(0)} sem fechamento")
+            pos = end + len(quote.group(0))
+            continue
+        if semicolon == -1:
+            break
+        statements.append(text[start:semicolon])
+        start = pos = semicolon + 1
+    statements.append(text[start:])
+    return [stmt.strip() for stmt in statements if stmt.strip()]
+
+
+def _ensure_migrations_table(conn):
+    cursor = conn.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def _record(cursor, migration):
+    cursor.execute(
+        "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+        (migration.version, migration.name)
+    )
+
+
+def apply_migration(conn, migration):
+    """Aplica uma migração e registra sua versão"""
+    with open(migration.path, encoding='utf-8') as f:
+        sql = f.read()
+
+    if migration.transactional:
+        conn.autocommit = False
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql)
+            _record(cursor, migration)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    else:
+        # CREATE INDEX CONCURRENTLY não pode rodar dentro de transação.
+        # Se um build concorrente falhar, o índice fica INVALID: remova-o com
+        # DROP INDEX CONCURRENTLY antes de rodar o apply novamente.
+        conn.autocommit = True
+        try:
+            cursor = conn.cursor()
+            for statement in split_statements(sql):
+                cursor.execute(statement)
+            _record(cursor, migration)
+        finally:
+            conn.autocommit = False
+
+
+def apply_pending(conn, migrations=None):
+    """Aplica todas as migrações pendentes em ordem. Retorna as aplicadas."""
+    conn.autocommit = True
+    cursor = conn.cursor()
+    cursor.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_KEY,))
+    try:
+        _ensure_migrations_table(conn)
+        applied = []
+        for migration in pending_migrations(conn, migrations):
+            logger.info(f"⏳ Aplicando migração {migration.version:04d}_{migration.name}...")
+            apply_migration(conn, migration)
+            applied.append(migration)
+            logger.info(f"✅ Migração {migration.version:04d}_{migration.name} aplicada")
+        return applied
+    finally:
+        conn.autocommit = True
+        conn.cursor().execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_KEY,))
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    command = argv[0] if argv else 'status'
+    if command not in ('status', 'apply'):
+        print(__doc__)
+        return 2
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    database_url = os.getenv('DATABASE_URL')
+    if not database_url:
+        logger.error("❌ DATABASE_URL não configurado!")
+        return 1
+
+    conn = psycopg2.connect(database_url, sslmode=os.getenv('DATABASE_SSLMODE', 'require'))
+    try:
+        migrations = discover_migrations()
+        if command == 'status':
+            applied = applied_versions(conn)
+            for m in migrations:
+                mark = 'aplicada' if m.version in applied else 'PENDENTE'
+                print(f"{m.version:04d}_{m.name}: {mark}")
+            return 0
+
+        applied = apply_pending(conn, migrations)
+        if applied:
+            logger.info(f"✅ {len(applied)} migração(ões) aplicada(s). "
+                        "Serviços em execução: POST /api/db/capabilities para reler o schema.")
+        else:
+            logger.info("✅ Schema já está atualizado")
+        return 0
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,90 @@
+-- Schema base do API Gateway (antigo DatabaseManager.init_tables)
+-- Idempotente: bancos que já rodavam o init_tables apenas registram a versão.
+
+-- Tabela de usuários do bot
+CREATE TABLE IF NOT EXISTS bot_users (
+    id SERIAL PRIMARY KEY,
+    telegram_id BIGINT UNIQUE NOT NULL,
+    username VARCHAR(255),
+    first_name VARCHAR(255),
+    last_name VARCHAR(255),
+    click_id VARCHAR(255),
+    utm_source TEXT,
+    utm_medium VARCHAR(255),
+    utm_campaign VARCHAR(255),
+    utm_term VARCHAR(255),
+    utm_content VARCHAR(255),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Tabela de transações PIX
+CREATE TABLE IF NOT EXISTS pix_transactions (
+    id SERIAL PRIMARY KEY,
+    transaction_id VARCHAR(255) UNIQUE NOT NULL,
+    telegram_id BIGINT NOT NULL,
+    amount DECIMAL(10,2) NOT NULL,
+    plano_id VARCHAR(100),
+    status VARCHAR(50) DEFAULT 'pending',
+    pix_code TEXT,
+    qr_code TEXT,
+    click_id VARCHAR(255),
+    utm_source TEXT,
+    utm_medium VARCHAR(255),
+    utm_campaign VARCHAR(255),
+    utm_term VARCHAR(255),
+    utm_content VARCHAR(255),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (telegram_id) REFERENCES bot_users(telegram_id)
+);
+
+-- Bancos antigos criaram pix_transactions sem plano_id
+ALTER TABLE pix_transactions ADD COLUMN IF NOT EXISTS plano_id VARCHAR(100);
+
+-- Tabela de mapeamento de tracking IDs
+CREATE TABLE IF NOT EXISTS tracking_mapping (
+    id SERIAL PRIMARY KEY,
+    safe_id VARCHAR(50) UNIQUE NOT NULL,
+    original_data TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    accessed_at TIMESTAMP
+);
+
+-- Tabela de logs de conversões
+CREATE TABLE IF NOT EXISTS conversion_logs (
+    id SERIAL PRIMARY KEY,
+    transaction_id VARCHAR(255),
+    click_id VARCHAR(255),
+    utm_source TEXT,
+    utm_campaign VARCHAR(255),
+    conversion_value DECIMAL(10,2),
+    status VARCHAR(50),
+    xtracky_response TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Tabela de cache de produtos TriboPay
+CREATE TABLE IF NOT EXISTS tribopay_products_cache (
+    id SERIAL PRIMARY KEY,
+    cache_key VARCHAR(100) UNIQUE NOT NULL,
+    product_hash VARCHAR(255) NOT NULL,
+    plano VARCHAR(50),
+    valor DECIMAL(10,2),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Tabela de etapas dos usuários para dashboard logs
+CREATE TABLE IF NOT EXISTS user_steps (
+    id SERIAL PRIMARY KEY,
+    telegram_id BIGINT NOT NULL,
+    step_name VARCHAR(100) NOT NULL,
+    step_number INTEGER NOT NULL,
+    step_description TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (telegram_id) REFERENCES bot_users(telegram_id)
+);
+
+-- Índice para performance na busca de última etapa
+CREATE INDEX IF NOT EXISTS idx_user_steps_telegram_created
+ON user_steps(telegram_id, created_at DESC);
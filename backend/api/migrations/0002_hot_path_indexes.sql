@@ -0,0 +1,38 @@
+-- migrate:no-transaction
+-- Índices dos caminhos quentes (CONCURRENTLY: não bloqueia escrita em produção)
+
+-- get_active_pix / record_generated_pix: PIX em aberto por usuário e plano
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_pix_transactions_open
+ON pix_transactions (telegram_id, plano_id, created_at DESC)
+WHERE status IN ('pending', 'waiting_payment');
+
+-- Conciliação de conversões por click_id
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_pix_transactions_click_id
+ON pix_transactions (click_id)
+WHERE click_id IS NOT NULL;
+
+-- Dashboard: contagens/agregados por período (status muda via webhook, então btree)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_pix_transactions_created
+ON pix_transactions (created_at);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_pix_transactions_paid_created
+ON pix_transactions (created_at)
+WHERE status = 'paid';
+
+-- get_latest_tracking (ORDER BY created_at DESC LIMIT 1) e contagens da presell
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tracking_mapping_created
+ON tracking_mapping (created_at DESC);
+
+-- bot_users recebe upsert a cada /start: btree em created_at e na última atividade
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_bot_users_created
+ON bot_users (created_at);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_bot_users_last_activity
+ON bot_users ((COALESCE(updated_at, created_at)) DESC);
+
+-- Tabelas append-only: BRIN em created_at (ordem física acompanha o tempo, índice minúsculo)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS brin_conversion_logs_created
+ON conversion_logs USING BRIN (created_at);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS brin_user_steps_created
+ON user_steps USING BRIN (created_at);
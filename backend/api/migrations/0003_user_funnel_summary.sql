@@ -0,0 +1,162 @@
+-- migrate:no-transaction
+-- Resumo por usuário do funil (última etapa, PIX gerados/pagos) para /api/logs
+-- Mantido por triggers em user_steps e pix_transactions: a leitura não agrega histórico.
+--
+-- Sem LOCK TABLE nas tabelas de pagamento: os triggers entram primeiro (cada
+-- CREATE TRIGGER em autocommit, trava só o instante da criação) e o histórico
+-- é recalculado depois, em lotes com COMMIT, com os triggers já ativos.
+-- Todos os passos são idempotentes: se o preDeploy cair no meio, o apply roda
+-- a migração de novo.
+
+CREATE TABLE IF NOT EXISTS user_funnel_summary (
+    telegram_id BIGINT PRIMARY KEY,
+    last_step_name VARCHAR(100),
+    last_step_number INTEGER,
+    last_step_description TEXT,
+    last_step_at TIMESTAMP,
+    total_pix INTEGER NOT NULL DEFAULT 0,
+    total_paid INTEGER NOT NULL DEFAULT 0,
+    total_amount_paid DECIMAL(12,2) NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (telegram_id) REFERENCES bot_users(telegram_id)
+);
+
+-- Nova etapa: substitui a última etapa se for mais recente
+CREATE OR REPLACE FUNCTION user_funnel_summary_on_step() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO user_funnel_summary
+        (telegram_id, last_step_name, last_step_number, last_step_description, last_step_at)
+    VALUES (NEW.telegram_id, NEW.step_name, NEW.step_number, NEW.step_description, NEW.created_at)
+    ON CONFLICT (telegram_id) DO UPDATE SET
+        last_step_name = EXCLUDED.last_step_name,
+        last_step_number = EXCLUDED.last_step_number,
+        last_step_description = EXCLUDED.last_step_description,
+        last_step_at = EXCLUDED.last_step_at,
+        updated_at = CURRENT_TIMESTAMP
+    WHERE user_funnel_summary.last_step_at IS NULL
+       OR user_funnel_summary.last_step_at <= EXCLUDED.last_step_at;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- PIX inserido/removido ou mudança de status: aplica o delta nos contadores
+CREATE OR REPLACE FUNCTION user_funnel_summary_on_pix() RETURNS trigger AS $$
+DECLARE
+    v_telegram_id BIGINT;
+    pix_delta INTEGER := 0;
+    paid_delta INTEGER := 0;
+    amount_delta DECIMAL(12,2) := 0;
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.status = 'paid' THEN
+        paid_delta := paid_delta - 1;
+        amount_delta := amount_delta - OLD.amount;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.status = 'paid' THEN
+        paid_delta := paid_delta + 1;
+        amount_delta := amount_delta + NEW.amount;
+    END IF;
+
+    IF TG_OP = 'INSERT' THEN
+        pix_delta := 1;
+        v_telegram_id := NEW.telegram_id;
+    ELSIF TG_OP = 'DELETE' THEN
+        pix_delta := -1;
+        v_telegram_id := OLD.telegram_id;
+    ELSE
+        v_telegram_id := NEW.telegram_id;
+    END IF;
+
+    IF pix_delta = 0 AND paid_delta = 0 AND amount_delta = 0 THEN
+        RETURN NULL;
+    END IF;
+
+    INSERT INTO user_funnel_summary (telegram_id, total_pix, total_paid, total_amount_paid)
+    VALUES (v_telegram_id, pix_delta, paid_delta, amount_delta)
+    ON CONFLICT (telegram_id) DO UPDATE SET
+        total_pix = user_funnel_summary.total_pix + EXCLUDED.total_pix,
+        total_paid = user_funnel_summary.total_paid + EXCLUDED.total_paid,
+        total_amount_paid = user_funnel_summary.total_amount_paid + EXCLUDED.total_amount_paid,
+        updated_at = CURRENT_TIMESTAMP;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Numa nova execução, eventos entre o DROP e o CREATE são corrigidos pelo catch-up
+DROP TRIGGER IF EXISTS trg_user_steps_funnel_summary ON user_steps;
+CREATE TRIGGER trg_user_steps_funnel_summary
+AFTER INSERT ON user_steps
+FOR EACH ROW EXECUTE FUNCTION user_funnel_summary_on_step();
+
+DROP TRIGGER IF EXISTS trg_pix_transactions_funnel_summary ON pix_transactions;
+CREATE TRIGGER trg_pix_transactions_funnel_summary
+AFTER INSERT OR DELETE OR UPDATE OF status, amount ON pix_transactions
+FOR EACH ROW EXECUTE FUNCTION user_funnel_summary_on_pix();
+
+-- Recálculo por usuário (PIX do usuário, sem varrer a tabela a cada lote)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_pix_transactions_telegram
+ON pix_transactions (telegram_id);
+
+-- Catch-up do histórico em lotes de usuários. Cada lote trava só as próprias
+-- linhas do resumo: um PIX/etapa em andamento termina antes (e entra no
+-- recálculo) ou espera o lote e aplica o delta por cima. O recálculo é um
+-- statement separado da trava para ler o histórico com um snapshot tirado
+-- depois dela. Valores absolutos: rodar de novo não duplica contadores.
+DO $$
+DECLARE
+    batch_size CONSTANT INTEGER := 1000;
+    last_telegram_id BIGINT;
+    batch BIGINT[];
+BEGIN
+    SELECT MIN(telegram_id) - 1 INTO last_telegram_id FROM bot_users;
+    LOOP
+        SELECT array_agg(telegram_id ORDER BY telegram_id) INTO batch
+        FROM (
+            SELECT telegram_id FROM bot_users
+            WHERE telegram_id > last_telegram_id
+            ORDER BY telegram_id
+            LIMIT batch_size
+        ) page;
+        EXIT WHEN batch IS NULL;
+        last_telegram_id := batch[array_length(batch, 1)];
+
+        INSERT INTO user_funnel_summary (telegram_id)
+        SELECT b.telegram_id FROM unnest(batch) AS b(telegram_id)
+        WHERE EXISTS (SELECT 1 FROM user_steps s WHERE s.telegram_id = b.telegram_id)
+           OR EXISTS (SELECT 1 FROM pix_transactions p WHERE p.telegram_id = b.telegram_id)
+        ON CONFLICT (telegram_id) DO NOTHING;
+
+        PERFORM 1 FROM user_funnel_summary
+        WHERE telegram_id = ANY(batch)
+        ORDER BY telegram_id
+        FOR UPDATE;
+
+        UPDATE user_funnel_summary f SET
+            last_step_name = last_step.step_name,
+            last_step_number = last_step.step_number,
+            last_step_description = last_step.step_description,
+            last_step_at = last_step.created_at,
+            total_pix = pix.total_pix,
+            total_paid = pix.total_paid,
+            total_amount_paid = pix.total_amount_paid
+        FROM unnest(batch) AS b(telegram_id)
+        LEFT JOIN LATERAL (
+            SELECT step_name, step_number, step_description, created_at
+            FROM user_steps
+            WHERE telegram_id = b.telegram_id
+            ORDER BY created_at DESC
+            LIMIT 1
+        ) last_step ON TRUE
+        CROSS JOIN LATERAL (
+            SELECT
+                COUNT(*) AS total_pix,
+                COUNT(*) FILTER (WHERE status = 'paid') AS total_paid,
+                COALESCE(SUM(amount) FILTER (WHERE status = 'paid'), 0) AS total_amount_paid
+            FROM pix_transactions
+            WHERE telegram_id = b.telegram_id
+        ) pix
+        WHERE f.telegram_id = b.telegram_id;
+
+        COMMIT;
+    END LOOP;
+END
+$$;
@@ -0,0 +1,18 @@
+-- migrate:no-transaction
+-- Índices para paginação por keyset de /api/logs: (chave de ordenação, id)
+
+-- Gateway: membros por última atividade (substitui idx_bot_users_last_activity)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_bot_users_activity_id
+ON bot_users ((COALESCE(updated_at, created_at)) DESC, id DESC);
+
+DROP INDEX CONCURRENTLY IF EXISTS idx_bot_users_last_activity;
+
+-- Dashboard API: logs de PIX e de conversões por (created_at, id)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_pix_transactions_created_id
+ON pix_transactions (created_at DESC, id DESC);
+
+-- Também atende os filtros por período: o índice só em created_at fica redundante
+DROP INDEX CONCURRENTLY IF EXISTS idx_pix_transactions_created;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_conversion_logs_created_id
+ON conversion_logs (created_at DESC, id DESC);
@@ -0,0 +1,13 @@
+-- Rollup diário do funil (dia de negócio, America/Sao_Paulo) para /api/overview e /api/sales
+-- Dias fechados (is_closed) ficam congelados; dias abertos são recalculados sob demanda.
+CREATE TABLE IF NOT EXISTS daily_funnel_stats (
+    day DATE PRIMARY KEY,
+    presell_entries INTEGER NOT NULL DEFAULT 0,
+    bot_starts INTEGER NOT NULL DEFAULT 0,
+    pix_generated INTEGER NOT NULL DEFAULT 0,
+    pix_paid INTEGER NOT NULL DEFAULT 0,
+    revenue DECIMAL(14,2) NOT NULL DEFAULT 0,
+    conversions INTEGER NOT NULL DEFAULT 0,
+    is_closed BOOLEAN NOT NULL DEFAULT FALSE,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
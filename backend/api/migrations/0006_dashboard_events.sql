@@ -0,0 +1,52 @@
+-- Eventos ao vivo da dashboard (GET /api/events) via LISTEN/NOTIFY no canal dashboard_events
+-- NOTIFY é transacional: o evento só é entregue se a escrita for confirmada.
+
+-- Novo /start no bot
+CREATE OR REPLACE FUNCTION dashboard_events_on_user() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('dashboard_events', json_build_object(
+        'type', 'start',
+        'telegram_id', NEW.telegram_id,
+        'first_name', NEW.first_name,
+        'last_name', NEW.last_name,
+        'username', NEW.username,
+        'created_at', NEW.created_at
+    )::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- PIX gerado (INSERT) ou pago (status passa a 'paid')
+CREATE OR REPLACE FUNCTION dashboard_events_on_pix() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM pg_notify('dashboard_events', json_build_object(
+            'type', 'pix_generated',
+            'telegram_id', NEW.telegram_id,
+            'transaction_id', NEW.transaction_id,
+            'amount', NEW.amount,
+            'created_at', NEW.created_at
+        )::text);
+    END IF;
+    IF NEW.status = 'paid' AND (TG_OP = 'INSERT' OR OLD.status IS DISTINCT FROM 'paid') THEN
+        PERFORM pg_notify('dashboard_events', json_build_object(
+            'type', 'pix_paid',
+            'telegram_id', NEW.telegram_id,
+            'transaction_id', NEW.transaction_id,
+            'amount', NEW.amount,
+            'created_at', NEW.created_at
+        )::text);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_bot_users_dashboard_events ON bot_users;
+CREATE TRIGGER trg_bot_users_dashboard_events
+    AFTER INSERT ON bot_users
+    FOR EACH ROW EXECUTE FUNCTION dashboard_events_on_user();
+
+DROP TRIGGER IF EXISTS trg_pix_transactions_dashboard_events ON pix_transactions;
+CREATE TRIGGER trg_pix_transactions_dashboard_events
+    AFTER INSERT OR UPDATE OF status ON pix_transactions
+    FOR EACH ROW EXECUTE FUNCTION dashboard_events_on_pix();
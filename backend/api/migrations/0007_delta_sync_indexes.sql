@@ -0,0 +1,10 @@
+-- migrate:no-transaction
+-- Delta-sync (?since=) de /api/logs e /api/sales: linhas alteradas depois da marca d'água
+
+-- Membros cujo resumo (etapa/PIX) mudou; bot_users já tem idx_bot_users_activity_id
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_user_funnel_summary_updated
+ON user_funnel_summary (updated_at);
+
+-- Dias do rollup recalculados com valores novos
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_daily_funnel_stats_updated
+ON daily_funnel_stats (updated_at);
@@ -0,0 +1,21 @@
+-- Outbox das conversões da Xtracky (outbox.py)
+-- O webhook grava a linha na mesma transação que marca o PIX como pago; o
+-- dispatcher entrega em segundo plano, com novas tentativas e backoff.
+
+CREATE TABLE IF NOT EXISTS conversion_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    -- Uma conversão por transação: webhooks repetidos da TriboPay não duplicam o envio
+    transaction_id VARCHAR(255) UNIQUE NOT NULL,
+    -- pending -> sent | failed (desistiu ou recusada) | skipped (sem click_id)
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    -- Próxima tentativa; ao ser reservada pelo dispatcher avança pelo lease
+    next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Fila do dispatcher: só as linhas pendentes, na ordem de vencimento
+CREATE INDEX IF NOT EXISTS idx_conversion_outbox_due
+ON conversion_outbox (next_attempt_at) WHERE status = 'pending';
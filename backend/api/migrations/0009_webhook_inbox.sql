@@ -0,0 +1,32 @@
+-- Inbox dos webhooks da TriboPay (inbox.py, WEBHOOK_MODE=inbox)
+-- O endpoint só grava o corpo recebido e responde; workers aplicam as
+-- notificações em ordem por transação. O payload nunca é alterado nem
+-- apagado, então o inbox pode ser reprocessado depois de uma correção
+-- (python3 inbox.py replay).
+
+CREATE TABLE IF NOT EXISTS webhook_inbox (
+    id BIGSERIAL PRIMARY KEY,
+    -- Chave de ordenação extraída no recebimento (NULL se o corpo não tiver id)
+    transaction_id VARCHAR(255),
+    payload TEXT NOT NULL,
+    received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    -- pending -> processed | ignored (sem transação) | failed (desistiu)
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    -- Próxima tentativa; ao ser reservada por um worker avança pelo lease
+    next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_error TEXT,
+    processed_at TIMESTAMP
+);
+
+-- Fila dos workers: entrada pendente mais antiga de cada transação
+CREATE INDEX IF NOT EXISTS idx_webhook_inbox_pending
+ON webhook_inbox ((COALESCE(transaction_id, id::text)), id) WHERE status = 'pending';
+
+-- Replay por transação (e das entradas seguintes da mesma transação)
+CREATE INDEX IF NOT EXISTS idx_webhook_inbox_transaction
+ON webhook_inbox (transaction_id, id);
+
+-- Replay por período
+CREATE INDEX IF NOT EXISTS brin_webhook_inbox_received
+ON webhook_inbox USING BRIN (received_at);
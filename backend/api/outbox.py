@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Entrega das conversões da Xtracky pelo outbox (tabela conversion_outbox)
+
+O webhook da TriboPay só grava a conversão no outbox, na mesma transação que
+marca o PIX como pago (database.pix_update_statement) - a resposta ao webhook
+não espera a Xtracky e um POST que falha não se perde. Uma thread por processo
+drena o outbox:
+- reserva lotes de até `batch_size` conversões vencidas (SKIP LOCKED: vários
+  workers do gunicorn drenam em paralelo sem enviar a mesma conversão);
+- envia até `concurrency` conversões ao mesmo tempo pela sessão keep-alive da
+  Xtracky (upstream.py);
+- falhas temporárias (rede, timeout, 408/429/5xx) voltam para a fila com
+  backoff exponencial; depois de `max_attempts`, ou numa recusa 4xx, a
+  conversão é dada como 'failed';
+- grava o resultado do lote numa transação: estado no outbox e o registro
+  em conversion_logs (enviadas e falhas definitivas).
+
+O laço de lotes/backoff fica em QueueDrainer, reaproveitado pelo inbox de
+webhooks (inbox.py).
+"""
+
+import os
+import random
+import logging
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import tribopay
+import upstream
+from circuit_breaker import DatabaseUnavailable
+
+logger = logging.getLogger(__name__)
+
+# Respostas da Xtracky que valem nova tentativa (as demais 4xx não mudam repetindo)
+RETRYABLE_STATUSES = {408, 425, 429}
+
+
+class QueueDrainer(ABC):
+    """Thread que drena uma tabela-fila em lotes (base do outbox e do inbox de webhooks).
+
+    Subclasses implementam `claim(limit)` (reserva linhas vencidas, com lease),
+    `process(row)` (devolve um dict com 'status'; 'pending' = nova tentativa) e
+    `finish(outcomes)` (grava o lote numa transação). Até `concurrency` linhas
+    de um lote são processadas ao mesmo tempo.
+    """
+
+    OUTCOMES = ()
+
+    def __init__(self, batch_size=50, concurrency=4, interval=2.0, max_attempts=8,
+                 base_delay=5.0, max_delay=3600.0, lease=300.0, name='queue-drainer'):
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.interval = interval
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lease = lease
+        self.name = name
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._stats = {'batches': 0, 'retried': 0, 'errors': 0, **{outcome: 0 for outcome in self.OUTCOMES}}
+
+    def start(self):
+        """Inicia (ou reinicia, ex.: após fork) a thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Para a thread; com `timeout`, espera o lote em andamento terminar"""
+        self._stopped.set()
+        self._wakeup.set()
+        if timeout is not None and self._thread:
+            self._thread.join(timeout)
+
+    def wake(self):
+        """Linha nova na fila: drena agora em vez de esperar o próximo ciclo"""
+        self._wakeup.set()
+
+    def backoff(self, attempts):
+        """Segundos até a próxima tentativa: exponencial com jitter, limitado a `max_delay`"""
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    @abstractmethod
+    def claim(self, limit):
+        """Reserva até `limit` linhas vencidas (com lease) e as retorna"""
+
+    @abstractmethod
+    def process(self, row):
+        """Processa uma linha reservada e devolve o resultado (dict com 'status')"""
+
+    @abstractmethod
+    def finish(self, outcomes):
+        """Grava os resultados do lote numa transação"""
+
+    def drain_once(self, executor):
+        """Reserva, processa e grava um lote. Retorna quantas linhas foram processadas."""
+        rows = self.claim(self.batch_size)
+        if not rows:
+            return 0
+        outcomes = list(executor.map(self.process, rows))
+        self.finish(outcomes)
+
+        with self._lock:
+            self._stats['batches'] += 1
+            for outcome in outcomes:
+                key = 'retried' if outcome['status'] == 'pending' else outcome['status']
+                self._stats[key] += 1
+        return len(rows)
+
+    def _run(self):
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix=self.name) as executor:
+            while not self._stopped.is_set():
+                try:
+                    # Lote cheio: provavelmente há mais vencidas, segue sem esperar
+                    if self.drain_once(executor) == self.batch_size:
+                        continue
+                except DatabaseUnavailable as e:
+                    logger.warning(f"⚠️ {self.name} aguardando o banco: {e}")
+                except Exception as e:
+                    # Lote reservado e não gravado volta a vencer quando o lease expirar
+                    with self._lock:
+                        self._stats['errors'] += 1
+                    logger.error(f"❌ Erro drenando {self.name}: {e}")
+                self._wakeup.wait(self.interval)
+                self._wakeup.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update({
+            'running': bool(self._thread and self._thread.is_alive()),
+            'batch_size': self.batch_size,
+            'concurrency': self.concurrency,
+            'max_attempts': self.max_attempts
+        })
+        return stats
+
+
+class ConversionDispatcher(QueueDrainer):
+    """Drena o outbox de conversões (conversion_outbox) enviando para a Xtracky"""
+
+    OUTCOMES = ('sent', 'failed', 'skipped')
+
+    def __init__(self, db, name='conversion-outbox', **kwargs):
+        super().__init__(name=name, **kwargs)
+        self.db = db
+
+    def claim(self, limit):
+        return self.db.claim_conversions(limit, self.lease)
+
+    def finish(self, outcomes):
+        self.db.finish_conversions(outcomes)
+
+    def process(self, row):
+        """Envia uma conversão reservada e devolve o resultado para finish_conversions"""
+        transaction_id = row['transaction_id']
+        outcome = {'id': row['id'], 'status': 'pending', 'retry_in': 0, 'error': None, 'log': None}
+        if row['amount'] is None:
+            logger.error(f"❌ Transação {transaction_id} não encontrada - conversão descartada")
+            outcome.update(status='skipped', error='transação não encontrada')
+            return outcome
+
+        conversion_data = tribopay.conversion_payload(transaction_id, row)
+        if not conversion_data:
+            outcome.update(status='skipped', error='sem click_id')
+            return outcome
+
+        def log(status, response):
+            return (transaction_id, conversion_data['click_id'], row['utm_source'], row['utm_campaign'],
+                    row['amount'], status, response)
+
+        try:
+            response = upstream.get('xtracky').post(tribopay.XTRACKY_URL, json=conversion_data)
+        except requests.exceptions.RequestException as e:
+            error, retryable, body = str(e), True, None
+        else:
+            if response.status_code == 200:
+                logger.info(f"✅ Conversão enviada para Xtracky: {conversion_data['click_id']} - R$ {row['amount']}")
+                outcome.update(status='sent', log=log('sent', response.text))
+                return outcome
+            error = f"HTTP {response.status_code}"
+            retryable = response.status_code >= 500 or response.status_code in RETRYABLE_STATUSES
+            body = response.text
+
+        if retryable and row['attempts'] < self.max_attempts:
+            retry_in = self.backoff(row['attempts'])
+            logger.warning(f"⚠️ Conversão {transaction_id} falhou ({error}), tentativa {row['attempts']}/"
+                           f"{self.max_attempts} - nova tentativa em {retry_in:.0f}s")
+            outcome.update(retry_in=retry_in, error=error)
+        else:
+            logger.error(f"❌ Erro ao enviar conversão para Xtracky: {transaction_id} - {error} - {body}")
+            outcome.update(status='failed', error=error, log=log('failed', body or error))
+        return outcome
+
+
+def create_dispatcher(db):
+    """Dispatcher do processo, configurado por OUTBOX_* e já iniciado"""
+    dispatcher = ConversionDispatcher(
+        db,
+        batch_size=int(os.getenv('OUTBOX_BATCH_SIZE', '50')),
+        concurrency=int(os.getenv('OUTBOX_CONCURRENCY', '4')),
+        interval=float(os.getenv('OUTBOX_POLL_INTERVAL', '2')),
+        max_attempts=int(os.getenv('OUTBOX_MAX_ATTEMPTS', '8')),
+        base_delay=float(os.getenv('OUTBOX_BACKOFF_BASE', '5')),
+        max_delay=float(os.getenv('OUTBOX_BACKOFF_MAX', '3600')),
+        lease=float(os.getenv('OUTBOX_LEASE_SECONDS', '300'))
+    )
+    dispatcher.start()
+    return dispatcher
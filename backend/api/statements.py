@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Registro de prepared statements (PREPARE/EXECUTE) por conexão
+
+As queries mais quentes do gateway (get_user, get_active_pix, webhook...) são
+sempre as mesmas. Com as conexões persistentes do pool, cada uma é preparada
+uma única vez por conexão (parse/plan fora do caminho quente) e depois só
+executada por nome. O SQL continua escrito com placeholders %s, como no resto
+do código; o registro converte para $1..$n no PREPARE.
+
+Prepared statements vivem na sessão: não sobrevivem a uma conexão nova e não
+funcionam atrás de um pooler em modo transação (PgBouncer) - nesse caso
+desligue com DB_PREPARED_STATEMENTS=0.
+"""
+
+import re
+import logging
+import threading
+import weakref
+
+logger = logging.getLogger(__name__)
+
+_PLACEHOLDER = re.compile(r'%s')
+_NAME = re.compile(r'^[a-z_][a-z0-9_]*$')
+
+# "cached plan must not change result type": uma migração mudou as colunas de
+# uma tabela lida pelo statement; ele precisa ser preparado de novo
+FEATURE_NOT_SUPPORTED = '0A000'
+
+
+def numbered(sql):
+    """Troca os placeholders %s por $1..$n (sintaxe do PREPARE e do asyncpg)"""
+    counter = iter(range(1, sql.count('%s') + 1))
+    return _PLACEHOLDER.sub(lambda _: f'${next(counter)}', sql)
+
+
+class Statement:
+    __slots__ = ('name', 'sql', 'prepare_sql', 'execute_sql')
+
+    def __init__(self, name, sql):
+        if not _NAME.match(name):
+            raise ValueError(f"Nome de prepared statement inválido: {name}")
+        if '%(' in sql or '%%' in sql:
+            raise ValueError(f"{name}: use apenas placeholders posicionais %s")
+
+        self.name = name
+        self.sql = sql
+        self.prepare_sql = f"PREPARE {name} AS {numbered(sql)}"
+        params = sql.count('%s')
+        self.execute_sql = f"EXECUTE {name} ({', '.join(['%s'] * params)})" if params else f"EXECUTE {name}"
+
+
+class StatementRegistry:
+    """Prepara cada statement nomeado na primeira execução em cada conexão"""
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._statements = {}
+        # conexão -> nomes já preparados nela (some junto com a conexão)
+        self._prepared = weakref.WeakKeyDictionary()
+        # conexão -> nomes a descartar (DEALLOCATE) antes do próximo PREPARE
+        self._stale = weakref.WeakKeyDictionary()
+        self._stats = {'prepares': 0, 'executions': 0, 'replans': 0}
+
+    def _statement(self, name, sql):
+        with self._lock:
+            statement = self._statements.get(name)
+            if statement is None:
+                statement = self._statements[name] = Statement(name, sql)
+            elif statement.sql != sql:
+                raise ValueError(f"Prepared statement '{name}' registrado com outro SQL")
+            return statement
+
+    def execute(self, cursor, name, sql, params=()):
+        """Executa `sql` (placeholders %s) como o prepared statement `name`"""
+        if not self.enabled:
+            cursor.execute(sql, params)
+            return cursor
+
+        statement = self._statement(name, sql)
+        conn = cursor.connection
+        with self._lock:
+            prepared = self._prepared.setdefault(conn, set())
+            stale = self._stale.setdefault(conn, set())
+            needs_prepare = name not in prepared
+
+        if needs_prepare:
+            if name in stale:
+                cursor.execute(f"DEALLOCATE {name}")
+                stale.discard(name)
+            # PREPARE não é transacional: continua valendo mesmo se a transação
+            # atual for desfeita depois
+            cursor.execute(statement.prepare_sql)
+            with self._lock:
+                prepared.add(name)
+                self._stats['prepares'] += 1
+
+        try:
+            cursor.execute(statement.execute_sql, params)
+        except Exception as e:
+            if getattr(e, 'pgcode', None) == FEATURE_NOT_SUPPORTED:
+                # A transação já abortou: prepara de novo na próxima chamada
+                logger.warning(f"⚠️ Prepared statement '{name}' invalidado pelo schema; será preparado de novo")
+                with self._lock:
+                    prepared.discard(name)
+                    stale.add(name)
+                    self._stats['replans'] += 1
+            raise
+        with self._lock:
+            self._stats['executions'] += 1
+        return cursor
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+            data['statements'] = sorted(self._statements)
+            data['connections'] = len(self._prepared)
+        data['enabled'] = self.enabled
+        return data
@@ -0,0 +1,27 @@
+"""
+Configuração dos testes do API Gateway (python -m pytest, a partir de backend/api)
+
+Os módulos do gateway são planos (import bulkhead, import database...), então a
+pasta do serviço entra no sys.path, junto com backend/shared (no deploy o pacote
+é instalado pelo requirements.txt). Testes que precisam de um PostgreSQL real usam a
+fixture `pg_url` e são pulados sem TEST_DATABASE_URL.
+"""
+
+import os
+import sys
+
+import pytest
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(SERVICE_DIR, '..', 'shared'))
+sys.path.insert(0, SERVICE_DIR)
+
+
+@pytest.fixture
+def pg_url():
+    url = os.getenv('TEST_DATABASE_URL')
+    if not url:
+        pytest.skip("TEST_DATABASE_URL não configurado (PostgreSQL descartável)")
+    if url == os.getenv('DATABASE_URL'):
+        pytest.skip("TEST_DATABASE_URL não pode ser o DATABASE_URL do serviço")
+    return url
@@ -0,0 +1,141 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import bulkhead
+from bulkhead import AsyncBulkhead, Bulkhead, BulkheadFull
+
+
+def test_queued_request_gets_the_released_slot():
+    compartment = Bulkhead('x', max_concurrent=1, max_queue=1, queue_timeout=5)
+    compartment.acquire()
+    admitted = threading.Event()
+
+    def waiter():
+        compartment.acquire()
+        admitted.set()
+
+    thread = threading.Thread(target=waiter)
+    thread.start()
+    time.sleep(0.05)
+    assert not admitted.is_set()
+    compartment.release()
+    thread.join(1)
+
+    assert admitted.is_set()
+    assert compartment.stats()['in_flight'] == 1
+
+
+def test_full_queue_rejects_without_waiting():
+    compartment = Bulkhead('x', max_concurrent=1, max_queue=0, queue_timeout=5, retry_after=7)
+    compartment.acquire()
+
+    started = time.monotonic()
+    with pytest.raises(BulkheadFull) as rejected:
+        compartment.acquire()
+
+    assert time.monotonic() - started < 0.5
+    assert rejected.value.retry_after == 7
+    assert compartment.stats()['rejected_queue_full'] == 1
+
+
+def test_queue_timeout_rejects():
+    compartment = Bulkhead('x', max_concurrent=1, max_queue=1, queue_timeout=0.05)
+    compartment.acquire()
+
+    with pytest.raises(BulkheadFull):
+        compartment.acquire()
+    assert compartment.stats()['rejected_timeout'] == 1
+
+
+def test_thread_budget_counts_queued_requests():
+    bulkheads = {
+        'payment': Bulkhead('payment', max_concurrent=10, max_queue=16, queue_timeout=30),
+        'dashboard': Bulkhead('dashboard', max_concurrent=4, max_queue=2, queue_timeout=5),
+    }
+
+    assert bulkhead.thread_budget(bulkheads) == 32 + bulkhead.RESERVED_THREADS
+
+
+def test_saturated_dashboard_does_not_starve_payment():
+    release = threading.Event()
+
+    @bulkhead.bulkhead('dashboard')
+    def slow_dashboard():
+        release.wait(5)
+        return 'ok'
+
+    @bulkhead.bulkhead('payment')
+    def payment():
+        return 'paid'
+
+    def call(view):
+        try:
+            return view()
+        except BulkheadFull:
+            return 503
+
+    dashboard = bulkhead.BULKHEADS['dashboard']
+    # Threads do worker gthread: cada request (admitido ou na fila) ocupa uma
+    with ThreadPoolExecutor(max_workers=bulkhead.thread_budget()) as threads:
+        flood = [threads.submit(call, slow_dashboard) for _ in range(50)]
+        paid = threads.submit(call, payment)
+        try:
+            assert paid.result(timeout=1) == 'paid'
+        finally:
+            release.set()
+        results = [future.result() for future in flood]
+
+    assert results.count('ok') == dashboard.max_concurrent + dashboard.max_queue
+    assert results.count(503) == 50 - results.count('ok')
+
+
+def test_async_queued_request_gets_the_released_slot():
+    async def scenario():
+        compartment = AsyncBulkhead('x', max_concurrent=1, max_queue=1, queue_timeout=5)
+        await compartment.acquire()
+        waiter = asyncio.ensure_future(compartment.acquire())
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+        assert compartment.stats()['queued'] == 1
+        compartment.release()
+        await asyncio.wait_for(waiter, 1)
+        return compartment.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats['in_flight'] == 1
+    assert stats['queued'] == 0
+
+
+def test_async_full_queue_and_timeout_reject():
+    async def scenario():
+        compartment = AsyncBulkhead('x', max_concurrent=1, max_queue=1, queue_timeout=0.05, retry_after=7)
+        await compartment.acquire()
+        waiter = asyncio.ensure_future(compartment.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(BulkheadFull) as rejected:
+            await compartment.acquire()
+        assert rejected.value.retry_after == 7
+        with pytest.raises(BulkheadFull):
+            await waiter
+        return compartment.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats['rejected_queue_full'] == 1
+    assert stats['rejected_timeout'] == 1
+    assert stats['in_flight'] == 1
+
+
+def test_async_slot_is_released_when_the_handler_fails():
+    async def scenario():
+        compartment = AsyncBulkhead('x', max_concurrent=1, max_queue=0, queue_timeout=1)
+        with pytest.raises(RuntimeError):
+            async with compartment:
+                raise RuntimeError('upstream')
+        async with compartment:
+            return compartment.stats()
+
+    assert asyncio.run(scenario())['admitted'] == 2
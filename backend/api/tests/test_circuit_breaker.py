@@ -0,0 +1,157 @@
+import psycopg2
+import pytest
+
+import circuit_breaker
+from circuit_breaker import CircuitBreaker, DatabaseUnavailable, is_database_failure, is_broken_connection
+from database import DatabaseManager
+from pool import PoolTimeout
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(circuit_breaker.time, 'monotonic', clock)
+    return clock
+
+
+def trip(breaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.before()
+        breaker.record_failure(psycopg2.OperationalError('timeout'))
+
+
+def test_opens_after_threshold_and_rejects_with_retry_after(clock):
+    breaker = CircuitBreaker('payment', failure_threshold=3, reset_timeout=30)
+    trip(breaker)
+
+    with pytest.raises(DatabaseUnavailable) as exc:
+        breaker.before()
+    assert exc.value.retry_after == 30
+    assert breaker.stats()['state'] == 'open'
+
+
+def test_success_resets_consecutive_failures(clock):
+    breaker = CircuitBreaker('payment', failure_threshold=3)
+    breaker.record_failure(psycopg2.OperationalError())
+    breaker.record_failure(psycopg2.OperationalError())
+    breaker.record_success()
+    breaker.record_failure(psycopg2.OperationalError())
+
+    assert breaker.stats()['state'] == 'closed'
+
+
+def test_half_open_admits_a_single_probe(clock):
+    breaker = CircuitBreaker('payment', failure_threshold=1, reset_timeout=30)
+    trip(breaker)
+    clock.now += 31
+
+    assert breaker.before() is True
+    with pytest.raises(DatabaseUnavailable):
+        breaker.before()
+
+    breaker.record_success()
+    assert breaker.stats()['state'] == 'closed'
+    assert breaker.before() is False
+
+
+def test_failed_probe_reopens(clock):
+    breaker = CircuitBreaker('payment', failure_threshold=1, reset_timeout=30)
+    trip(breaker)
+    clock.now += 31
+    breaker.before()
+    breaker.record_failure(psycopg2.OperationalError())
+
+    assert breaker.stats()['state'] == 'open'
+    with pytest.raises(DatabaseUnavailable):
+        breaker.before()
+
+
+def test_released_probe_lets_the_next_request_probe(clock):
+    breaker = CircuitBreaker('payment', failure_threshold=1, reset_timeout=30)
+    trip(breaker)
+    clock.now += 31
+    assert breaker.before() is True
+
+    breaker.release_probe()
+    assert breaker.before() is True
+
+
+def test_failure_classification():
+    assert is_database_failure(psycopg2.OperationalError())
+    assert is_database_failure(PoolTimeout('esgotado'))
+    assert not is_database_failure(psycopg2.IntegrityError())
+    assert not is_broken_connection(psycopg2.errors.QueryCanceled())
+    assert is_broken_connection(psycopg2.InterfaceError())
+
+
+class FakeConn:
+    def __init__(self):
+        self.committed = self.rolled_back = False
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        self.rolled_back = True
+
+
+class FakePool:
+    def __init__(self):
+        self.returned = []
+
+    def getconn(self):
+        return FakeConn()
+
+    def putconn(self, conn, discard=False):
+        self.returned.append((conn, discard))
+
+
+def manager_with(breaker):
+    # Só o que get_connection usa: sem DATABASE_URL nem conexões reais
+    db = DatabaseManager.__new__(DatabaseManager)
+    db.pool = FakePool()
+    db.breaker = breaker
+    return db
+
+
+def test_interrupted_probe_does_not_wedge_the_circuit(clock):
+    breaker = CircuitBreaker('payment', failure_threshold=1, reset_timeout=30)
+    trip(breaker)
+    clock.now += 31
+    db = manager_with(breaker)
+
+    # Cliente de um streaming desconecta com a conexão emprestada (GeneratorExit)
+    def stream():
+        with db.get_connection():
+            yield 'linha'
+
+    rows = stream()
+    next(rows)
+    rows.close()
+
+    assert len(db.pool.returned) == 1
+    with db.get_connection() as conn:
+        pass
+    assert conn.committed
+    assert breaker.stats()['state'] == 'closed'
+
+
+def test_query_error_counts_as_database_answering(clock):
+    breaker = CircuitBreaker('payment', failure_threshold=1, reset_timeout=30)
+    db = manager_with(breaker)
+
+    with pytest.raises(psycopg2.IntegrityError):
+        with db.get_connection():
+            raise psycopg2.IntegrityError('duplicate key')
+
+    conn, discard = db.pool.returned[0]
+    assert conn.rolled_back and not discard
+    assert breaker.stats()['state'] == 'closed'
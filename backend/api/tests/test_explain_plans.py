@@ -0,0 +1,83 @@
+"""
+Planos (EXPLAIN) das queries do gateway num PostgreSQL descartável populado
+
+Roda com EXPLAIN_CHECK_DATABASE_URL (ou TEST_DATABASE_URL); sem banco é pulado.
+Cada caso executa a query/rota real e falha se algum statement enviado ao
+banco cair em Seq Scan numa tabela populada (dados em explain_check.py).
+"""
+
+import os
+
+import psycopg2
+import psycopg2.extras
+import pytest
+
+import migrate
+import rollups
+from explain_check import CASES, RecordingConnection, RECORDED, explain, explainable, find_seq_scans, seed
+
+
+@pytest.fixture(scope='module')
+def gateway():
+    """(DatabaseManager, cliente Flask, conexão admin) sobre o banco de verificação"""
+    url = os.getenv('EXPLAIN_CHECK_DATABASE_URL') or os.getenv('TEST_DATABASE_URL')
+    if not url:
+        pytest.skip("EXPLAIN_CHECK_DATABASE_URL/TEST_DATABASE_URL não configurado (PostgreSQL descartável)")
+    if url == os.getenv('DATABASE_URL'):
+        pytest.skip("O banco de verificação não pode ser o DATABASE_URL do serviço")
+
+    sslmode = os.getenv('DATABASE_SSLMODE', 'prefer')
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv('DATABASE_URL', url)
+        patch.setenv('DATABASE_SSLMODE', sslmode)
+        # EXPLAIN precisa do SQL completo: EXECUTE de prepared statement não tem plano fora da sessão
+        patch.setenv('DB_PREPARED_STATEMENTS', '0')
+
+        admin = psycopg2.connect(url, sslmode=sslmode)
+        migrate.apply_pending(admin)
+        seed(admin, int(os.getenv('EXPLAIN_CHECK_USERS', '50000')))
+        # Histórico fechado no rollup, como depois do preDeploy (python3 -m rollups refresh)
+        rollups.close_days(admin.cursor(cursor_factory=psycopg2.extras.RealDictCursor))
+
+        # Instância global do gateway com conexões que registram o SQL executado
+        import database
+        patch.setattr(database, 'db', database.DatabaseManager(connection_factory=RecordingConnection))
+        import main as gateway_app
+        yield database.db, gateway_app.app.test_client(), admin
+        admin.close()
+
+
+@pytest.mark.parametrize('name, run, allowed_reason', CASES, ids=[case[0] for case in CASES])
+def test_query_plan_has_no_seq_scan(gateway, name, run, allowed_reason):
+    from response_cache import dashboard_cache
+
+    db, client, admin = gateway
+    # Cada caso precisa chegar ao banco, não ao cache de respostas
+    dashboard_cache.clear()
+    RECORDED.clear()
+    result = run(db, client)
+    if hasattr(result, 'status_code'):
+        assert result.status_code == 200, result.get_data(as_text=True)
+
+    statements = explainable(RECORDED)
+    assert statements, f"{name} não enviou nenhuma query ao banco"
+    scans = sorted({table for statement in statements for table in find_seq_scans(explain(admin, statement))})
+    if not allowed_reason:
+        assert not scans, f"{name}: Seq Scan em {scans}"
+
+
+def test_find_seq_scans_walks_nested_plans():
+    plan = {'Node Type': 'Nested Loop', 'Plans': [
+        {'Node Type': 'Seq Scan', 'Relation Name': 'pix_transactions'},
+        {'Node Type': 'Index Scan', 'Relation Name': 'bot_users', 'Plans': [
+            {'Node Type': 'Seq Scan', 'Relation Name': 'user_steps'},
+            {'Node Type': 'Seq Scan', 'Relation Name': 'schema_migrations'},
+        ]},
+    ]}
+
+    assert find_seq_scans(plan) == ['pix_transactions', 'user_steps']
+
+
+def test_explainable_skips_session_statements():
+    assert explainable(["SET statement_timeout = 5000", "  select 1", "WITH x AS (SELECT 1) SELECT * FROM x",
+                        "BEGIN"]) == ["  select 1", "WITH x AS (SELECT 1) SELECT * FROM x"]
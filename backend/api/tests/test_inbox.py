@@ -0,0 +1,91 @@
+import json
+
+import pytest
+
+import inbox
+from inbox import WebhookInboxProcessor, ordering_key
+
+
+class FakeConn:
+    def __init__(self):
+        self.executed = []
+        self.rowcount = 0
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params):
+        self.executed.append((sql, params))
+
+    def close(self):
+        pass
+
+
+def entry(payload, attempts=1, id=1):
+    return {'id': id, 'transaction_id': 'tx1', 'attempts': attempts,
+            'payload': payload if isinstance(payload, str) else json.dumps(payload)}
+
+
+def processor(apply, **kwargs):
+    return WebhookInboxProcessor(db=None, apply=apply, **kwargs)
+
+
+def test_ordering_key_uses_the_webhook_transaction_id():
+    assert ordering_key(json.dumps({'transaction': {'id': 123}, 'status': 'paid'})) == '123'
+    assert ordering_key('{"status": "paid"}') is None
+    assert ordering_key('não é json') is None
+    assert ordering_key('[1, 2]') is None
+
+
+def test_applies_status_of_the_entry():
+    applied = []
+    outcome = processor(lambda tid, status: applied.append((tid, status)) or 'created_at').process(
+        entry({'transaction': {'id': 'tx1'}, 'status': 'paid'}))
+
+    assert outcome['status'] == 'processed'
+    assert applied == [('tx1', 'paid')]
+
+
+def test_unknown_transaction_and_missing_fields_are_ignored():
+    apply = lambda tid, status: None
+
+    assert processor(apply).process(entry({'transaction': {'id': 'tx1'}, 'status': 'paid'}))['status'] == 'ignored'
+    assert processor(apply).process(entry({'status': 'paid'}))['status'] == 'ignored'
+    assert processor(apply).process(entry({'transaction': {'id': 'tx1'}}))['status'] == 'ignored'
+
+
+def test_invalid_json_fails_without_retry():
+    outcome = processor(lambda tid, status: pytest.fail("não deveria aplicar")).process(entry('{quebrado'))
+
+    assert outcome['status'] == 'failed'
+
+
+def test_apply_error_is_retried_then_given_up():
+    def apply(tid, status):
+        raise RuntimeError('banco fora')
+
+    payload = {'transaction': {'id': 'tx1'}, 'status': 'paid'}
+    retried = processor(apply, max_attempts=3, base_delay=2).process(entry(payload, attempts=1))
+    given_up = processor(apply, max_attempts=3).process(entry(payload, attempts=3))
+
+    assert retried['status'] == 'pending' and 1 <= retried['retry_in'] <= 2
+    assert given_up['status'] == 'failed' and 'banco fora' in given_up['error']
+
+
+def test_replay_reopens_selected_entries_and_their_successors():
+    conn = FakeConn()
+    inbox.replay(conn, ['failed'], since='2024-05-01', transaction_id='tx1')
+
+    sql, params = conn.executed[0]
+    assert params == [['failed'], '2024-05-01', 'tx1']
+    assert 'status = ANY(%s) AND received_at >= %s AND transaction_id = %s' in sql
+    # Entradas seguintes da mesma transação voltam junto (último status continua valendo)
+    assert 'i.id > f.first_id' in sql
+    assert sql.count('%s') == len(params)
+
+
+def test_replay_cli_rejects_unknown_status(monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', 'postgresql://localhost/nao-usado')
+    monkeypatch.setattr(inbox.psycopg2, 'connect', lambda *a, **kw: FakeConn())
+
+    assert inbox.main(['replay', '--status', 'pending']) == 2
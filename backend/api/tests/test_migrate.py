@@ -0,0 +1,123 @@
+import psycopg2.errors
+import pytest
+
+from migrate import NO_TRANSACTION_MARKER, discover_migrations, pending_migrations, split_statements
+
+
+def write(directory, filename, sql):
+    path = directory / filename
+    path.write_text(sql, encoding='utf-8')
+    return path
+
+
+class FakeConn:
+    """Conexão em memória para applied_versions: `versions=None` = sem schema_migrations"""
+
+    def __init__(self, versions):
+        self.versions = versions
+        self.rolled_back = False
+
+    def cursor(self):
+        conn = self
+
+        class Cursor:
+            def execute(self, sql):
+                if conn.versions is None:
+                    raise psycopg2.errors.UndefinedTable("relation \"schema_migrations\" does not exist")
+
+            def fetchall(self):
+                return [(version,) for version in conn.versions]
+        return Cursor()
+
+    def rollback(self):
+        self.rolled_back = True
+
+
+def test_discover_orders_by_version_and_ignores_other_files(tmp_path):
+    write(tmp_path, '0002_indexes.sql', "CREATE INDEX i ON t (c);")
+    write(tmp_path, '0001_initial.sql', "CREATE TABLE t (c INT);")
+    write(tmp_path, 'README.md', "notas")
+    write(tmp_path, '3_sem_zeros.sql', "SELECT 1;")
+    write(tmp_path, '0004_Maiusculas.sql', "SELECT 1;")
+
+    migrations = discover_migrations(str(tmp_path))
+
+    assert [(m.version, m.name) for m in migrations] == [(1, 'initial'), (2, 'indexes')]
+    assert migrations[0].path == str(tmp_path / '0001_initial.sql')
+
+
+def test_no_transaction_marker_on_first_line(tmp_path):
+    write(tmp_path, '0001_tx.sql', "CREATE TABLE t (c INT);")
+    write(tmp_path, '0002_concurrently.sql', f"{NO_TRANSACTION_MARKER}\nCREATE INDEX CONCURRENTLY i ON t (c);")
+    write(tmp_path, '0003_marker_later.sql', f"-- comentário\n{NO_TRANSACTION_MARKER}\nSELECT 1;")
+
+    assert [m.transactional for m in discover_migrations(str(tmp_path))] == [True, False, True]
+
+
+def test_duplicate_versions_are_rejected(tmp_path):
+    write(tmp_path, '0001_initial.sql', "SELECT 1;")
+    write(tmp_path, '0001_other.sql', "SELECT 2;")
+
+    with pytest.raises(ValueError):
+        discover_migrations(str(tmp_path))
+
+
+def test_pending_skips_applied_versions(tmp_path):
+    for filename in ('0001_a.sql', '0002_b.sql', '0003_c.sql'):
+        write(tmp_path, filename, "SELECT 1;")
+    migrations = discover_migrations(str(tmp_path))
+
+    assert [m.version for m in pending_migrations(FakeConn({1, 3}), migrations)] == [2]
+
+
+def test_missing_migrations_table_means_nothing_applied(tmp_path):
+    write(tmp_path, '0001_a.sql', "SELECT 1;")
+    conn = FakeConn(None)
+
+    assert [m.version for m in pending_migrations(conn, discover_migrations(str(tmp_path)))] == [1]
+    assert conn.rolled_back
+
+
+def test_split_statements_drops_comment_lines():
+    sql = """
+    -- índice do caminho quente
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS a ON t (c);
+
+    -- outro
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS b ON t (d);
+    """
+
+    assert split_statements(sql) == [
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS a ON t (c)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS b ON t (d)",
+    ]
+
+
+def test_split_statements_keeps_dollar_quoted_bodies():
+    sql = """
+    CREATE FUNCTION f() RETURNS trigger AS $$
+    BEGIN
+        PERFORM 1;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+    DO $body$ BEGIN COMMIT; END $body$;
+    SELECT '$1';
+    """
+
+    statements = split_statements(sql)
+
+    assert len(statements) == 3
+    assert statements[0].endswith("$$ LANGUAGE plpgsql")
+    assert statements[1] == "DO $body$ BEGIN COMMIT; END $body$"
+
+
+def test_split_statements_rejects_unterminated_dollar_quote():
+    with pytest.raises(ValueError):
+        split_statements("DO $$ BEGIN PERFORM 1; END;")
+
+
+def test_shipped_migrations_are_consistent():
+    migrations = discover_migrations()
+
+    assert [m.version for m in migrations] == list(range(1, len(migrations) + 1))
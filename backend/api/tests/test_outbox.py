@@ -0,0 +1,168 @@
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+import psycopg2
+import psycopg2.extras
+import pytest
+import requests
+
+import migrate
+import rollups
+import upstream
+from database import pix_update_statement
+from outbox import ConversionDispatcher, QueueDrainer
+
+
+class Response:
+    def __init__(self, status_code, text=''):
+        self.status_code = status_code
+        self.text = text
+
+
+class FakeDB:
+    def __init__(self, rows):
+        self.rows = rows
+        self.finished = []
+
+    def claim_conversions(self, limit, lease_seconds):
+        rows, self.rows = self.rows[:limit], self.rows[limit:]
+        return rows
+
+    def finish_conversions(self, outcomes):
+        self.finished.extend(outcomes)
+
+
+def row(attempts=1, click_id='click-1', amount=Decimal('24.90')):
+    return {'id': 7, 'transaction_id': 'tx1', 'attempts': attempts, 'click_id': click_id,
+            'amount': amount, 'utm_source': 'facebook', 'utm_campaign': 'c1'}
+
+
+@pytest.fixture
+def xtracky(monkeypatch):
+    responses = []
+
+    def post(url, **kwargs):
+        result = responses.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    monkeypatch.setattr(upstream.get('xtracky'), 'post', post)
+    return responses
+
+
+def test_paid_update_enqueues_conversion_in_the_same_statement():
+    name, sql, params = pix_update_statement('tx1', status='paid', enqueue_conversion=True)
+
+    assert name == 'update_pix_transaction_status_outbox'
+    assert 'INSERT INTO conversion_outbox' in sql and 'ON CONFLICT (transaction_id) DO NOTHING' in sql
+    assert sql.count('%s') == len(params) == 2
+
+
+def test_sent_conversion_is_logged(xtracky):
+    xtracky.append(Response(200, 'ok'))
+    outcome = ConversionDispatcher(FakeDB([])).process(row())
+
+    assert outcome['status'] == 'sent'
+    assert outcome['log'] == ('tx1', 'click-1', 'facebook', 'c1', Decimal('24.90'), 'sent', 'ok')
+
+
+def test_transient_failure_is_retried_with_backoff(xtracky):
+    xtracky.append(requests.exceptions.ConnectTimeout('timeout'))
+    dispatcher = ConversionDispatcher(FakeDB([]), base_delay=10, max_attempts=3)
+    outcome = dispatcher.process(row(attempts=2))
+
+    assert outcome['status'] == 'pending' and outcome['log'] is None
+    assert 10 <= outcome['retry_in'] <= 20
+
+
+def test_gives_up_after_max_attempts(xtracky):
+    xtracky.append(Response(503, 'unavailable'))
+    outcome = ConversionDispatcher(FakeDB([]), max_attempts=3).process(row(attempts=3))
+
+    assert outcome['status'] == 'failed'
+    assert outcome['log'][5] == 'failed'
+
+
+def test_failed_delivery_is_not_counted_as_conversion(xtracky, pg_url, monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', pg_url)
+    monkeypatch.setenv('DATABASE_SSLMODE', 'prefer')
+    admin = psycopg2.connect(pg_url, sslmode='prefer')
+    migrate.apply_pending(admin)
+    from database import DatabaseManager
+    db = DatabaseManager()
+
+    def conversions_today():
+        with db.get_connection() as conn:
+            totals, _, _ = rollups.funnel_totals(conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor))
+        return totals['conversions']
+
+    try:
+        before = conversions_today()
+        xtracky.extend([Response(200, 'ok'), Response(503)])
+        dispatcher = ConversionDispatcher(db, max_attempts=1)
+        outcomes = [dispatcher.process(row()), dispatcher.process(row())]
+        assert [outcome['status'] for outcome in outcomes] == ['sent', 'failed']
+        db.finish_conversions(outcomes)
+
+        assert conversions_today() == before + 1
+    finally:
+        with admin.cursor() as cursor:
+            cursor.execute("DELETE FROM conversion_logs WHERE transaction_id = 'tx1' AND click_id = 'click-1'")
+        admin.commit()
+        admin.close()
+        db.close()
+
+
+def test_client_error_is_not_retried(xtracky):
+    xtracky.append(Response(400, 'bad click_id'))
+    outcome = ConversionDispatcher(FakeDB([])).process(row(attempts=1))
+
+    assert outcome['status'] == 'failed'
+
+
+def test_rate_limit_is_retried(xtracky):
+    xtracky.append(Response(429))
+    outcome = ConversionDispatcher(FakeDB([])).process(row(attempts=1))
+
+    assert outcome['status'] == 'pending'
+
+
+def test_without_click_id_or_transaction_is_skipped(xtracky):
+    dispatcher = ConversionDispatcher(FakeDB([]))
+
+    assert dispatcher.process(row(click_id=None))['status'] == 'skipped'
+    assert dispatcher.process(row(amount=None))['status'] == 'skipped'
+    assert xtracky == []
+
+
+def test_backoff_is_exponential_and_capped():
+    dispatcher = ConversionDispatcher(FakeDB([]), base_delay=5, max_delay=60)
+
+    for attempts, ceiling in [(1, 5), (2, 10), (3, 20), (10, 60)]:
+        delay = dispatcher.backoff(attempts)
+        assert ceiling / 2 <= delay <= ceiling
+
+
+def test_drain_once_finishes_the_whole_batch(xtracky):
+    rows = [dict(row(), id=i) for i in range(3)]
+    xtracky.extend([Response(200), Response(500), Response(200)])
+    db = FakeDB(rows)
+    dispatcher = ConversionDispatcher(db, batch_size=10, concurrency=1)
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        assert dispatcher.drain_once(executor) == 3
+        assert dispatcher.drain_once(executor) == 0
+
+    assert [outcome['status'] for outcome in db.finished] == ['sent', 'pending', 'sent']
+    stats = dispatcher.stats()
+    assert stats['sent'] == 2 and stats['retried'] == 1 and stats['batches'] == 1
+
+
+def test_drainer_must_implement_every_hook():
+    class Incomplete(QueueDrainer):
+        def claim(self, limit):
+            return []
+
+    with pytest.raises(TypeError):
+        Incomplete()
@@ -0,0 +1,36 @@
+from database import generated_pix_statement, pix_update_statement
+
+TRACKING = {'click_id': 'abc', 'utm_source': 'facebook', 'utm_campaign': 'c1'}
+
+
+def test_generated_pix_cancels_pending_and_inserts_in_one_statement():
+    sql, params = generated_pix_statement(True, 'tx1', 42, 24.9, TRACKING, plano_id='vip', pix_code='000201', qr_code='qr')
+
+    assert sql.count('%s') == len(params)
+    assert 'WITH cancelled AS' in sql and 'INSERT INTO pix_transactions' in sql
+    # Primeiro parâmetro é o usuário do UPDATE de cancelamento
+    assert params[0] == 42
+    assert params[1:5] == ['tx1', 42, 24.9, 'vip']
+    assert 'waiting_payment' in params and 'abc' in params
+
+
+def test_generated_pix_without_plano_id_column():
+    sql, params = generated_pix_statement(False, 'tx1', 42, 24.9, TRACKING)
+
+    assert 'plano_id' not in sql
+    assert sql.count('%s') == len(params)
+
+
+def test_update_statement_name_follows_updated_fields():
+    name, sql, params = pix_update_statement('tx1', status='paid')
+    assert name == 'update_pix_transaction_status'
+    assert params == ['paid', 'tx1']
+    assert sql.count('%s') == len(params)
+
+    name, _, params = pix_update_statement('tx1', pix_code='p', qr_code='q')
+    assert name == 'update_pix_transaction_pix_code_qr_code'
+    assert params == ['p', 'q', 'tx1']
+
+
+def test_update_without_fields_is_none():
+    assert pix_update_statement('tx1') is None
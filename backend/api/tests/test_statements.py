@@ -0,0 +1,119 @@
+import pytest
+
+from statements import FEATURE_NOT_SUPPORTED, Statement, StatementRegistry, numbered
+
+SQL = "SELECT * FROM bot_users WHERE telegram_id = %s AND created_at > %s"
+
+
+class FakeConn:
+    """Conexão em memória: guarda o SQL enviado; `fail_next` simula o erro do banco"""
+
+    def __init__(self):
+        self.sent = []
+        self.fail_next = None
+
+    def cursor(self):
+        return FakeCursor(self)
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def execute(self, sql, params=None):
+        self.connection.sent.append((sql, params))
+        if self.connection.fail_next and sql.startswith('EXECUTE'):
+            error, self.connection.fail_next = self.connection.fail_next, None
+            raise error
+
+
+class SchemaChanged(Exception):
+    pgcode = FEATURE_NOT_SUPPORTED
+
+
+def test_numbered_replaces_placeholders_in_order():
+    assert numbered(SQL) == "SELECT * FROM bot_users WHERE telegram_id = $1 AND created_at > $2"
+    assert numbered("SELECT 1") == "SELECT 1"
+
+
+def test_statement_builds_prepare_and_execute():
+    statement = Statement('get_user', SQL)
+
+    assert statement.prepare_sql.startswith("PREPARE get_user AS SELECT")
+    assert statement.execute_sql == "EXECUTE get_user (%s, %s)"
+    assert Statement('ping', "SELECT 1").execute_sql == "EXECUTE ping"
+
+
+@pytest.mark.parametrize('name, sql', [
+    ('Get-User', SQL),
+    ('get_user; DROP TABLE x', SQL),
+    ('get_user', "SELECT * FROM t WHERE id = %(id)s"),
+    ('get_user', "SELECT '100%%'"),
+])
+def test_statement_rejects_bad_name_or_placeholders(name, sql):
+    with pytest.raises(ValueError):
+        Statement(name, sql)
+
+
+def test_prepares_once_per_connection():
+    registry = StatementRegistry()
+    first, second = FakeConn(), FakeConn()
+
+    registry.execute(first.cursor(), 'get_user', SQL, (1, 'x'))
+    registry.execute(first.cursor(), 'get_user', SQL, (2, 'y'))
+    registry.execute(second.cursor(), 'get_user', SQL, (3, 'z'))
+
+    assert [sql for sql, _ in first.sent] == [
+        Statement('get_user', SQL).prepare_sql, "EXECUTE get_user (%s, %s)", "EXECUTE get_user (%s, %s)"]
+    assert first.sent[-1][1] == (2, 'y')
+    assert len(second.sent) == 2
+    stats = registry.stats()
+    assert (stats['prepares'], stats['executions'], stats['connections']) == (2, 3, 2)
+
+
+def test_same_name_with_other_sql_is_rejected():
+    registry = StatementRegistry()
+    registry.execute(FakeConn().cursor(), 'get_user', SQL, (1, 'x'))
+
+    with pytest.raises(ValueError):
+        registry.execute(FakeConn().cursor(), 'get_user', "SELECT 1")
+
+
+def test_disabled_registry_runs_plain_sql():
+    registry = StatementRegistry(enabled=False)
+    conn = FakeConn()
+
+    registry.execute(conn.cursor(), 'get_user', SQL, (1, 'x'))
+
+    assert conn.sent == [(SQL, (1, 'x'))]
+    assert registry.stats()['prepares'] == 0
+
+
+def test_schema_change_deallocates_and_prepares_again():
+    registry = StatementRegistry()
+    conn = FakeConn()
+    registry.execute(conn.cursor(), 'get_user', SQL, (1, 'x'))
+    conn.fail_next = SchemaChanged("cached plan must not change result type")
+
+    with pytest.raises(SchemaChanged):
+        registry.execute(conn.cursor(), 'get_user', SQL, (2, 'y'))
+    conn.sent.clear()
+    registry.execute(conn.cursor(), 'get_user', SQL, (3, 'z'))
+
+    assert [sql for sql, _ in conn.sent] == [
+        "DEALLOCATE get_user", Statement('get_user', SQL).prepare_sql, "EXECUTE get_user (%s, %s)"]
+    assert registry.stats()['replans'] == 1
+
+
+def test_other_errors_keep_statement_prepared():
+    registry = StatementRegistry()
+    conn = FakeConn()
+    registry.execute(conn.cursor(), 'get_user', SQL, (1, 'x'))
+    conn.fail_next = RuntimeError("statement timeout")
+
+    with pytest.raises(RuntimeError):
+        registry.execute(conn.cursor(), 'get_user', SQL, (2, 'y'))
+    conn.sent.clear()
+    registry.execute(conn.cursor(), 'get_user', SQL, (3, 'z'))
+
+    assert [sql for sql, _ in conn.sent] == ["EXECUTE get_user (%s, %s)"]
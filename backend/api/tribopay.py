@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+"""
+Regras do fluxo de pagamento TriboPay/Xtracky sem I/O
+
+Mapeamento de ofertas, dados do cliente, payload da TriboPay, leitura da
+resposta e do webhook e payload da conversão Xtracky. Compartilhado pelo
+gateway Flask (main.py) e pelo modo assíncrono (async_gateway.py): os dois
+montam exatamente os mesmos pedidos e respostas, só muda como o I/O é feito.
+"""
+
+import os
+import re
+import json
+import time
+import random
+import logging
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+TRIBOPAY_API_URL = "https://api.tribopay.com.br/api/public/v1/transactions"
+TRIBOPAY_TIMEOUT = 20
+PRODUCT_HASH = "a8c1r56cgy"  # Product hash fixo do produto "Acesso VIP - Ana Cardoso"
+POSTBACK_URL = "https://api-gateway-production-22bb.up.railway.app/webhook/tribopay"
+
+XTRACKY_URL = 'https://api.xtracky.com/api/integrations/tribopay'
+XTRACKY_TOKEN = '72701474-7e6c-4c87-b84f-836d4547a4bd'
+XTRACKY_TIMEOUT = 10
+
+PIX_VALIDITY = timedelta(minutes=15)
+PAID_STATUSES = ('paid', 'approved')
+
+
+class TribopayError(Exception):
+    """Resposta HTTP de erro (4xx/5xx) da API da TriboPay"""
+
+    def __init__(self, status_code, body):
+        super().__init__(f"TriboPay respondeu {status_code}")
+        self.status_code = status_code
+        self.body = body
+
+
+#======== MAPEAMENTO DE OFERTAS TRIBOPAY (CORRIGIDO CONFORME DOCUMENTAÇÃO) =============
+def get_tribopay_offer_mapping():
+    """Retorna um mapeamento limpo de plano_id para offer_hash com dados completos."""
+    return {
+        "plano_1mes": {
+            "offer_hash": os.getenv('TRIBOPAY_OFFER_VIP_BASICO', 'deq4y2wybn'),
+            "price": 2490,  # R$ 24,90
+            "title": "Acesso VIP - Ana Cardoso (1 mês)"
+        },
+        "plano_3meses": {
+            "offer_hash": os.getenv('TRIBOPAY_OFFER_VIP_PREMIUM', 'zawit'),
+            "price": 4990,  # R$ 49,90
+            "title": "Acesso VIP - Ana Cardoso (3 meses)"
+        },
+        "plano_1ano": {
+            "offer_hash": os.getenv('TRIBOPAY_OFFER_VIP_COMPLETO', '8qbmp'),
+            "price": 6700,  # R$ 67,00
+            "title": "Acesso VIP - Ana Cardoso (1 ano)"
+        },
+        "default": {
+            "offer_hash": os.getenv('TRIBOPAY_OFFER_DEFAULT', 'deq4y2wybn'),
+            "price": 2490,  # R$ 24,90
+            "title": "Acesso VIP - Ana Cardoso"
+        }
+    }
+
+def get_offer_data_by_plano_id(plano_id):
+    """Retorna dados completos da oferta baseado no plano_id. Usa 'default' se não encontrar."""
+    mapping = get_tribopay_offer_mapping()
+    offer_data = mapping.get(plano_id, mapping["default"])
+    logger.info(f"📦 Mapeamento de oferta: {plano_id} -> {offer_data['offer_hash']} (R$ {offer_data['price']/100:.2f})")
+    return offer_data
+
+# Função para backward compatibility
+def get_offer_hash_by_plano_id(plano_id):
+    """DEPRECATED: Use get_offer_data_by_plano_id() instead."""
+    return get_offer_data_by_plano_id(plano_id)["offer_hash"]
+#================= FECHAMENTO ======================
+
+#======== SISTEMA DE GERAÇÃO DE DADOS ÚNICOS =============
+def gerar_cpf():
+    """CPF aleatório com dígitos verificadores válidos"""
+    # Gera 9 primeiros dígitos
+    cpf = [random.randint(0, 9) for _ in range(9)]
+
+    # Calcula primeiro dígito verificador
+    soma = sum(cpf[i] * (10 - i) for i in range(9))
+    digito1 = (soma * 10 % 11) % 10
+    cpf.append(digito1)
+
+    # Calcula segundo dígito verificador
+    soma = sum(cpf[i] * (11 - i) for i in range(10))
+    digito2 = (soma * 10 % 11) % 10
+    cpf.append(digito2)
+
+    return ''.join(map(str, cpf))
+
+
+def gerar_telefone(ddds):
+    """Celular aleatório (sempre começa com 9) com um dos DDDs informados"""
+    ddd = random.choice(ddds)
+    numero = '9' + ''.join([str(random.randint(0, 9)) for _ in range(8)])
+    return f"{ddd}{numero}"
+
+
+def _seed_random(user_id):
+    # Usa user_id + timestamp para garantir unicidade
+    seed = int(str(user_id) + str(int(time.time() * 1000))[-6:])
+    random.seed(seed)
+
+
+def generate_unique_customer_data(user_id):
+    """Gera dados únicos de cliente para PIX - nunca repete"""
+
+    # Listas de nomes brasileiros comuns
+    primeiros_nomes = [
+        "Ana", "Maria", "João", "Pedro", "Lucas", "Gabriel", "Rafael", "Daniel", "Bruno", "Felipe",
+        "Fernanda", "Juliana", "Camila", "Amanda", "Beatriz", "Carolina", "Larissa", "Mariana",
+        "André", "Diego", "Marcos", "Thiago", "Rodrigo", "Mateus", "Gustavo", "Ricardo",
+        "Patrícia", "Renata", "Sandra", "Vanessa", "Claudia", "Mônica", "Silvia", "Adriana",
+        "Carlos", "Fernando", "Eduardo", "Marcelo", "Paulo", "Roberto", "Leonardo", "Vinicius"
+    ]
+
+    sobrenomes = [
+        "Silva", "Santos", "Oliveira", "Souza", "Lima", "Ferreira", "Costa", "Pereira", "Almeida",
+        "Martins", "Araújo", "Melo", "Barbosa", "Ribeiro", "Monteiro", "Cardoso", "Carvalho",
+        "Gomes", "Nascimento", "Moreira", "Reis", "Freitas", "Campos", "Cunha", "Pinto", "Farias",
+        "Batista", "Vieira", "Mendes", "Castro", "Rocha", "Dias", "Moura", "Correia", "Teixeira"
+    ]
+
+    _seed_random(user_id)
+
+    # Gera nome único
+    primeiro = random.choice(primeiros_nomes)
+    sobrenome = random.choice(sobrenomes)
+    nome_completo = f"{primeiro} {sobrenome}"
+
+    # DDD válidos brasileiros
+    ddds = ['11', '12', '13', '14', '15', '16', '17', '18', '19', '21', '22', '24', '27', '28',
+            '31', '32', '33', '34', '35', '37', '38', '41', '42', '43', '44', '45', '46', '47',
+            '48', '49', '51', '53', '54', '55', '61', '62', '63', '64', '65', '66', '67', '68',
+            '69', '71', '73', '74', '75', '77', '79', '81', '82', '83', '84', '85', '86', '87',
+            '88', '89', '91', '92', '93', '94', '95', '96', '97', '98', '99']
+
+    cpf = gerar_cpf()
+    telefone = gerar_telefone(ddds)
+
+    # Gera email seguro removendo acentos e caracteres especiais
+    email_base = re.sub(r'[^a-z]', '', primeiro.lower() + sobrenome.lower())
+    if len(email_base) < 3:  # Fallback se nome muito curto
+        email_base = f"user{user_id}"
+    email = f"{email_base}{random.randint(100, 999)}@gmail.com"
+
+    logger.info(f"🎲 Dados FALLBACK gerados para user {user_id}: {nome_completo}, CPF: {cpf[:3]}*** (sem dados Telegram)")
+
+    return {
+        'name': nome_completo,
+        'email': email,
+        'document': cpf,
+        'phone_number': telefone
+    }
+
+
+def build_customer_data(user_id, customer_data):
+    """Dados do cliente para a TriboPay: (customer, erro de validação ou None)"""
+    # Se customer_data não foi fornecido, gera dados únicos realistas
+    if not customer_data:
+        customer_data = generate_unique_customer_data(user_id)
+        logger.info(f"🎲 Dados únicos gerados para user_id {user_id}")
+        return customer_data, None
+
+    # NOVO: Dados do Telegram fornecidos - usa dados REAIS + randomiza apenas PIX data
+    if 'username_telegram' in customer_data:
+        logger.info(f"📱 Usando dados REAIS do Telegram para user_id {user_id}")
+
+        # Dados REAIS do Telegram
+        username_telegram = customer_data.get('username_telegram')
+        first_name_telegram = customer_data.get('first_name_telegram')
+        last_name_telegram = customer_data.get('last_name_telegram', '')
+
+        # Gera nome real do Telegram
+        nome_real = f"{first_name_telegram} {last_name_telegram}".strip()
+
+        # Gera apenas dados randomizados para PIX (document, phone, email)
+        _seed_random(user_id)
+
+        # Gera email baseado no nome real
+        email_base = re.sub(r'[^a-z]', '', first_name_telegram.lower())
+        if len(email_base) < 3:
+            email_base = f"user{user_id}"
+        email_real = f"{email_base}{random.randint(100, 999)}@gmail.com"
+
+        # Monta customer_data com dados REAIS do Telegram + dados PIX randomizados
+        customer_data = {
+            'name': nome_real,  # REAL do Telegram
+            'email': email_real,  # Baseado no nome real
+            'document': gerar_cpf(),  # Randomizado para PIX
+            'phone_number': gerar_telefone(['11', '21', '31', '41', '51', '61', '71', '81', '85', '91'])  # Randomizado para PIX
+        }
+
+        logger.info(f"✅ Customer data montado: Nome REAL='{nome_real}', Username='{username_telegram}'")
+        return customer_data, None
+
+    # Valida campos obrigatórios apenas se customer_data foi fornecido no formato antigo
+    required_customer_fields = ['name', 'email', 'document', 'phone_number']
+    if not all(k in customer_data for k in required_customer_fields):
+        return None, f'Dados do cliente incompletos. Obrigatórios: {required_customer_fields}'
+    return customer_data, None
+#================= FECHAMENTO ======================
+
+#======== PAYLOAD E RESPOSTA DA TRIBOPAY =============
+def log_tracking(user_id, user_data):
+    """Tracking do usuário (vazio se não encontrado), com logs detalhados para debug do PIX"""
+    if not user_data:
+        logger.warning(f"⚠️ Usuário {user_id} não encontrado no banco. Tracking não será enviado.")
+        logger.warning(f"💡 Dica: Usuário pode não ter passado pelo /start ou dados não foram salvos corretamente")
+        return {}
+
+    tracking_data = user_data.get('tracking_data', {})
+    logger.info(f"🎯 Tracking encontrado para usuário {user_id}: {tracking_data}")
+
+    logger.info(f"📊 Dados tracking detalhados PIX:")
+    logger.info(f"   - click_id: {tracking_data.get('click_id')}")
+    logger.info(f"   - utm_source: {tracking_data.get('utm_source')}")
+    logger.info(f"   - utm_medium: {tracking_data.get('utm_medium')}")
+    logger.info(f"   - utm_campaign: {tracking_data.get('utm_campaign')}")
+    logger.info(f"   - Total campos tracking: {len(tracking_data)}")
+    return tracking_data
+
+
+def build_payload(valor, plano_id, customer_data, tracking_data):
+    """Payload da TriboPay, EXATAMENTE conforme a documentação oficial"""
+    offer_data = get_offer_data_by_plano_id(plano_id)
+    offer_price = offer_data["price"]
+
+    # Validação crítica: valor solicitado deve coincidir com o preço da oferta
+    valor_centavos = int(float(valor) * 100)
+    if valor_centavos != offer_price:
+        logger.warning(f"⚠️ Valor solicitado ({valor_centavos}) diferente do preço da oferta ({offer_price}). Usando preço da oferta.")
+        valor_centavos = offer_price
+
+    return {
+        "amount": valor_centavos,
+        "offer_hash": offer_data["offer_hash"],
+        "payment_method": "pix",
+        "installments": 1,  # CRÍTICO: Campo obrigatório conforme teste da API
+        "postback_url": POSTBACK_URL,
+        "customer": customer_data,
+        "cart": [{
+            "product_hash": PRODUCT_HASH,       # CRÍTICO: Usar product_hash, não offer_hash
+            "title": offer_data["title"],       # CRÍTICO: Campo obrigatório
+            "price": valor_centavos,            # CRÍTICO: Campo obrigatório
+            "quantity": 1,
+            "operation_type": 1,                # CRÍTICO: Campo obrigatório (1 = sale)
+            "tangible": False                   # CRÍTICO: Campo obrigatório (produto digital)
+        }],
+        "tracking": {
+            "src": tracking_data.get('click_id'),
+            "utm_source": tracking_data.get('utm_source'),
+            "utm_campaign": tracking_data.get('utm_campaign'),
+            "utm_medium": tracking_data.get('utm_medium'),
+            "utm_term": tracking_data.get('utm_term'),
+            "utm_content": tracking_data.get('utm_content')
+        }
+    }
+
+
+REQUEST_HEADERS = {"Content-Type": "application/json", "Accept": "application/json"}
+
+
+def transactions_url():
+    return f"{TRIBOPAY_API_URL}?api_token={os.getenv('TRIBOPAY_API_KEY')}"
+
+
+def parse_pix_response(tribopay_data):
+    """(transaction_id, pix_code, qr_code) da resposta de sucesso da TriboPay"""
+    transaction_id = tribopay_data.get('hash')
+    pix_data = tribopay_data.get('pix', {})
+
+    # CORREÇÃO: Tornar a validação de dados PIX mais flexível
+    pix_code = pix_data.get('pix_qr_code')      # Código PIX copia e cola (Prioridade 1)
+    qr_code = pix_data.get('pix_url')           # URL para pagamento (Opcional)
+    qr_code_b64 = pix_data.get('qr_code_base64') # Base64 (Opcional)
+
+    # A condição para falha é não ter ID da transação ou não ter NENHUMA forma de PIX.
+    if not transaction_id or not (pix_code or qr_code or qr_code_b64):
+        logger.error(f"❌ Resposta da TriboPay bem-sucedida, mas sem dados PIX utilizáveis: {tribopay_data}")
+        raise ValueError("Resposta da TriboPay não contém dados PIX utilizáveis (pix_qr_code, pix_url, ou qr_code_base64)")
+
+    logger.info(f"✅ PIX gerado com sucesso! Transaction ID: {transaction_id}")
+    return transaction_id, pix_code, qr_code
+
+
+def gateway_error_body(status_code, error_body):
+    """Corpo JSON devolvido (com o mesmo status) quando a TriboPay responde 4xx/5xx"""
+    logger.error(f"❌ ERRO HTTP da API TriboPay: {status_code} - {error_body}")
+    return {
+        'success': False, 'error': 'Erro de comunicação com o gateway de pagamento.',
+        'gateway_message': error_body
+    }
+#================= FECHAMENTO ======================
+
+#======== VERIFICAÇÃO DE PIX EXISTENTE =============
+def pix_verification(user_id, plano_id, pix_data):
+    """Corpo de /api/pix/verificar: PIX ainda válido (com tempo restante) ou nenhum"""
+    if pix_data:
+        # Calcula tempo restante
+        created_at = pix_data.get('created_at')
+        logger.info(f"⏰ PIX created_at: {created_at} (tipo: {type(created_at)})")
+
+        if isinstance(created_at, str):
+            created_at = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
+
+        if created_at:
+            expire_time = created_at + PIX_VALIDITY
+            now = datetime.now(created_at.tzinfo) if created_at.tzinfo else datetime.now()
+            tempo_restante = expire_time - now
+            logger.info(f"⏰ Tempo restante calculado: {tempo_restante.total_seconds()} segundos")
+
+            if tempo_restante.total_seconds() > 0:
+                tempo_min = int(tempo_restante.total_seconds() / 60)
+                pix_data['tempo_restante'] = f"{tempo_min} minutos"
+
+                logger.info(f"✅ PIX VÁLIDO encontrado para usuário {user_id}, plano {plano_id} - {tempo_min} min restantes")
+                return {
+                    'success': True,
+                    'pix_valido': True,
+                    'pix_data': pix_data
+                }
+            else:
+                logger.info(f"⏰ PIX EXPIRADO para usuário {user_id}, plano {plano_id}")
+        else:
+            logger.warning(f"⚠️ PIX sem created_at válido para usuário {user_id}")
+
+    logger.info(f"❌ Nenhum PIX válido encontrado para usuário {user_id}, plano {plano_id}")
+    return {
+        'success': True,
+        'pix_valido': False,
+        'pix_data': None
+    }
+#================= FECHAMENTO ======================
+
+#======== WEBHOOK E CONVERSÃO XTRACKY =============
+def extract_transaction_id(webhook_data):
+    """ID da transação nos múltiplos formatos de webhook da TriboPay (None se ausente)"""
+    transaction_data = webhook_data.get('transaction')
+    transaction_id = None
+
+    # Formato 1: transaction é um objeto (dict)
+    if isinstance(transaction_data, dict):
+        transaction_id = transaction_data.get('id') or transaction_data.get('hash')
+    # Formato 2: transaction é uma string (pode ser JSON ou hash direto)
+    elif isinstance(transaction_data, str):
+        try:
+            # Tenta decodificar como JSON
+            data = json.loads(transaction_data)
+            transaction_id = data.get('id') or data.get('hash')
+        except json.JSONDecodeError:
+            # Se não for JSON, assume que é o hash/ID direto
+            if len(transaction_data) > 5:
+                transaction_id = transaction_data
+                logger.info(f"🔍 transaction_data é uma string (hash direto): {transaction_data}")
+            else:
+                logger.warning(f"⚠️ transaction_data é uma string curta e não-JSON: {transaction_data}")
+    # Formato 3 (NOVO): transaction é um número inteiro (ID direto)
+    elif isinstance(transaction_data, int):
+        transaction_id = transaction_data
+        logger.info(f"🔍 transaction_data é um inteiro (ID direto): {transaction_data}")
+    # Formato 4: transaction não existe, busca ID no root do webhook
+    elif not transaction_data:
+        transaction_id = webhook_data.get('id') or webhook_data.get('hash')
+
+    # Formato 5: Fallback - tenta outros campos comuns da TriboPay
+    if not transaction_id:
+        transaction_id = webhook_data.get('transaction_id') or webhook_data.get('txn_id')
+    return transaction_id
+
+
+def conversion_payload(transaction_id, transaction):
+    """Dados da conversão para a Xtracky, ou None se a transação não tiver click_id"""
+    # Busca click_id diretamente da transação (está armazenado como campo separado)
+    click_id = transaction.get('click_id')
+    tracking_data = transaction.get('tracking_data', {})
+
+    # Debug: Log detalhado dos dados de tracking da transação
+    logger.info(f"🔍 Dados transação {transaction_id}:")
+    logger.info(f"   - click_id direto: {click_id}")
+    logger.info(f"   - tracking_data: {tracking_data}")
+    logger.info(f"   - tracking_data.click_id: {tracking_data.get('click_id') if isinstance(tracking_data, dict) else 'N/A'}")
+
+    # Fallback: se click_id não está direto, tenta extrair do tracking_data
+    if not click_id and isinstance(tracking_data, dict):
+        click_id = tracking_data.get('click_id')
+        logger.info(f"🔄 Usando click_id do tracking_data: {click_id}")
+
+    if not click_id:
+        logger.warning(f"⚠️ Transação {transaction_id} sem click_id - conversão não enviada")
+        logger.warning(f"   Dados disponíveis: {list(transaction.keys())}")
+        return None
+
+    return {
+        'token': XTRACKY_TOKEN,
+        'click_id': click_id,
+        'value': float(transaction.get('amount', 0)),
+        'currency': 'BRL',
+        'status': 'paid'
+    }
+#================= FECHAMENTO ======================
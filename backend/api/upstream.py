@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Clientes HTTP das APIs externas (TriboPay, Xtracky) com conexões keep-alive
+
+`requests.post` avulso abre TCP+TLS novo a cada chamada - 100-300 ms a mais em
+todo checkout contra APIs hospedadas no Brasil. Cada upstream aqui tem uma
+requests.Session própria com pool de conexões (HTTPAdapter) reaproveitadas,
+timeouts de conexão/leitura configuráveis e um histograma de latência.
+
+A sessão é do processo: um worker criado por fork abre a sua na primeira
+chamada (ou em `warm_all()`, no início do worker), nunca reutiliza sockets do
+master. O modo assíncrono usa sua própria aiohttp.ClientSession, mas registra
+as latências nos mesmos histogramas.
+"""
+
+import os
+import time
+import logging
+import threading
+from bisect import bisect_left
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import tribopay
+
+logger = logging.getLogger(__name__)
+
+# Limites superiores (ms) dos buckets; o último bucket (+Inf) pega o resto
+LATENCY_BUCKETS_MS = (25, 50, 100, 200, 300, 500, 750, 1000, 2000, 5000, 10000, 20000)
+
+
+class LatencyHistogram:
+    """Histograma de latência em buckets fixos, com contagem por resultado"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._outcomes = {}
+        self._total = 0.0
+        self._max = 0.0
+
+    def observe(self, elapsed, outcome):
+        """Registra uma chamada de `elapsed` segundos com resultado `outcome` (ex.: '2xx', 'timeout')"""
+        ms = elapsed * 1000
+        with self._lock:
+            self._counts[bisect_left(self.buckets, ms)] += 1
+            self._outcomes[outcome] = self._outcomes.get(outcome, 0) + 1
+            self._total += ms
+            self._max = max(self._max, ms)
+
+    def _percentile(self, counts, count, q):
+        # Limite superior do bucket onde cai o percentil (None se for o +Inf)
+        rank = q * count
+        seen = 0
+        for i, n in enumerate(counts):
+            seen += n
+            if seen >= rank:
+                return self.buckets[i] if i < len(self.buckets) else None
+        return None
+
+    def snapshot(self):
+        with self._lock:
+            counts = list(self._counts)
+            outcomes = dict(self._outcomes)
+            total, max_ms = self._total, self._max
+        count = sum(counts)
+        lower = (0,) + self.buckets
+        labels = [f"{low}-{high}ms" for low, high in zip(lower, self.buckets)] + [f"{self.buckets[-1]}ms+"]
+        return {
+            'count': count,
+            'outcomes': outcomes,
+            'buckets': dict(zip(labels, counts)),
+            'avg_ms': round(total / count, 2) if count else 0.0,
+            'max_ms': round(max_ms, 2),
+            'p50_ms': self._percentile(counts, count, 0.50) if count else None,
+            'p95_ms': self._percentile(counts, count, 0.95) if count else None,
+            'p99_ms': self._percentile(counts, count, 0.99) if count else None
+        }
+
+
+def outcome_of(status_code):
+    return f"{status_code // 100}xx"
+
+
+class Upstream:
+    """Sessão keep-alive + timeouts + histograma de uma API externa"""
+
+    def __init__(self, name, base_url, pool_size=10, connect_timeout=5.0, read_timeout=20.0,
+                 connect_retries=1, warm_connections=1):
+        self.name = name
+        self.base_url = base_url
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.connect_retries = connect_retries
+        self.warm_connections = warm_connections
+        self.histogram = LatencyHistogram()
+
+        self._lock = threading.Lock()
+        self._session = None
+        self._pid = None
+
+    def _new_session(self):
+        session = requests.Session()
+        # Só falhas de conexão são repetidas: o request ainda não saiu, então
+        # repetir um POST de pagamento não duplica a transação
+        retries = Retry(total=None, connect=self.connect_retries, read=0, redirect=0, status=0, other=0)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=retries)
+        session.mount(self.base_url, adapter)
+        return session
+
+    @property
+    def session(self):
+        """Sessão do processo atual (recriada após fork)"""
+        pid = os.getpid()
+        with self._lock:
+            if self._session is None or self._pid != pid:
+                # Sessão herdada do master não é fechada aqui: os sockets são dele
+                self._session = self._new_session()
+                self._pid = pid
+            return self._session
+
+    def request(self, method, url, **kwargs):
+        """Como `requests.request`, na sessão keep-alive e medindo a latência"""
+        kwargs.setdefault('timeout', (self.connect_timeout, self.read_timeout))
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except requests.exceptions.Timeout:
+            self.histogram.observe(time.perf_counter() - started, 'timeout')
+            raise
+        except requests.exceptions.RequestException:
+            self.histogram.observe(time.perf_counter() - started, 'error')
+            raise
+        self.histogram.observe(time.perf_counter() - started, outcome_of(response.status_code))
+        return response
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def warm(self):
+        """Abre (TCP+TLS) até `warm_connections` conexões do pool antes do primeiro checkout"""
+        def open_one():
+            try:
+                # Resposta lida por inteiro: a conexão volta para o pool
+                self.session.head(self.base_url, timeout=(self.connect_timeout, self.connect_timeout)).close()
+            except requests.exceptions.RequestException as e:
+                logger.warning(f"⚠️ Pré-aquecimento de {self.name} falhou: {e}")
+
+        # Requests simultâneos: em sequência reaproveitariam sempre a mesma conexão
+        threads = [threading.Thread(target=open_one, daemon=True)
+                   for _ in range(min(self.warm_connections, self.pool_size))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def stats(self):
+        return {
+            'base_url': self.base_url,
+            'pool_size': self.pool_size,
+            'connect_timeout': self.connect_timeout,
+            'read_timeout': self.read_timeout,
+            'latency': self.histogram.snapshot()
+        }
+
+    def close(self):
+        with self._lock:
+            session, self._session = self._session, None
+            owned = self._pid == os.getpid()
+        if session and owned:
+            session.close()
+
+
+def _from_env(name, base_url, pool_size, read_timeout):
+    prefix = f"UPSTREAM_{name.upper()}_"
+    return Upstream(
+        name,
+        base_url,
+        pool_size=int(os.getenv(prefix + 'POOL_SIZE', str(pool_size))),
+        connect_timeout=float(os.getenv(prefix + 'CONNECT_TIMEOUT', '5')),
+        read_timeout=float(os.getenv(prefix + 'READ_TIMEOUT', str(read_timeout))),
+        connect_retries=int(os.getenv(prefix + 'CONNECT_RETRIES', '1')),
+        warm_connections=int(os.getenv(prefix + 'WARM_CONNECTIONS', '1'))
+    )
+
+
+UPSTREAMS = {
+    'tribopay': _from_env('tribopay', 'https://api.tribopay.com.br', pool_size=20,
+                          read_timeout=tribopay.TRIBOPAY_TIMEOUT),
+    'xtracky': _from_env('xtracky', 'https://api.xtracky.com', pool_size=10,
+                         read_timeout=tribopay.XTRACKY_TIMEOUT)
+}
+
+
+def get(name):
+    return UPSTREAMS[name]
+
+
+def warm_all():
+    """Pré-aquece todos os upstreams em paralelo (sem bloquear o início do worker)"""
+    def run():
+        started = time.perf_counter()
+        threads = [threading.Thread(target=upstream.warm, daemon=True) for upstream in UPSTREAMS.values()]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        logger.info(f"🔥 Conexões com {', '.join(UPSTREAMS)} pré-aquecidas em {time.perf_counter() - started:.2f}s")
+
+    threading.Thread(target=run, name='upstream-warmup', daemon=True).start()
+
+
+def close_all():
+    for upstream in UPSTREAMS.values():
+        upstream.close()
+
+
+def stats():
+    return {name: upstream.stats() for name, upstream in UPSTREAMS.items()}
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Ponte aiohttp -> WSGI para servir o app Flask dentro do modo assíncrono
+
+No GATEWAY_MODE=async só o caminho do PIX tem handlers nativos; as demais rotas
+(dashboard, tracking, usuários, exportações) continuam sendo as views
+Flask, executadas num pool de threads para não bloquear o event loop. Respostas
+em streaming (CSV/NDJSON) são repassadas bloco a bloco; um cliente que
+desconecta fecha o iterável WSGI (e com ele o cursor/conexão da exportação).
+"""
+
+import io
+import sys
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+from multidict import CIMultiDict
+
+logger = logging.getLogger(__name__)
+
+# Cabeçalhos de conexão (hop-by-hop) são do aiohttp, não da view
+HOP_BY_HOP = {'connection', 'keep-alive', 'transfer-encoding', 'te', 'trailer', 'upgrade',
+              'proxy-authenticate', 'proxy-authorization'}
+
+
+class WSGIBridge:
+    """Handler aiohttp que executa um app WSGI em threads"""
+
+    def __init__(self, wsgi_app, threads=32):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='wsgi')
+
+    def _environ(self, request, body):
+        path = request.path.encode('utf-8').decode('latin-1')
+        host, _, port = (request.host or 'localhost').partition(':')
+        environ = {
+            'REQUEST_METHOD': request.method,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': path,
+            'QUERY_STRING': request.query_string,
+            'SERVER_NAME': host,
+            'SERVER_PORT': port or ('443' if request.scheme == 'https' else '80'),
+            'SERVER_PROTOCOL': f"HTTP/{request.version.major}.{request.version.minor}",
+            'REMOTE_ADDR': request.remote or '',
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': request.scheme,
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False
+        }
+        if 'Content-Type' in request.headers:
+            environ['CONTENT_TYPE'] = request.headers['Content-Type']
+        environ['CONTENT_LENGTH'] = str(len(body))
+        for name, value in request.headers.items():
+            key = 'HTTP_' + name.upper().replace('-', '_')
+            if key in ('HTTP_CONTENT_TYPE', 'HTTP_CONTENT_LENGTH'):
+                continue
+            # Cabeçalhos repetidos viram uma lista separada por vírgula (RFC 7230)
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+        return environ
+
+    def _start(self, environ):
+        """Chama o app (na thread) e lê o corpo inteiro se ele tiver tamanho conhecido"""
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['reason'] = status.split(' ', 1)[1] if ' ' in status else None
+            started['headers'] = headers
+
+        result = self.wsgi_app(environ, start_response)
+        headers = {name.lower() for name, _ in started['headers']}
+        if 'content-length' in headers:
+            try:
+                body = b''.join(result)
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+            return started, body, None
+        return started, None, result
+
+    @staticmethod
+    def _close(pending, result):
+        """Fecha o iterável WSGI depois que a leitura em andamento (se houver) terminar"""
+        if pending is not None:
+            try:
+                pending.result()
+            except Exception:
+                pass
+        close = getattr(result, 'close', None)
+        if close:
+            close()
+
+    async def __call__(self, request):
+        loop = asyncio.get_running_loop()
+        body = await request.read()
+        started, body, result = await loop.run_in_executor(self.executor, self._start, self._environ(request, body))
+
+        headers = CIMultiDict((name, value) for name, value in started['headers'] if name.lower() not in HOP_BY_HOP)
+        if result is None:
+            return web.Response(status=started['status'], reason=started['reason'], body=body, headers=headers)
+
+        # Streaming: cada bloco é lido na thread (a view pode bloquear esperando dados, ex.: cursor da exportação)
+        response = web.StreamResponse(status=started['status'], reason=started['reason'], headers=headers)
+        chunks = iter(result)
+        pending = None
+        try:
+            await response.prepare(request)
+            while True:
+                pending = self.executor.submit(next, chunks, None)
+                chunk = await asyncio.wrap_future(pending)
+                pending = None
+                if chunk is None:
+                    break
+                if chunk:
+                    await response.write(chunk)
+            await response.write_eof()
+        except (ConnectionResetError, asyncio.CancelledError):
+            logger.info(f"🔌 Cliente desconectou durante o streaming de {request.path}")
+            raise
+        finally:
+            # Sem await: com o cliente fora, o próximo bloco pode demorar (lote da exportação)
+            self.executor.submit(self._close, pending, result)
+        return response
+
+    def close(self):
+        self.executor.shutdown(wait=False)
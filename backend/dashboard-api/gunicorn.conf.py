@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Gunicorn da Dashboard API (produção): gunicorn -c gunicorn.conf.py
+
+Mesmo modelo do API Gateway (backend/api/gunicorn.conf.py): um worker gthread
+por core, app pré-carregado no master e pools/threads abertos por worker em
+post_fork; no SIGTERM os requests em andamento terminam antes do encerramento.
+"""
+
+import os
+import sys
+import signal
+
+
+def _cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8081')}"
+workers = int(os.getenv('WEB_CONCURRENCY', str(_cores())))
+worker_class = 'gthread'
+# Cada stream SSE (/api/events) segura uma thread pelo tempo em que a aba fica
+# aberta: as threads padrão somam o limite de streams às 8 das demais rotas
+threads = int(os.getenv('GUNICORN_THREADS') or 8 + int(os.getenv('EVENTS_MAX_STREAMS', '4')))
+wsgi_app = 'main:app'
+
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') != '0'
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '60'))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '0'))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', '0'))
+
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+
+
+def when_ready(server):
+    if server.cfg.preload_app:
+        import main
+        main.before_fork()
+        server.log.info("✅ App pré-carregado; conexões do master fechadas antes dos forks")
+
+
+def post_fork(server, worker):
+    if server.cfg.preload_app:
+        import main
+        main.after_fork()
+        server.log.info(f"🔄 Worker {worker.pid}: pools e threads próprios abertos")
+
+
+def post_worker_init(worker):
+    import main
+    handle_exit = worker.handle_exit
+
+    def drain(sig, frame):
+        main.begin_shutdown()
+        handle_exit(sig, frame)
+
+    signal.signal(signal.SIGTERM, drain)
+
+
+def worker_exit(server, worker):
+    main = sys.modules.get('main')
+    if main is None:
+        # Worker caiu antes de carregar o app
+        return
+    main.shutdown()
+    server.log.info(f"👋 Worker {worker.pid} encerrado (requests drenados, pools fechados)")
@@ -6,13 +6,25 @@ Dashboard API - Serviço para fornecer dados do PostgreSQL para dashboard
 import os
 import logging
 import json
-from datetime import datetime, timedelta
-from flask import Flask, request, jsonify
+import threading
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 import psycopg2
 import psycopg2.extras
 from contextlib import contextmanager
 
+# Módulos compartilhados com o API Gateway: pacote backend/shared, instalado
+# pelo requirements.txt
+from date_filters import date_range_condition
+from pagination import encode_cursor, decode_cursor, decode_watermark, InvalidCursor
+import dashboard_queries
+from pool import ConnectionPool
+from replica import create_router
+from response_cache import dashboard_cache
+from event_bus import create_bus, sse_stream, StreamLimitReached
+import exports
+from schema import SchemaCapabilities
+
 # Configuração de logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -25,37 +37,91 @@ CORS(app)
 DATABASE_URL = os.getenv('DATABASE_URL')
 API_PORT = int(os.getenv('PORT', '8081'))
 
+# Só consultas analíticas: mesmo statement_timeout das rotas da dashboard no
+# gateway, para uma consulta descontrolada não segurar conexão e thread
+CONNECT_TIMEOUT = int(os.getenv('DB_CONNECT_TIMEOUT', '5'))
+STATEMENT_TIMEOUT_MS = int(os.getenv('DB_DASHBOARD_STATEMENT_TIMEOUT_MS', '15000'))
+
+# Os eventos do gateway chegam por LISTEN/NOTIFY: única forma deste processo
+# saber que o cache ficou velho antes do TTL. Este serviço é o único que serve
+# o stream SSE; cada aba aberta segura uma thread, daí o limite por worker
+EVENTS_MAX_STREAMS = int(os.getenv('EVENTS_MAX_STREAMS', '4'))
+events = create_bus(DATABASE_URL, os.getenv('DATABASE_SSLMODE', 'require'), cache=dashboard_cache,
+                    max_subscribers=EVENTS_MAX_STREAMS) if DATABASE_URL else None
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Pool de conexões do processo (mesmo ConnectionPool do API Gateway)"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(
+                DATABASE_URL,
+                min_size=int(os.getenv('DB_POOL_MIN', '1')),
+                max_size=int(os.getenv('DB_POOL_MAX', '10')),
+                idle_timeout=float(os.getenv('DB_POOL_IDLE_TIMEOUT', '300')),
+                checkout_timeout=float(os.getenv('DB_POOL_CHECKOUT_TIMEOUT', '10')),
+                sslmode=os.getenv('DATABASE_SSLMODE', 'require'),
+                connect_timeout=CONNECT_TIMEOUT,
+                options=f"-c statement_timeout={STATEMENT_TIMEOUT_MS}"
+            )
+        return _pool
+
 @contextmanager
 def get_connection():
-    """Context manager para conexões PostgreSQL"""
+    """Context manager para conexões PostgreSQL (emprestadas do pool)"""
     conn = None
+    broken = False
     try:
-        conn = psycopg2.connect(DATABASE_URL, sslmode='require')
+        conn = get_pool().getconn()
         yield conn
         conn.commit()
     except Exception as e:
         if conn:
-            conn.rollback()
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                broken = True
+        if isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError)):
+            broken = True
         logger.error(f"❌ Erro no database: {e}")
         raise
     finally:
         if conn:
-            conn.close()
+            get_pool().putconn(conn, discard=broken)
 
-def check_table_exists(table_name):
-    """Verifica se tabela existe"""
-    try:
+# Todas as consultas deste serviço são leituras analíticas: vão para a réplica
+# (DATABASE_REPLICA_URL) quando saudável. O rollup diário é fechado pelo gateway
+# (rollups.RollupRefresher); aqui só é lido
+replica = create_router(
+    os.getenv('DATABASE_REPLICA_URL'),
+    sslmode=os.getenv('DATABASE_SSLMODE', 'require'),
+    connect_timeout=CONNECT_TIMEOUT,
+    options=f"-c statement_timeout={STATEMENT_TIMEOUT_MS}"
+)
+
+@contextmanager
+def read_connection():
+    """Conexão de leitura: réplica saudável ou, na falta dela, o primário"""
+    if replica is None:
         with get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT EXISTS (
-                    SELECT FROM information_schema.tables 
-                    WHERE table_name = %s
-                )
-            """, (table_name,))
-            return cursor.fetchone()[0]
-    except:
-        return False
+            yield conn
+        return
+    with replica.connection(get_connection) as conn:
+        yield conn
+
+# Tabelas são garantidas pelas migrações do gateway (migrate.py); só colunas
+# opcionais precisam ser resolvidas, uma vez por processo
+capabilities = SchemaCapabilities()
+
+def get_capabilities():
+    """Capacidades do schema (resolvidas na primeira chamada)"""
+    if capabilities.resolved_at is None:
+        with get_connection() as conn:
+            capabilities.refresh(conn)
+    return capabilities
 
 @app.route('/health', methods=['GET'])
 def health_check():
@@ -64,10 +130,24 @@ def health_check():
         with get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT 1")
-            return jsonify({'status': 'healthy', 'database': 'connected'}), 200
+            return jsonify({'status': 'healthy', 'database': 'connected',
+                            'replica': replica.stats() if replica else None}), 200
     except Exception as e:
         return jsonify({'status': 'unhealthy', 'error': str(e)}), 500
 
+def fetch_overview(start_date, end_date):
+    """Funil inteiro num único statement sobre o rollup diário (compartilhado com o gateway)"""
+    with read_connection() as conn:
+        cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        return dashboard_queries.overview(cursor, start_date, end_date)
+
+def fetch_sales(start_date, end_date, since=None):
+    """Totais e séries da aba Vendas numa única conexão"""
+    has_plano_id = get_capabilities().has_plano_id
+    with read_connection() as conn:
+        cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        return dashboard_queries.sales(cursor, start_date, end_date, has_plano_id=has_plano_id, since=since)
+
 @app.route('/api/overview', methods=['GET'])
 def get_overview():
     """Dados para aba Visão Geral"""
@@ -75,79 +155,8 @@ def get_overview():
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
         
-        data = {}
-        
-        with get_connection() as conn:
-            cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-            
-            # Base query for date filtering
-            date_filter = ""
-            date_params = []
-            
-            if start_date and end_date:
-                date_filter = "WHERE created_at::date BETWEEN %s AND %s"
-                date_params = [start_date, end_date]
-            
-            # 1. Entradas na presell (tracking_mapping)
-            if check_table_exists('tracking_mapping'):
-                cursor.execute(f"""
-                    SELECT COUNT(*) as total 
-                    FROM tracking_mapping {date_filter}
-                """, date_params)
-                data['presell_entries'] = cursor.fetchone()['total']
-            else:
-                data['presell_entries'] = 0
-            
-            # 2. /start no bot (bot_users)
-            if check_table_exists('bot_users'):
-                cursor.execute(f"""
-                    SELECT COUNT(*) as total 
-                    FROM bot_users {date_filter}
-                """, date_params)
-                data['bot_starts'] = cursor.fetchone()['total']
-            else:
-                data['bot_starts'] = 0
-            
-            # 3. PIX gerados (pix_transactions)
-            if check_table_exists('pix_transactions'):
-                cursor.execute(f"""
-                    SELECT COUNT(*) as total 
-                    FROM pix_transactions {date_filter}
-                """, date_params)
-                data['pix_generated'] = cursor.fetchone()['total']
-                
-                # PIX pagos
-                cursor.execute(f"""
-                    SELECT COUNT(*) as total 
-                    FROM pix_transactions 
-                    WHERE status = 'paid' {' AND ' + date_filter.replace('WHERE ', '') if date_filter else ''}
-                """, date_params)
-                data['pix_paid'] = cursor.fetchone()['total']
-            else:
-                data['pix_generated'] = 0
-                data['pix_paid'] = 0
-            
-            # 4. Conversões (conversion_logs)
-            if check_table_exists('conversion_logs'):
-                cursor.execute(f"""
-                    SELECT COUNT(*) as total 
-                    FROM conversion_logs {date_filter}
-                """, date_params)
-                data['conversions'] = cursor.fetchone()['total']
-            else:
-                data['conversions'] = 0
-                
-        # Etapas do funil (simulado por enquanto)
-        data['step_1_welcome'] = data['bot_starts']
-        data['step_2_preview'] = int(data['bot_starts'] * 0.8)
-        data['step_3_gallery'] = int(data['bot_starts'] * 0.6)
-        data['step_4_vip_plans'] = int(data['bot_starts'] * 0.4)
-        data['step_5_payment'] = data['pix_generated']
-        
-        # Dados adicionais
-        data['blocked_users'] = 0  # Implementar quando houver tabela
-        data['joined_group'] = 0   # Implementar quando houver tabela
-        data['left_group'] = 0     # Implementar quando houver tabela
+        data = dashboard_cache.get_or_compute(
+            'overview', start_date, end_date, lambda: fetch_overview(start_date, end_date))
         
         return jsonify(data)
         
@@ -162,107 +171,17 @@ def get_sales():
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
         
-        data = {
-            'total_revenue': 0,
-            'total_transactions': 0,
-            'conversion_rate': 0,
-            'average_ticket': 0,
-            'sales_by_date': [],
-            'sales_by_plan': []
-        }
-        
-        if not check_table_exists('pix_transactions'):
-            return jsonify(data)
+        try:
+            since = decode_watermark(request.args['since']) if request.args.get('since') else None
+        except InvalidCursor as e:
+            return jsonify({'error': str(e)}), 400
         
-        with get_connection() as conn:
-            cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-            
-            # Base query for date filtering
-            date_filter = ""
-            date_params = []
-            
-            if start_date and end_date:
-                date_filter = "WHERE created_at::date BETWEEN %s AND %s"
-                date_params = [start_date, end_date]
-            
-            # Total de vendas
-            cursor.execute(f"""
-                SELECT 
-                    SUM(amount) as total_revenue,
-                    COUNT(*) as total_transactions,
-                    AVG(amount) as average_ticket
-                FROM pix_transactions 
-                WHERE status = 'paid' {' AND ' + date_filter.replace('WHERE ', '') if date_filter else ''}
-            """, date_params)
-            
-            result = cursor.fetchone()
-            if result:
-                data['total_revenue'] = float(result['total_revenue'] or 0)
-                data['total_transactions'] = result['total_transactions']
-                data['average_ticket'] = float(result['average_ticket'] or 0)
-            
-            # Taxa de conversão
-            cursor.execute(f"""
-                SELECT COUNT(*) as total_pix 
-                FROM pix_transactions {date_filter}
-            """, date_params)
-            
-            total_pix = cursor.fetchone()['total_pix']
-            if total_pix > 0:
-                data['conversion_rate'] = (data['total_transactions'] / total_pix) * 100
-            
-            # Vendas por data (últimos 30 dias ou período selecionado)
-            if not start_date or not end_date:
-                start_date = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
-                end_date = datetime.now().strftime('%Y-%m-%d')
-            
-            cursor.execute("""
-                SELECT 
-                    created_at::date as date,
-                    SUM(amount) as revenue,
-                    COUNT(*) as transactions
-                FROM pix_transactions 
-                WHERE status = 'paid' 
-                AND created_at::date BETWEEN %s AND %s
-                GROUP BY created_at::date
-                ORDER BY date DESC
-            """, [start_date, end_date])
-            
-            sales_by_date = cursor.fetchall()
-            data['sales_by_date'] = [
-                {
-                    'date': row['date'].strftime('%Y-%m-%d'),
-                    'revenue': float(row['revenue']),
-                    'transactions': row['transactions']
-                } for row in sales_by_date
-            ]
-            
-            # Vendas por plano (se coluna plano_id existir)
-            cursor.execute("""
-                SELECT column_name 
-                FROM information_schema.columns 
-                WHERE table_name='pix_transactions' AND column_name='plano_id'
-            """)
-            
-            if cursor.fetchone():
-                cursor.execute(f"""
-                    SELECT 
-                        plano_id,
-                        SUM(amount) as revenue,
-                        COUNT(*) as transactions
-                    FROM pix_transactions 
-                    WHERE status = 'paid' {' AND ' + date_filter.replace('WHERE ', '') if date_filter else ''}
-                    GROUP BY plano_id
-                """, date_params)
-                
-                sales_by_plan = cursor.fetchall()
-                data['sales_by_plan'] = [
-                    {
-                        'plan': row['plano_id'] or 'Sem plano',
-                        'revenue': float(row['revenue']),
-                        'transactions': row['transactions']
-                    } for row in sales_by_plan
-                ]
+        if since:
+            # Delta-sync: só os dias alterados desde a marca d'água (não passa pelo cache)
+            data = fetch_sales(start_date, end_date, since=since)
+        else:
+            data = dashboard_cache.get_or_compute(
+                'sales', start_date, end_date, lambda: fetch_sales(start_date, end_date))
         
         return jsonify(data)
         
@@ -270,140 +189,303 @@ def get_sales():
         logger.error(f"❌ Erro em get_sales: {e}")
         return jsonify({'error': str(e)}), 500
 
+# Fontes de /api/logs na ordem de desempate do merge (created_at, fonte, id)
+LOG_SOURCE_CONVERSION = 0
+LOG_SOURCE_PIX = 1
+
+def keyset_condition(source, after):
+    """Condição sargável para retomar a fonte `source` após o cursor `after`.
+
+    A ordem global é (created_at, fonte, id) decrescente; para uma fonte fixa
+    isso vira uma comparação simples em (created_at, id), servida pelo índice.
+    """
+    if not after:
+        return 'TRUE', []
+    if source < after['s']:
+        return 'created_at <= %s', [after['t']]
+    if source == after['s']:
+        return '(created_at, id) < (%s, %s)', [after['t'], after['id']]
+    return 'created_at < %s', [after['t']]
+
+def logs_page(cursor, start_date, end_date, limit, after=None):
+    """Página de /api/logs: merge por keyset de conversion_logs e pix_transactions"""
+    # (created_at, fonte, id, log) - cada fonte traz no máximo limit + 1 linhas
+    entries = []
+    
+    date_filter, date_params = date_range_condition(start_date, end_date)
+    
+    # Logs de conversão
+    seek, seek_params = keyset_condition(LOG_SOURCE_CONVERSION, after)
+    cursor.execute(f"""
+        SELECT 
+            id,
+            'conversion' as type,
+            transaction_id,
+            click_id,
+            utm_source,
+            utm_campaign,
+            conversion_value,
+            status,
+            created_at
+        FROM conversion_logs WHERE {date_filter} AND {seek}
+        ORDER BY created_at DESC, id DESC
+        LIMIT %s
+    """, date_params + seek_params + [limit + 1])
+        
+    entries.extend([
+        (row['created_at'], LOG_SOURCE_CONVERSION, row['id'], {
+            'type': 'Conversão',
+            'message': f"Conversão {row['transaction_id']} - {row['status']}",
+            'details': {
+                'click_id': row['click_id'],
+                'utm_source': row['utm_source'],
+                'utm_campaign': row['utm_campaign'],
+                'value': float(row['conversion_value']) if row['conversion_value'] else 0
+            },
+            'created_at': row['created_at'].isoformat() if row['created_at'] else None
+        }) for row in cursor.fetchall()
+    ])
+    
+    # Logs de transações PIX
+    seek, seek_params = keyset_condition(LOG_SOURCE_PIX, after)
+    cursor.execute(f"""
+        SELECT 
+            id,
+            transaction_id,
+            telegram_id,
+            amount,
+            status,
+            created_at,
+            updated_at
+        FROM pix_transactions WHERE {date_filter} AND {seek}
+        ORDER BY created_at DESC, id DESC
+        LIMIT %s
+    """, date_params + seek_params + [limit + 1])
+        
+    entries.extend([
+        (row['created_at'], LOG_SOURCE_PIX, row['id'], {
+            'type': 'PIX',
+            'message': f"PIX {row['transaction_id']} - {row['status']} - R$ {float(row['amount'])}",
+            'details': {
+                'telegram_id': row['telegram_id'],
+                'amount': float(row['amount']),
+                'status': row['status'],
+                'updated_at': row['updated_at'].isoformat() if row['updated_at'] else None
+            },
+            'created_at': row['created_at'].isoformat() if row['created_at'] else None
+        }) for row in cursor.fetchall()
+    ])
+
+    # Merge das fontes pela ordem global (created_at, fonte, id)
+    entries.sort(key=lambda e: (e[0], e[1], e[2]), reverse=True)
+    page = entries[:limit]
+    
+    next_cursor = None
+    if len(entries) > limit:
+        created_at, source, row_id, _ = page[-1]
+        next_cursor = encode_cursor(created_at, row_id, s=source)
+    
+    return {'logs': [e[3] for e in page], 'next_cursor': next_cursor}
+
+def fetch_logs_page(start_date, end_date, limit, after):
+    with read_connection() as conn:
+        cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        return logs_page(cursor, start_date, end_date, limit, after)
+
 @app.route('/api/logs', methods=['GET'])
 def get_logs():
-    """Logs detalhados do sistema"""
+    """Logs detalhados do sistema (paginação por cursor: ?cursor=<next_cursor>)"""
     try:
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
         limit = int(request.args.get('limit', 100))
+        cursor_token = request.args.get('cursor')
         
-        logs = []
+        try:
+            after = decode_cursor(cursor_token) if cursor_token else None
+            if after:
+                after['s'] = int(after.get('s', LOG_SOURCE_PIX))
+        except (InvalidCursor, ValueError, TypeError) as e:
+            return jsonify({'error': str(e)}), 400
         
-        with get_connection() as conn:
-            cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-            
-            date_filter = ""
-            date_params = []
-            
-            if start_date and end_date:
-                date_filter = "WHERE created_at::date BETWEEN %s AND %s"
-                date_params = [start_date, end_date]
-            
-            # Logs de conversão
-            if check_table_exists('conversion_logs'):
-                cursor.execute(f"""
-                    SELECT 
-                        'conversion' as type,
-                        transaction_id,
-                        click_id,
-                        utm_source,
-                        utm_campaign,
-                        conversion_value,
-                        status,
-                        created_at
-                    FROM conversion_logs {date_filter}
-                    ORDER BY created_at DESC
-                    LIMIT %s
-                """, date_params + [limit])
-                
-                conversion_logs = cursor.fetchall()
-                logs.extend([
-                    {
-                        'type': 'Conversão',
-                        'message': f"Conversão {row['transaction_id']} - {row['status']}",
-                        'details': {
-                            'click_id': row['click_id'],
-                            'utm_source': row['utm_source'],
-                            'utm_campaign': row['utm_campaign'],
-                            'value': float(row['conversion_value']) if row['conversion_value'] else 0
-                        },
-                        'created_at': row['created_at'].isoformat() if row['created_at'] else None
-                    } for row in conversion_logs
-                ])
-            
-            # Logs de transações PIX
-            if check_table_exists('pix_transactions'):
-                cursor.execute(f"""
-                    SELECT 
-                        transaction_id,
-                        telegram_id,
-                        amount,
-                        status,
-                        created_at,
-                        updated_at
-                    FROM pix_transactions {date_filter}
-                    ORDER BY created_at DESC
-                    LIMIT %s
-                """, date_params + [limit])
-                
-                pix_logs = cursor.fetchall()
-                logs.extend([
-                    {
-                        'type': 'PIX',
-                        'message': f"PIX {row['transaction_id']} - {row['status']} - R$ {float(row['amount'])}",
-                        'details': {
-                            'telegram_id': row['telegram_id'],
-                            'amount': float(row['amount']),
-                            'status': row['status'],
-                            'updated_at': row['updated_at'].isoformat() if row['updated_at'] else None
-                        },
-                        'created_at': row['created_at'].isoformat() if row['created_at'] else None
-                    } for row in pix_logs
-                ])
+        data = dashboard_cache.get_or_compute(
+            'logs', start_date, end_date,
+            lambda: fetch_logs_page(start_date, end_date, limit, after),
+            limit, cursor_token, ttl=dashboard_cache.open_ttl)
+        return jsonify(data)
+        
+    except Exception as e:
+        logger.error(f"❌ Erro em get_logs: {e}")
+        return jsonify({'error': str(e)}), 500
+
+def fetch_dashboard(panels, start_date, end_date, logs_limit, since=None):
+    """Painéis pedidos numa conexão do pool e num único snapshot REPEATABLE READ.
+
+    Os logs do sistema não têm delta-sync (não há chave estável para o merge no
+    cliente): com `since` o painel de logs volta sempre a primeira página.
+    """
+    has_plano_id = get_capabilities().has_plano_id
+    with read_connection() as conn:
+        return dashboard_queries.dashboard(
+            conn, panels, start_date, end_date,
+            has_plano_id=has_plano_id,
+            logs=lambda cursor, since, watermark: logs_page(cursor, start_date, end_date, logs_limit),
+            since=since
+        )
+
+@app.route('/api/dashboard', methods=['GET'])
+def get_dashboard():
+    """Painéis da dashboard (?panels=overview,sales,logs) num único request"""
+    try:
+        start_date = request.args.get('start_date')
+        end_date = request.args.get('end_date')
+        limit = int(request.args.get('limit', 100))
         
-        # Ordena por data
-        logs.sort(key=lambda x: x['created_at'] or '', reverse=True)
+        try:
+            panels = dashboard_queries.parse_panels(request.args.get('panels'))
+            since = decode_watermark(request.args['since']) if request.args.get('since') else None
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        return jsonify({'logs': logs[:limit]})
+        if since:
+            data = fetch_dashboard(panels, start_date, end_date, limit, since=since)
+        else:
+            data = dashboard_cache.get_or_compute(
+                'dashboard', start_date, end_date,
+                lambda: fetch_dashboard(panels, start_date, end_date, limit),
+                tuple(panels), limit,
+                ttl=dashboard_cache.open_ttl if 'logs' in panels else None)
+        return jsonify(data)
         
     except Exception as e:
-        logger.error(f"❌ Erro em get_logs: {e}")
+        logger.error(f"❌ Erro em get_dashboard: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/export/<table>', methods=['GET'])
+def export_table(table):
+    """Exportação em streaming (?format=csv|ndjson&columns=a,b&start_date=&end_date=)"""
+    try:
+        columns, fmt, start_date, end_date = exports.parse_request(table, request.args)
+    except exports.InvalidExport as e:
+        return jsonify({'error': str(e)}), 400
+    
+    logger.info(f"📤 Exportando {table} ({fmt}): {start_date or 'início'} - {end_date or 'hoje'}")
+    return Response(
+        stream_with_context(exports.stream_export(read_connection, table, columns, fmt, start_date, end_date)),
+        mimetype=exports.FORMATS[fmt],
+        headers={
+            'Content-Disposition': f'attachment; filename="{exports.filename(table, fmt, start_date, end_date)}"',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+@app.route('/api/events', methods=['GET'])
+def dashboard_events():
+    """Server-Sent Events com os deltas ao vivo do funil"""
+    if not events:
+        return jsonify({'error': 'DATABASE_URL não configurado'}), 500
+    try:
+        q = events.subscribe()
+    except StreamLimitReached as e:
+        # O EventSource não reconecta após um 503: a dashboard cai para o auto-refresh
+        logger.warning(f"⚠️ {e} - stream recusado")
+        response = jsonify({'error': str(e)})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 503
+    response = Response(
+        stream_with_context(sse_stream(events, q)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    response.call_on_close(lambda: events.unsubscribe(q))
+    return response
+
+def fetch_stats_summary():
+    """Totais de transações e receita das últimas 24h e da última semana"""
+    with read_connection() as conn:
+        cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        
+        stats = {}
+        
+        # Stats das últimas 24h
+        cursor.execute("""
+            SELECT 'last_24h' as period,
+                COALESCE(COUNT(CASE WHEN created_at > NOW() - INTERVAL '24 hours' THEN 1 END), 0) as new_users,
+                COALESCE(SUM(CASE WHEN status = 'paid' AND created_at > NOW() - INTERVAL '24 hours' THEN amount END), 0) as revenue_24h
+            FROM pix_transactions
+            WHERE created_at > NOW() - INTERVAL '24 hours'
+        """)
+        
+        last_24h = cursor.fetchone()
+        stats['last_24h'] = {
+            'new_transactions': last_24h['new_users'],
+            'revenue': float(last_24h['revenue_24h'] or 0)
+        }
+        
+        # Stats da última semana
+        cursor.execute("""
+            SELECT 'last_week' as period,
+                COALESCE(COUNT(CASE WHEN created_at > NOW() - INTERVAL '7 days' THEN 1 END), 0) as new_users,
+                COALESCE(SUM(CASE WHEN status = 'paid' AND created_at > NOW() - INTERVAL '7 days' THEN amount END), 0) as revenue_week
+            FROM pix_transactions
+            WHERE created_at > NOW() - INTERVAL '7 days'
+        """)
+        
+        last_week = cursor.fetchone()
+        stats['last_week'] = {
+            'new_transactions': last_week['new_users'],
+            'revenue': float(last_week['revenue_week'] or 0)
+        }
+        
+        return stats
+
 @app.route('/api/stats/summary', methods=['GET'])
 def get_stats_summary():
     """Resumo estatístico geral"""
     try:
-        with get_connection() as conn:
-            cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-            
-            stats = {}
-            
-            # Stats das últimas 24h
-            cursor.execute("""
-                SELECT 'last_24h' as period,
-                    COALESCE(COUNT(CASE WHEN created_at > NOW() - INTERVAL '24 hours' THEN 1 END), 0) as new_users,
-                    COALESCE(SUM(CASE WHEN status = 'paid' AND created_at > NOW() - INTERVAL '24 hours' THEN amount END), 0) as revenue_24h
-                FROM pix_transactions
-            """)
-            
-            last_24h = cursor.fetchone()
-            stats['last_24h'] = {
-                'new_transactions': last_24h['new_users'],
-                'revenue': float(last_24h['revenue_24h'] or 0)
-            }
-            
-            # Stats da última semana
-            cursor.execute("""
-                SELECT 'last_week' as period,
-                    COALESCE(COUNT(CASE WHEN created_at > NOW() - INTERVAL '7 days' THEN 1 END), 0) as new_users,
-                    COALESCE(SUM(CASE WHEN status = 'paid' AND created_at > NOW() - INTERVAL '7 days' THEN amount END), 0) as revenue_week
-                FROM pix_transactions
-            """)
-            
-            last_week = cursor.fetchone()
-            stats['last_week'] = {
-                'new_transactions': last_week['new_users'],
-                'revenue': float(last_week['revenue_week'] or 0)
-            }
-            
-            return jsonify(stats)
+        stats = dashboard_cache.get_or_compute('stats_summary', None, None, fetch_stats_summary)
+        return jsonify(stats)
             
     except Exception as e:
         logger.error(f"❌ Erro em get_stats_summary: {e}")
         return jsonify({'error': str(e)}), 500
 
+# Ciclo de vida dos workers do gunicorn (gunicorn.conf.py, preload_app)
+def before_fork():
+    """Master: fecha conexões e threads antes dos forks"""
+    global _pool
+    if events:
+        events.stop(timeout=10)
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool:
+        pool.closeall()
+    if replica:
+        replica.close()
+
+def after_fork():
+    """Worker: pool (criado sob demanda), réplica e LISTEN próprios do processo"""
+    global _pool, _pool_lock
+    _pool = None
+    _pool_lock = threading.Lock()
+    if replica:
+        replica.after_fork()
+    if events:
+        events.start()
+
+def begin_shutdown():
+    """SIGTERM: encerra os streams SSE para o drain não esperar o graceful_timeout"""
+    if events:
+        events.stop()
+
+def shutdown():
+    """Worker encerrando, depois do drain dos requests em andamento"""
+    begin_shutdown()
+    if _pool:
+        _pool.closeall()
+    if replica:
+        replica.close()
+
 if __name__ == '__main__':
     logger.info("🚀 Dashboard API iniciando...")
     
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Circuit breaker das conexões PostgreSQL do API Gateway
+
+Com o banco lento, cada request esperaria o statement_timeout inteiro (ou o
+checkout do pool) antes de falhar, e os workers se acumulariam. Depois de
+`failure_threshold` falhas seguidas de saúde do banco (timeout de statement,
+conexão recusada/caída, pool esgotado) o circuito abre: por `reset_timeout`
+segundos os requests falham na hora com DatabaseUnavailable (503). Em seguida
+um único request de sonda passa; se der certo o circuito fecha, senão reabre.
+"""
+
+import math
+import time
+import logging
+import threading
+
+import psycopg2
+import psycopg2.errors
+
+from pool import PoolTimeout
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class DatabaseUnavailable(Exception):
+    """Circuito aberto: o banco está indisponível/lento e o request falha sem esperar"""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"Banco de dados indisponível (circuito '{name}' aberto)")
+        self.name = name
+        self.retry_after = retry_after
+
+
+def is_database_failure(error):
+    """Erros que indicam banco lento/fora (e não erro da própria query)"""
+    return isinstance(error, (psycopg2.OperationalError, psycopg2.InterfaceError, PoolTimeout))
+
+
+def is_broken_connection(error):
+    """Conexão inutilizável após o erro (um statement cancelado por timeout não conta)"""
+    if isinstance(error, psycopg2.errors.QueryCanceled):
+        return False
+    return isinstance(error, (psycopg2.OperationalError, psycopg2.InterfaceError))
+
+
+class CircuitBreaker:
+    """Circuito closed -> open -> half_open (sonda) -> closed/open"""
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._stats = {'opened': 0, 'rejected': 0, 'failures': 0}
+
+    def before(self):
+        """Chamado antes de usar o banco: levanta DatabaseUnavailable com o circuito aberto.
+
+        Retorna True se este request é a sonda de recuperação - quem chama deve
+        registrar o resultado (record_success/record_failure) ou, sem veredito,
+        liberar a sonda com `release_probe()`.
+        """
+        with self._lock:
+            if self._state == CLOSED:
+                return False
+            remaining = self._opened_at + self.reset_timeout - time.monotonic()
+            if self._state == OPEN and remaining <= 0:
+                self._state = HALF_OPEN
+            if self._state == HALF_OPEN and not self._probing:
+                # Este request é a sonda de recuperação
+                self._probing = True
+                logger.info(f"🔄 Circuito '{self.name}': testando o banco novamente")
+                return True
+            self._stats['rejected'] += 1
+            raise DatabaseUnavailable(self.name, max(1, math.ceil(remaining)))
+
+    def release_probe(self):
+        """A sonda terminou sem veredito (ex.: cliente desconectou no meio de um streaming).
+
+        Sem isso o circuito ficaria em half_open recusando tudo até o processo reiniciar;
+        a próxima chamada passa a ser a sonda.
+        """
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            recovered = self._state != CLOSED
+            self._state = CLOSED
+            self._failures = 0
+            self._probing = False
+        if recovered:
+            logger.info(f"✅ Circuito '{self.name}' fechado: banco respondendo novamente")
+
+    def record_failure(self, error):
+        with self._lock:
+            self._stats['failures'] += 1
+            self._failures += 1
+            trip = self._state == HALF_OPEN or (
+                self._state == CLOSED and self._failures >= self.failure_threshold)
+            if trip:
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._probing = False
+                self._stats['opened'] += 1
+        if trip:
+            logger.error(f"❌ Circuito '{self.name}' aberto por {self.reset_timeout:.0f}s após "
+                         f"{self._failures} falha(s) do banco: {error}")
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+            data.update({
+                'state': self._state,
+                'consecutive_failures': self._failures,
+                'failure_threshold': self.failure_threshold,
+                'reset_timeout': self.reset_timeout
+            })
+        return data
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Consultas das abas da dashboard compartilhadas entre o API Gateway e a dashboard-api
+
+Cada função recebe um cursor RealDictCursor (uma conexão por chamada) e devolve
+o payload JSON da rota correspondente.
+"""
+
+import os
+import logging
+from datetime import timedelta
+
+import psycopg2.extras
+
+import rollups
+from date_filters import date_range_condition
+from pagination import encode_cursor, encode_watermark
+
+logger = logging.getLogger(__name__)
+
+# Janela de sales_by_date quando não há período selecionado
+DEFAULT_SALES_DAYS = 30
+
+# Painéis aceitos por /api/dashboard?panels=
+PANELS = ('overview', 'sales', 'logs')
+
+# Delta-sync (?since=): a consulta recua a marca d'água por esta janela para
+# pegar escritas de transações que começaram antes dela e confirmaram depois
+# (o cliente mescla por chave, então repetir linhas é inofensivo)
+DELTA_OVERLAP = timedelta(seconds=float(os.getenv('DELTA_SYNC_OVERLAP_SECONDS', '5')))
+# Acima disso o delta não compensa: o cliente recebe reset e recarrega tudo
+DELTA_MAX_ROWS = int(os.getenv('DELTA_SYNC_MAX_ROWS', '1000'))
+
+
+def current_watermark(cursor):
+    """Marca d'água da leitura: início da transação no relógio do banco.
+
+    Numa réplica (replica.py) usa o último commit já aplicado: o que o primário
+    confirmou depois dele ainda não está visível e precisa entrar no próximo delta.
+    """
+    cursor.execute("""
+        SELECT CASE
+            WHEN pg_is_in_recovery()
+                THEN LEAST(LOCALTIMESTAMP, COALESCE(pg_last_xact_replay_timestamp()::timestamp, LOCALTIMESTAMP))
+            ELSE LOCALTIMESTAMP
+        END AS now
+    """)
+    return cursor.fetchone()['now']
+
+
+def overview_payload(totals):
+    """Payload de /api/overview a partir dos totais do funil"""
+    data = {column: totals[column] for column in rollups.FUNNEL_COLUMNS if column != 'revenue'}
+
+    # Etapas do funil (simulado por enquanto)
+    data['step_1_welcome'] = data['bot_starts']
+    data['step_2_preview'] = int(data['bot_starts'] * 0.8)
+    data['step_3_gallery'] = int(data['bot_starts'] * 0.6)
+    data['step_4_vip_plans'] = int(data['bot_starts'] * 0.4)
+    data['step_5_payment'] = data['pix_generated']
+
+    # Dados adicionais
+    data['blocked_users'] = 0  # Implementar quando houver tabela
+    data['joined_group'] = 0   # Implementar quando houver tabela
+    data['left_group'] = 0     # Implementar quando houver tabela
+    return data
+
+
+def overview(cursor, start_date=None, end_date=None):
+    """Payload de /api/overview - um único statement no banco"""
+    totals, _, _ = rollups.funnel_totals(cursor, start_date, end_date)
+    return overview_payload(totals)
+
+
+def sales(cursor, start_date=None, end_date=None, has_plano_id=False, funnel=None, since=None,
+          watermark=None):
+    """Payload de /api/sales: totais e série diária do rollup, vendas por plano das transações.
+
+    `funnel` reaproveita o resultado de rollups.funnel_totals já calculado na
+    mesma transação (bundle de /api/dashboard). Com `since` (marca d'água
+    decodificada), sales_by_date traz só os dias alterados e `delta` = True.
+    """
+    watermark = watermark or current_watermark(cursor)
+    data = {
+        'total_revenue': 0,
+        'total_transactions': 0,
+        'conversion_rate': 0,
+        'average_ticket': 0,
+        'sales_by_date': [],
+        'sales_by_plan': []
+    }
+
+    totals, first_day, last_day = funnel or rollups.funnel_totals(cursor, start_date, end_date)
+    data['total_revenue'] = totals['revenue']
+    data['total_transactions'] = totals['pix_paid']
+    if totals['pix_paid'] > 0:
+        data['average_ticket'] = totals['revenue'] / totals['pix_paid']
+    if totals['pix_generated'] > 0:
+        data['conversion_rate'] = (totals['pix_paid'] / totals['pix_generated']) * 100
+
+    # Vendas por data (últimos 30 dias ou período selecionado)
+    if not start_date or not end_date:
+        first_day = max(first_day, last_day - timedelta(days=DEFAULT_SALES_DAYS))
+    data['sales_by_date'] = rollups.fetch_sales_by_date(
+        cursor, first_day, last_day, changed_since=since - DELTA_OVERLAP if since else None)
+    data['delta'] = bool(since)
+    data['watermark'] = encode_watermark(watermark)
+
+    # Vendas por plano (o rollup não tem dimensão de plano)
+    if has_plano_id:
+        date_filter, date_params = date_range_condition(start_date, end_date)
+        cursor.execute(f"""
+            SELECT
+                plano_id,
+                SUM(amount) as revenue,
+                COUNT(*) as transactions
+            FROM pix_transactions
+            WHERE status = 'paid' AND {date_filter}
+            GROUP BY plano_id
+        """, date_params)
+        data['sales_by_plan'] = [
+            {
+                'plan': row['plano_id'] or 'Sem plano',
+                'revenue': float(row['revenue']),
+                'transactions': row['transactions']
+            } for row in cursor.fetchall()
+        ]
+
+    return data
+
+
+def users_with_steps_and_pix(cursor, start_date=None, end_date=None, limit=100, after=None,
+                             changed_since=None):
+    """Usuários com última etapa e status PIX, por (última atividade, id) decrescente.
+
+    `after` é o cursor decodificado ({'t': atividade, 'id': id}) da última linha
+    da página anterior: a próxima página é um seek no índice, com custo
+    constante em qualquer profundidade. Com `changed_since`, só usuários
+    criados/atualizados (ou com resumo de funil alterado) depois desse instante.
+    """
+    date_filter, date_params = date_range_condition(start_date, end_date, column='bu.created_at')
+    if after:
+        date_filter += " AND (COALESCE(bu.updated_at, bu.created_at), bu.id) < (%s, %s)"
+        date_params = date_params + [after['t'], after['id']]
+
+    source = "bot_users bu"
+    if changed_since:
+        # Dois seeks por índice (atividade do usuário, updated_at do resumo)
+        source = """(
+            SELECT telegram_id FROM bot_users WHERE COALESCE(updated_at, created_at) > %s
+            UNION
+            SELECT telegram_id FROM user_funnel_summary WHERE updated_at > %s
+        ) changed
+        JOIN bot_users bu ON bu.telegram_id = changed.telegram_id"""
+        date_params = [changed_since, changed_since] + date_params
+
+    # user_funnel_summary é mantido por triggers (migração 0003): leitura
+    # indexada por usuário em vez de agregar user_steps/pix_transactions inteiras
+    cursor.execute(f"""
+        SELECT
+            bu.id,
+            bu.telegram_id,
+            bu.first_name,
+            bu.last_name,
+            bu.username,
+            bu.created_at as user_created_at,
+            bu.updated_at as last_activity,
+            COALESCE(bu.updated_at, bu.created_at) as activity_at,
+
+            -- Última etapa do usuário
+            s.last_step_name,
+            s.last_step_number,
+            s.last_step_description,
+            s.last_step_at,
+
+            -- Status do PIX (se gerou PIX e se pagou)
+            CASE
+                WHEN s.total_pix > 0 THEN 'PIX_GERADO'
+                ELSE 'SEM_PIX'
+            END as pix_status,
+
+            CASE
+                WHEN s.total_paid > 0 THEN 'PAGO'
+                WHEN s.total_pix > 0 THEN 'PENDENTE'
+                ELSE 'SEM_PIX'
+            END as pix_payment_status,
+
+            s.total_pix,
+            s.total_paid,
+            s.total_amount_paid
+
+        FROM {source}
+        LEFT JOIN user_funnel_summary s ON s.telegram_id = bu.telegram_id
+        WHERE {date_filter}
+        ORDER BY COALESCE(bu.updated_at, bu.created_at) DESC, bu.id DESC
+        LIMIT %s
+    """, date_params + [limit])
+    return cursor.fetchall()
+
+
+def member_logs(cursor, start_date=None, end_date=None, limit=100, after=None, since=None,
+                watermark=None):
+    """Payload de /api/logs do gateway: usuários com última etapa e status PIX.
+
+    Com `since` (marca d'água decodificada) retorna só os membros alterados,
+    sem paginação; `reset` = True quando são tantos que o cliente deve recarregar.
+    """
+    watermark = watermark or current_watermark(cursor)
+    next_cursor = None
+    if since:
+        users_data = users_with_steps_and_pix(cursor, start_date, end_date, DELTA_MAX_ROWS + 1,
+                                              changed_since=since - DELTA_OVERLAP)
+        if len(users_data) > DELTA_MAX_ROWS:
+            return {'logs': [], 'next_cursor': None, 'delta': True, 'reset': True,
+                    'watermark': encode_watermark(watermark)}
+    else:
+        # limit + 1 para saber se há próxima página
+        users_data = users_with_steps_and_pix(cursor, start_date, end_date, limit + 1, after=after)
+        if len(users_data) > limit:
+            users_data = users_data[:limit]
+            last = users_data[-1]
+            next_cursor = encode_cursor(last['activity_at'], last['id'])
+
+    logs = []
+
+    for user in users_data:
+        # Nome completo do usuário
+        first_name = user.get('first_name') or 'Usuário'
+        last_name = user.get('last_name') or ''
+        full_name = f"{first_name} {last_name}".strip()
+
+        # Determina tipo de usuário/interação
+        user_type = "Bot User"
+        if user.get('username'):
+            user_type = f"@{user.get('username')}"
+
+        # Última etapa
+        last_step = "Etapa 1 (Boas-vindas)"  # Default
+        if user.get('last_step_name'):
+            step_num = user.get('last_step_number', 1)
+            step_desc = user.get('last_step_description') or user.get('last_step_name')
+            last_step = f"Etapa {step_num} ({step_desc})"
+
+        # Status PIX
+        pix_status = "Não gerou PIX"
+        if user.get('pix_payment_status') == 'PAGO':
+            pix_status = "PAGO"
+        elif user.get('pix_payment_status') == 'PENDENTE':
+            pix_status = "PIX gerado"
+
+        # Data da última atividade
+        last_activity = user.get('last_activity') or user.get('user_created_at')
+
+        logs.append({
+            'date': last_activity.isoformat() if last_activity else None,
+            'full_name': full_name,
+            'user_type': user_type,
+            'last_step': last_step,
+            'pix_status': pix_status,
+            'telegram_id': user.get('telegram_id'),
+            'total_pix': user.get('total_pix', 0),
+            'total_paid': user.get('total_paid', 0),
+            'total_amount_paid': float(user.get('total_amount_paid', 0)) if user.get('total_amount_paid') else 0
+        })
+
+    return {'logs': logs, 'next_cursor': next_cursor, 'delta': bool(since), 'reset': False,
+            'watermark': encode_watermark(watermark)}
+
+
+def parse_panels(value):
+    """Lista de painéis de `?panels=overview,sales` (vazio = todos). ValueError se desconhecido."""
+    if not value:
+        return list(PANELS)
+    panels = [panel.strip() for panel in value.split(',') if panel.strip()]
+    unknown = sorted(set(panels) - set(PANELS))
+    if unknown:
+        raise ValueError(f"Painéis desconhecidos: {', '.join(unknown)} (válidos: {', '.join(PANELS)})")
+    return list(dict.fromkeys(panels))
+
+
+def dashboard(conn, panels, start_date=None, end_date=None, has_plano_id=False, logs=None, since=None):
+    """Payload de /api/dashboard: os painéis pedidos numa única transação REPEATABLE READ.
+
+    Todos os painéis enxergam o mesmo snapshot; overview e sales compartilham um
+    único cálculo do funil. `logs(cursor, since, watermark)` monta o painel de
+    logs do serviço (membros no gateway, conversões/PIX na dashboard-api).
+    `since` é repassado a sales e logs (delta-sync) com uma marca d'água única.
+    Só leitura: pode rodar numa réplica.
+    """
+    cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+    watermark = current_watermark(cursor)
+
+    data = {'watermark': encode_watermark(watermark)}
+    funnel = None
+    if 'overview' in panels or 'sales' in panels:
+        funnel = rollups.funnel_totals(cursor, start_date, end_date)
+    if 'overview' in panels:
+        data['overview'] = overview_payload(funnel[0])
+    if 'sales' in panels:
+        data['sales'] = sales(cursor, start_date, end_date, has_plano_id, funnel=funnel,
+                              since=since, watermark=watermark)
+    if 'logs' in panels and logs:
+        data['logs'] = logs(cursor, since, watermark)
+    return data
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Filtros de período (start_date/end_date) das queries da dashboard
+"""
+
+import os
+from datetime import date, datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+# Dias da dashboard são dias de negócio (horário de Brasília)
+BUSINESS_TIMEZONE = ZoneInfo(os.getenv('BUSINESS_TIMEZONE', 'America/Sao_Paulo'))
+# Timezone em que as colunas TIMESTAMP (sem tz) são gravadas pelo CURRENT_TIMESTAMP do banco
+DATABASE_TIMEZONE = ZoneInfo(os.getenv('DATABASE_TIMEZONE', 'UTC'))
+
+
+def parse_date(value):
+    """Converte 'YYYY-MM-DD' (ou date) em date"""
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def business_today():
+    """Data de hoje no fuso de negócio"""
+    return datetime.now(BUSINESS_TIMEZONE).date()
+
+
+def business_day(timestamp):
+    """Dia de negócio de um timestamp (sem tz) lido do banco"""
+    return timestamp.replace(tzinfo=DATABASE_TIMEZONE).astimezone(BUSINESS_TIMEZONE).date()
+
+
+def day_start(day):
+    """Início do dia de negócio convertido para o timestamp (sem tz) gravado no banco"""
+    local_midnight = datetime.combine(day, time.min, tzinfo=BUSINESS_TIMEZONE)
+    return local_midnight.astimezone(DATABASE_TIMEZONE).replace(tzinfo=None)
+
+
+def date_range_bounds(start_date, end_date):
+    """Intervalo semiaberto [início de start_date, início de end_date + 1 dia)"""
+    start = parse_date(start_date)
+    end = parse_date(end_date)
+    return day_start(start), day_start(end + timedelta(days=1))
+
+
+def date_range_condition(start_date, end_date, column='created_at'):
+    """Condição sargável de período para `column`.
+
+    Retorna (sql, params): `column >= %s AND column < %s` quando há período,
+    ou ('TRUE', []) quando start_date/end_date não foram informados - assim o
+    chamador sempre pode escrever `WHERE {sql}` ou `AND {sql}`. Ao contrário
+    de `column::date BETWEEN`, permite usar os índices em created_at.
+    """
+    if not (start_date and end_date):
+        return 'TRUE', []
+    start, end = date_range_bounds(start_date, end_date)
+    return f"{column} >= %s AND {column} < %s", [start, end]
+
+
+def business_date_sql(column='created_at'):
+    """Expressão SQL do dia de negócio de `column` (para GROUP BY, não para WHERE)"""
+    return (f"(({column} AT TIME ZONE '{DATABASE_TIMEZONE.key}') "
+            f"AT TIME ZONE '{BUSINESS_TIMEZONE.key}')::date")
+
+
+def day_start_sql(day_expr):
+    """Expressão SQL equivalente a day_start() para uma expressão DATE"""
+    return (f"((({day_expr})::timestamp AT TIME ZONE '{BUSINESS_TIMEZONE.key}') "
+            f"AT TIME ZONE '{DATABASE_TIMEZONE.key}')")
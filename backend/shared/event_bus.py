@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Barramento de eventos ao vivo da dashboard (LISTEN/NOTIFY -> Server-Sent Events)
+
+Os triggers da migração 0006 publicam no canal `dashboard_events` cada /start,
+PIX gerado e PIX pago. Uma thread por processo mantém uma conexão dedicada em
+LISTEN e repassa cada evento para:
+- os callbacks locais (`add_listener`), ex.: invalidação do cache de respostas;
+- as filas dos clientes SSE conectados (`subscribe`).
+
+Cada cliente SSE segura uma thread do gunicorn pelo tempo em que a aba fica
+aberta: `max_subscribers` limita os streams simultâneos do processo e o
+excedente recebe StreamLimitReached (a rota responde 503).
+"""
+
+import json
+import queue
+import select
+import logging
+import threading
+from datetime import date, datetime
+
+import psycopg2
+import psycopg2.extensions
+
+from date_filters import business_day
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'dashboard_events'
+
+
+class StreamLimitReached(Exception):
+    """Limite de clientes SSE simultâneos do processo atingido"""
+
+    def __init__(self, limit, retry_after=30):
+        super().__init__(f"Limite de {limit} streams de eventos simultâneos atingido")
+        self.limit = limit
+        self.retry_after = retry_after
+
+
+class EventBus:
+    """Escuta o canal de eventos e distribui para callbacks e assinantes SSE"""
+
+    def __init__(self, dsn, sslmode='require', max_queue=200, reconnect_delay=5.0, name='dashboard-events',
+                 max_subscribers=None):
+        self.dsn = dsn
+        self.sslmode = sslmode
+        self.max_queue = max_queue
+        self.max_subscribers = max_subscribers
+        self.reconnect_delay = reconnect_delay
+        self.name = name
+
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._listeners = []
+        self._stopped = threading.Event()
+        self._thread = None
+        self._stats = {'received': 0, 'dropped': 0, 'reconnects': 0, 'rejected_streams': 0}
+
+    def start(self):
+        """Inicia (ou reinicia, ex.: após fork) a thread de LISTEN"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Para a thread de LISTEN; com `timeout`, espera ela fechar a conexão"""
+        self._stopped.set()
+        if timeout is not None and self._thread:
+            self._thread.join(timeout)
+
+    @property
+    def stopped(self):
+        return self._stopped.is_set()
+
+    def add_listener(self, fn):
+        """Registra `fn(evento)` chamado na thread do barramento a cada evento"""
+        self._listeners.append(fn)
+
+    def subscribe(self):
+        """Fila de eventos de um cliente SSE (descartar com `unsubscribe`).
+
+        Levanta StreamLimitReached com `max_subscribers` clientes já conectados.
+        """
+        q = queue.Queue(maxsize=self.max_queue)
+        with self._lock:
+            if self.max_subscribers is not None and len(self._subscribers) >= self.max_subscribers:
+                self._stats['rejected_streams'] += 1
+                raise StreamLimitReached(self.max_subscribers)
+            self._subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers.discard(q)
+
+    def publish(self, event):
+        """Entrega um evento já decodificado (também usado pela thread de LISTEN)"""
+        with self._lock:
+            self._stats['received'] += 1
+            subscribers = list(self._subscribers)
+
+        for fn in self._listeners:
+            try:
+                fn(event)
+            except Exception as e:
+                logger.error(f"❌ Erro no listener de eventos da dashboard: {e}")
+
+        for q in subscribers:
+            try:
+                q.put_nowait(event)
+            except queue.Full:
+                # Cliente lento: perde o evento e recarrega tudo no próximo fallback
+                with self._lock:
+                    self._stats['dropped'] += 1
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+            data['subscribers'] = len(self._subscribers)
+            data['max_subscribers'] = self.max_subscribers
+        data['listening'] = bool(self._thread and self._thread.is_alive())
+        return data
+
+    @staticmethod
+    def decode(payload):
+        """Payload do NOTIFY -> evento com `day` (dia de negócio) para o filtro do cliente"""
+        event = json.loads(payload)
+        if event.get('created_at'):
+            created_at = datetime.fromisoformat(event['created_at'])
+            event['day'] = business_day(created_at).isoformat()
+        if event.get('amount') is not None:
+            event['amount'] = float(event['amount'])
+        return event
+
+    def _run(self):
+        while not self._stopped.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(self.dsn, sslmode=self.sslmode)
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                conn.cursor().execute(f"LISTEN {CHANNEL}")
+                logger.info(f"✅ Escutando eventos da dashboard no canal {CHANNEL}")
+
+                while not self._stopped.is_set():
+                    if select.select([conn], [], [], 5.0) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        try:
+                            self.publish(self.decode(notify.payload))
+                        except (ValueError, TypeError) as e:
+                            logger.warning(f"⚠️ Evento da dashboard inválido: {notify.payload} ({e})")
+            except Exception as e:
+                with self._lock:
+                    self._stats['reconnects'] += 1
+                logger.error(f"❌ Conexão de eventos da dashboard caiu: {e}. "
+                             f"Reconectando em {self.reconnect_delay}s")
+                self._stopped.wait(self.reconnect_delay)
+            finally:
+                if conn:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+
+
+def sse_stream(bus, q, heartbeat=15.0):
+    """Gerador do corpo text/event-stream do cliente inscrito com a fila `q`.
+
+    A inscrição fica com a rota (antes de responder 200, para poder recusar
+    com 503); a rota também desinscreve no fechamento da resposta, caso o
+    gerador nem chegue a rodar.
+    """
+    try:
+        # Sugere ao EventSource o intervalo de reconexão
+        yield "retry: 5000\n\n"
+        # Barramento parado (worker encerrando): o stream termina e o EventSource reconecta
+        while not bus.stopped:
+            try:
+                event = q.get(timeout=heartbeat)
+            except queue.Empty:
+                # Comentário SSE mantém a conexão viva em proxies
+                yield ": keep-alive\n\n"
+                continue
+            yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+    finally:
+        bus.unsubscribe(q)
+
+
+def create_bus(dsn, sslmode='require', cache=None, max_subscribers=None):
+    """Barramento do processo; com `cache`, cada evento expira as respostas do dia afetado"""
+    bus = EventBus(dsn, sslmode=sslmode, max_subscribers=max_subscribers)
+    if cache is not None:
+        def invalidate(event):
+            if event.get('day'):
+                cache.invalidate_day(date.fromisoformat(event['day']))
+        bus.add_listener(invalidate)
+    bus.start()
+    return bus
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Exportação em streaming (CSV / NDJSON) das tabelas da dashboard - GET /api/export/<tabela>
+
+As linhas são lidas por um cursor nomeado (server-side) em lotes de `itersize`
+e serializadas lote a lote por um gerador: a memória do worker fica constante
+qualquer que seja o tamanho do período exportado (conciliação com as
+plataformas de anúncio, meses de pix_transactions/user_steps).
+"""
+
+import io
+import os
+import csv
+import json
+import uuid
+import logging
+from datetime import date, datetime
+from decimal import Decimal
+
+from date_filters import parse_date, date_range_condition
+
+logger = logging.getLogger(__name__)
+
+# Linhas por FETCH do cursor nomeado (e por chunk da resposta)
+EXPORT_ITERSIZE = int(os.getenv('EXPORT_ITERSIZE', '2000'))
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson'
+}
+
+# Tabelas exportáveis e colunas permitidas (na ordem padrão do arquivo).
+# pix_code/qr_code e respostas brutas de terceiros ficam de fora.
+EXPORTS = {
+    'pix_transactions': [
+        'id', 'transaction_id', 'telegram_id', 'amount', 'plano_id', 'status',
+        'click_id', 'utm_source', 'utm_medium', 'utm_campaign', 'utm_term', 'utm_content',
+        'created_at', 'updated_at'
+    ],
+    'bot_users': [
+        'id', 'telegram_id', 'username', 'first_name', 'last_name',
+        'click_id', 'utm_source', 'utm_medium', 'utm_campaign', 'utm_term', 'utm_content',
+        'created_at', 'updated_at'
+    ],
+    'user_steps': [
+        'id', 'telegram_id', 'step_name', 'step_number', 'step_description', 'created_at'
+    ],
+    'conversion_logs': [
+        'id', 'transaction_id', 'click_id', 'utm_source', 'utm_campaign',
+        'conversion_value', 'status', 'created_at'
+    ]
+}
+
+
+class InvalidExport(ValueError):
+    """Tabela, formato ou colunas de exportação inválidos"""
+
+
+def parse_columns(table, value):
+    """Colunas de `?columns=a,b` validadas contra a whitelist (vazio = todas)"""
+    if table not in EXPORTS:
+        raise InvalidExport(f"Tabela não exportável: {table} (válidas: {', '.join(EXPORTS)})")
+    allowed = EXPORTS[table]
+    if not value:
+        return list(allowed)
+    columns = [column.strip() for column in value.split(',') if column.strip()]
+    unknown = sorted(set(columns) - set(allowed))
+    if unknown:
+        raise InvalidExport(f"Colunas desconhecidas em {table}: {', '.join(unknown)}")
+    return list(dict.fromkeys(columns))
+
+
+def parse_format(value):
+    fmt = (value or 'csv').lower()
+    if fmt not in FORMATS:
+        raise InvalidExport(f"Formato inválido: {fmt} (válidos: {', '.join(FORMATS)})")
+    return fmt
+
+
+def parse_request(table, args):
+    """(colunas, formato, start_date, end_date) de uma requisição de exportação.
+
+    Valida tudo antes do stream começar: depois do primeiro chunk não há mais
+    como responder 400.
+    """
+    columns = parse_columns(table, args.get('columns'))
+    fmt = parse_format(args.get('format'))
+    start_date, end_date = args.get('start_date'), args.get('end_date')
+    if start_date and end_date:
+        try:
+            parse_date(start_date), parse_date(end_date)
+        except ValueError as e:
+            raise InvalidExport(f"Período inválido: {start_date} - {end_date}") from e
+    return columns, fmt, start_date, end_date
+
+
+def _plain(value):
+    """Valor do banco -> tipo serializável (datas em ISO, DECIMAL como float)"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def iter_batches(conn, table, columns, start_date=None, end_date=None, itersize=EXPORT_ITERSIZE):
+    """Lotes de linhas (tuplas) de `table` via cursor nomeado, por (created_at, id).
+
+    `table` e `columns` precisam ter passado por parse_columns (entram no SQL).
+    """
+    date_filter, date_params = date_range_condition(start_date, end_date)
+    # Cursor nomeado = DECLARE ... CURSOR: exige a transação aberta da conexão
+    cursor = conn.cursor(name=f"export_{table}_{uuid.uuid4().hex[:8]}")
+    cursor.itersize = itersize
+    try:
+        cursor.execute(f"""
+            SELECT {', '.join(columns)}
+            FROM {table}
+            WHERE {date_filter}
+            ORDER BY created_at, id
+        """, date_params)
+        while True:
+            rows = cursor.fetchmany(itersize)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cursor.close()
+
+
+def csv_chunks(batches, columns):
+    """Cabeçalho + um chunk CSV por lote"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue()
+    for rows in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([_plain(value) for value in row] for row in rows)
+        yield buffer.getvalue()
+
+
+def ndjson_chunks(batches, columns):
+    """Um objeto JSON por linha, um chunk por lote"""
+    for rows in batches:
+        yield ''.join(
+            json.dumps(dict(zip(columns, (_plain(value) for value in row))), ensure_ascii=False) + '\n'
+            for row in rows
+        )
+
+
+def stream_export(connection, table, columns, fmt, start_date=None, end_date=None):
+    """Gerador do corpo da resposta; `connection` é o context manager de conexão do serviço.
+
+    A conexão fica emprestada enquanto o cliente consome o stream e volta ao
+    pool quando o gerador termina (ou é fechado por desconexão do cliente).
+    """
+    exported = 0
+    with connection() as conn:
+        batches = iter_batches(conn, table, columns, start_date, end_date)
+
+        def counted():
+            nonlocal exported
+            for rows in batches:
+                exported += len(rows)
+                yield rows
+
+        chunks = csv_chunks if fmt == 'csv' else ndjson_chunks
+        try:
+            yield from chunks(counted(), columns)
+        except GeneratorExit:
+            # Cliente desconectou: encerra a transação para a conexão voltar limpa ao pool
+            batches.close()
+            conn.rollback()
+            logger.warning(f"⚠️ Exportação {table} interrompida pelo cliente após {exported} linhas")
+            raise
+    logger.info(f"✅ Exportação {table} ({fmt}): {exported} linhas")
+
+
+def filename(table, fmt, start_date=None, end_date=None):
+    period = f"_{start_date}_{end_date}" if start_date and end_date else ''
+    return f"{table}{period}.{fmt}"
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Paginação por keyset (cursor opaco) das listagens da dashboard
+"""
+
+import json
+import base64
+import binascii
+from datetime import datetime
+
+
+class InvalidCursor(ValueError):
+    """Cursor de paginação malformado"""
+
+
+def encode_cursor(sort_value, row_id, **extra):
+    """Gera o cursor opaco da próxima página a partir da última linha retornada"""
+    payload = {
+        't': sort_value.isoformat() if isinstance(sort_value, datetime) else sort_value,
+        'id': row_id
+    }
+    payload.update(extra)
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Lê um cursor gerado por encode_cursor. Retorna dict com 't' (datetime) e 'id'."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        payload['t'] = datetime.fromisoformat(payload['t'])
+        payload['id'] = int(payload['id'])
+        return payload
+    except (binascii.Error, ValueError, KeyError, TypeError) as e:
+        raise InvalidCursor(f"Cursor inválido: {token}") from e
+
+
+def encode_watermark(timestamp):
+    """Marca d'água opaca de delta-sync (?since=) a partir do relógio do banco"""
+    raw = timestamp.isoformat().encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_watermark(token):
+    """Lê uma marca d'água gerada por encode_watermark. Retorna datetime."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        return datetime.fromisoformat(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (binascii.Error, ValueError, UnicodeDecodeError) as e:
+        raise InvalidCursor(f"Marca d'água inválida: {token}") from e
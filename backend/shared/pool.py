@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Pool de conexões PostgreSQL para o API Gateway
+"""
+
+import time
+import logging
+import threading
+from collections import deque
+
+import psycopg2
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    """Nenhuma conexão liberada dentro do tempo limite de checkout"""
+
+
+class ConnectionPool:
+    """Pool limitado e thread-safe de conexões psycopg2.
+
+    - Mantém entre `min_size` e `max_size` conexões abertas
+    - Fecha conexões ociosas há mais de `idle_timeout` segundos (sem baixar de `min_size`)
+    - Valida a conexão no checkout: descarta conexões fechadas ou quebradas e,
+      se ficou ociosa mais que `health_check_after` segundos, roda um `SELECT 1`
+    """
+
+    def __init__(self, dsn, min_size=1, max_size=10, idle_timeout=300,
+                 checkout_timeout=10, health_check_after=30, **connect_kwargs):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Tamanhos de pool inválidos (0 <= min_size <= max_size, max_size >= 1)")
+
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+        self.health_check_after = health_check_after
+        self.connect_kwargs = connect_kwargs
+
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._idle = deque()  # (conn, devolvida_em) - mais recente à direita
+        self._in_use = set()
+        self._closed = False
+
+        self._stats = {
+            'created': 0,
+            'closed': 0,
+            'checkouts': 0,
+            'broken_discarded': 0,
+            'idle_reaped': 0,
+            'timeouts': 0,
+            'wait_time_total': 0.0
+        }
+
+        for _ in range(min_size):
+            self._idle.append((self._connect(), time.monotonic()))
+
+        self._reaper = threading.Thread(target=self._reap_loop, name='db-pool-reaper', daemon=True)
+        self._reaper.start()
+
+    def _connect(self):
+        conn = psycopg2.connect(self.dsn, **self.connect_kwargs)
+        self._count('created')
+        return conn
+
+    def _count(self, key, value=1):
+        with self._stats_lock:
+            self._stats[key] += value
+
+    def _discard(self, conn):
+        try:
+            if not conn.closed:
+                conn.close()
+        except Exception:
+            pass
+        self._count('closed')
+
+    def _is_healthy(self, conn, idle_for):
+        """Detecta conexões quebradas antes de entregá-las"""
+        if conn.closed:
+            return False
+        try:
+            status = conn.get_transaction_status()
+            if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                return False
+            if status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            if idle_for >= self.health_check_after:
+                cursor = conn.cursor()
+                cursor.execute("SELECT 1")
+                cursor.close()
+                conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def getconn(self):
+        """Retira uma conexão do pool (bloqueia até `checkout_timeout` se o pool estiver cheio)"""
+        started = time.monotonic()
+        deadline = started + self.checkout_timeout
+
+        while True:
+            with self._lock:
+                if self._closed:
+                    raise PoolTimeout("Pool de conexões encerrado")
+
+                while not self._idle and len(self._in_use) >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._count('timeouts')
+                        raise PoolTimeout(f"Nenhuma conexão disponível em {self.checkout_timeout}s (max_size={self.max_size})")
+                    self._available.wait(remaining)
+
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                    idle_for = time.monotonic() - returned_at
+                else:
+                    conn, idle_for = None, 0
+                # Reserva a vaga antes de conectar/validar fora do lock
+                placeholder = object()
+                self._in_use.add(placeholder)
+
+            try:
+                if conn is None:
+                    conn = self._connect()
+                elif not self._is_healthy(conn, idle_for):
+                    logger.warning("⚠️ Conexão quebrada descartada no checkout do pool")
+                    self._count('broken_discarded')
+                    self._discard(conn)
+                    conn = None
+            except Exception:
+                with self._lock:
+                    self._in_use.discard(placeholder)
+                    self._available.notify()
+                raise
+
+            with self._lock:
+                self._in_use.discard(placeholder)
+                if conn is None:
+                    # Tenta de novo com outra conexão (ou uma nova)
+                    self._available.notify()
+                    continue
+                self._in_use.add(conn)
+                self._count('checkouts')
+                self._count('wait_time_total', time.monotonic() - started)
+                return conn
+
+    def putconn(self, conn, discard=False):
+        """Devolve a conexão ao pool (ou descarta se quebrada)"""
+        if not discard:
+            try:
+                discard = conn.closed or conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE
+            except Exception:
+                discard = True
+
+        with self._lock:
+            self._in_use.discard(conn)
+            if discard or self._closed:
+                self._discard(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._available.notify()
+
+    def reap_idle(self):
+        """Fecha conexões ociosas além do `idle_timeout`, preservando `min_size`"""
+        now = time.monotonic()
+        with self._lock:
+            total = len(self._idle) + len(self._in_use)
+            # Conexões mais antigas ficam à esquerda
+            while self._idle and total > self.min_size:
+                conn, returned_at = self._idle[0]
+                if now - returned_at < self.idle_timeout:
+                    break
+                self._idle.popleft()
+                self._discard(conn)
+                self._count('idle_reaped')
+                total -= 1
+
+    def _reap_loop(self):
+        interval = max(1, min(self.idle_timeout / 2, 60))
+        while not self._closed:
+            time.sleep(interval)
+            try:
+                self.reap_idle()
+            except Exception as e:
+                logger.error(f"❌ Erro no reaper do pool: {e}")
+
+    def closeall(self):
+        """Fecha todas as conexões ociosas e impede novos checkouts"""
+        with self._lock:
+            self._closed = True
+            while self._idle:
+                conn, _ = self._idle.popleft()
+                self._discard(conn)
+            self._available.notify_all()
+
+    def after_fork(self):
+        """Reabre o pool num processo filho (post_fork do gunicorn com preload_app).
+
+        O processo pai precisa ter chamado `closeall()` antes do fork: uma
+        conexão herdada divide o socket com o pai. Locks, estatísticas, thread
+        do reaper e as `min_size` conexões são recriados no filho.
+        """
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._idle = deque()
+        self._in_use = set()
+        self._closed = False
+        self._stats = dict.fromkeys(self._stats, 0)
+
+        try:
+            for _ in range(self.min_size):
+                self._idle.append((self._connect(), time.monotonic()))
+        except Exception as e:
+            # Sem aquecimento: as conexões serão abertas sob demanda
+            logger.warning(f"⚠️ Pool sem conexões iniciais após o fork: {e}")
+
+        self._reaper = threading.Thread(target=self._reap_loop, name='db-pool-reaper', daemon=True)
+        self._reaper.start()
+
+    def stats(self):
+        """Estatísticas do pool para monitoramento"""
+        with self._lock:
+            idle, in_use = len(self._idle), len(self._in_use)
+        with self._stats_lock:
+            checkouts = self._stats['checkouts']
+            return {
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'idle': idle,
+                'in_use': in_use,
+                'created': self._stats['created'],
+                'closed': self._stats['closed'],
+                'checkouts': checkouts,
+                'broken_discarded': self._stats['broken_discarded'],
+                'idle_reaped': self._stats['idle_reaped'],
+                'timeouts': self._stats['timeouts'],
+                'avg_wait_ms': round(self._stats['wait_time_total'] / checkouts * 1000, 2) if checkouts else 0.0
+            }
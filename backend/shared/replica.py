@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Roteamento de leituras analíticas para a réplica (DATABASE_REPLICA_URL)
+
+Listagens, agregações e exportações da dashboard rodam na réplica para não
+disputar CPU/IO com o caminho do PIX (gerar_pix, webhook) no primário. A
+réplica só é usada enquanto estiver acessível e com atraso de replicação até
+`max_lag` segundos; caso contrário a leitura cai no primário automaticamente.
+
+Escritas - inclusive o recálculo do rollup diário (rollups.funnel_totals) -
+continuam sempre no primário.
+"""
+
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+import psycopg2
+
+from pool import ConnectionPool
+from circuit_breaker import is_broken_connection
+
+logger = logging.getLogger(__name__)
+
+# Atraso da réplica em segundos (0 quando já aplicou todo o WAL recebido;
+# primário ou réplica promovida também contam como 0)
+LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END AS lag_seconds
+"""
+
+
+class ReplicaRouter:
+    """Entrega conexões de leitura da réplica, com fallback para o primário"""
+
+    def __init__(self, dsn, max_lag=30.0, check_interval=5.0, **pool_kwargs):
+        self.dsn = dsn
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.pool_kwargs = pool_kwargs
+
+        self._lock = threading.Lock()
+        self._pool = None
+        self._healthy = False
+        self._lag = None
+        self._checked_at = None
+        self._stats = {'replica_reads': 0, 'primary_fallbacks': 0, 'checks': 0, 'failures': 0}
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def _get_pool(self):
+        # Criado na primeira leitura: réplica fora do ar não impede o boot
+        with self._lock:
+            if self._pool is None:
+                self._pool = ConnectionPool(self.dsn, **self.pool_kwargs)
+            return self._pool
+
+    def _set_health(self, healthy, lag, reason=None):
+        with self._lock:
+            changed = healthy != self._healthy
+            self._healthy = healthy
+            self._lag = lag
+        if changed and healthy:
+            logger.info(f"✅ Réplica de leitura disponível (atraso {lag:.1f}s)")
+        elif changed:
+            logger.warning(f"⚠️ Réplica de leitura fora de uso ({reason}) - leituras no primário")
+
+    def _check(self):
+        """Consulta o atraso da réplica e atualiza o estado"""
+        self._count('checks')
+        conn = None
+        broken = False
+        try:
+            pool = self._get_pool()
+            conn = pool.getconn()
+            cursor = conn.cursor()
+            cursor.execute(LAG_SQL)
+            lag = float(cursor.fetchone()[0])
+            conn.rollback()
+        except Exception as e:
+            broken = True
+            self._count('failures')
+            self._set_health(False, None, f"erro: {e}")
+            return
+        finally:
+            if conn is not None:
+                pool.putconn(conn, discard=broken)
+
+        if lag > self.max_lag:
+            self._set_health(False, lag, f"atraso {lag:.1f}s > {self.max_lag:.0f}s")
+        else:
+            self._set_health(True, lag)
+
+    def available(self):
+        """Réplica saudável? Reverifica no máximo a cada `check_interval` segundos."""
+        now = time.monotonic()
+        with self._lock:
+            due = self._checked_at is None or now - self._checked_at >= self.check_interval
+            if due:
+                # Só uma thread verifica; as demais seguem com o último estado
+                self._checked_at = now
+        if due:
+            self._check()
+        with self._lock:
+            return self._healthy
+
+    def mark_down(self, error):
+        """Tira a réplica de uso até a próxima verificação"""
+        self._count('failures')
+        self._set_health(False, None, f"erro: {error}")
+
+    @contextmanager
+    def connection(self, fallback):
+        """Conexão de leitura: réplica se saudável, senão `fallback()` (context manager do primário)"""
+        conn = None
+        if self.available():
+            try:
+                pool = self._get_pool()
+                conn = pool.getconn()
+            except Exception as e:
+                self.mark_down(e)
+
+        if conn is None:
+            self._count('primary_fallbacks')
+            with fallback() as primary_conn:
+                yield primary_conn
+            return
+
+        self._count('replica_reads')
+        broken = False
+        try:
+            yield conn
+            conn.commit()
+        except Exception as e:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                broken = True
+            if is_broken_connection(e):
+                # Timeout de statement não derruba a réplica (a consulta iria pesar no primário)
+                broken = True
+                self.mark_down(e)
+            logger.error(f"❌ Erro na réplica de leitura: {e}")
+            raise
+        finally:
+            pool.putconn(conn, discard=broken)
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+            data['healthy'] = self._healthy
+            data['lag_seconds'] = round(self._lag, 2) if self._lag is not None else None
+            pool = self._pool
+        data['max_lag'] = self.max_lag
+        data['pool'] = pool.stats() if pool else None
+        return data
+
+    def close(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool:
+            pool.closeall()
+
+    def after_fork(self):
+        """Estado limpo no processo filho: o pool é recriado e a réplica reverificada na primeira leitura"""
+        self._lock = threading.Lock()
+        self._pool = None
+        self._healthy = False
+        self._lag = None
+        self._checked_at = None
+        self._stats = dict.fromkeys(self._stats, 0)
+
+
+def create_router(dsn, sslmode='require', connection_factory=None, **connect_kwargs):
+    """Router da réplica configurado pelo ambiente, ou None sem DATABASE_REPLICA_URL.
+
+    `connect_kwargs` (ex.: connect_timeout, options) vão para cada conexão do pool.
+    """
+    if not dsn:
+        return None
+    logger.info("📡 Réplica de leitura configurada para consultas analíticas")
+    return ReplicaRouter(
+        dsn,
+        max_lag=float(os.getenv('REPLICA_MAX_LAG_SECONDS', '30')),
+        check_interval=float(os.getenv('REPLICA_CHECK_INTERVAL', '5')),
+        # min_size 0: nenhuma conexão aberta no construtor
+        min_size=int(os.getenv('DB_REPLICA_POOL_MIN', '0')),
+        max_size=int(os.getenv('DB_REPLICA_POOL_MAX', '10')),
+        idle_timeout=float(os.getenv('DB_POOL_IDLE_TIMEOUT', '300')),
+        checkout_timeout=float(os.getenv('DB_POOL_CHECKOUT_TIMEOUT', '10')),
+        sslmode=sslmode,
+        connection_factory=connection_factory,
+        **connect_kwargs
+    )
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Cache em memória (por processo) das respostas das rotas da dashboard
+
+Chave = rota + período normalizado (+ parâmetros extras como limit/cursor).
+Períodos já encerrados recebem TTL longo; períodos que incluem hoje (ou sem
+período) recebem TTL curto. O recálculo é single-flight: numa chave expirada
+apenas uma thread consulta o banco; as demais recebem o valor anterior (ou
+aguardam, se ainda não há valor), evitando que a dashboard dispute conexões
+com o caminho do PIX.
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+from date_filters import parse_date, business_today
+
+logger = logging.getLogger(__name__)
+
+
+class _Entry:
+    __slots__ = ('value', 'expires_at', 'first_day', 'last_day', 'refilling', 'ready', 'generation')
+
+    def __init__(self, first_day, last_day):
+        self.value = None
+        self.expires_at = 0.0
+        self.first_day = first_day
+        self.last_day = last_day
+        self.refilling = False
+        self.ready = threading.Event()
+        # Incrementado a cada invalidação; um recálculo iniciado antes dela nasce expirado
+        self.generation = 0
+
+
+class ResponseCache:
+    """Cache TTL com recálculo single-flight e invalidação por dia de negócio"""
+
+    def __init__(self, open_ttl=30.0, closed_ttl=3600.0, max_entries=500):
+        self.open_ttl = open_ttl
+        self.closed_ttl = closed_ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._stats = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'invalidations': 0}
+
+    @staticmethod
+    def normalize_range(start_date, end_date):
+        """(primeiro_dia, último_dia) ou (None, None) quando não há período"""
+        if not (start_date and end_date):
+            return None, None
+        return parse_date(start_date), parse_date(end_date)
+
+    def ttl_for(self, first_day, last_day):
+        """TTL longo só para períodos inteiramente no passado"""
+        if last_day is not None and last_day < business_today():
+            return self.closed_ttl
+        return self.open_ttl
+
+    def get_or_compute(self, route, start_date, end_date, compute, *extra, ttl=None):
+        """Retorna o valor em cache da chave ou chama `compute()` (uma thread por vez).
+
+        `ttl` substitui o TTL derivado do período (ex.: listagens cujo conteúdo
+        muda mesmo em períodos encerrados).
+        """
+        first_day, last_day = self.normalize_range(start_date, end_date)
+        key = (route, first_day, last_day) + extra
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = _Entry(first_day, last_day)
+                self._entries[key] = entry
+                self._evict(keep=key)
+            self._entries.move_to_end(key)
+
+            now = time.monotonic()
+            if entry.ready.is_set() and now < entry.expires_at:
+                self._stats['hits'] += 1
+                return entry.value
+            if entry.refilling:
+                if entry.ready.is_set():
+                    # Outra thread já está recalculando: serve o valor anterior
+                    self._stats['stale_hits'] += 1
+                    return entry.value
+                owner = False
+            else:
+                entry.refilling = True
+                owner = True
+                generation = entry.generation
+                self._stats['misses'] += 1
+
+        if not owner:
+            # Primeira carga da chave em andamento em outra thread
+            entry.ready.wait()
+            with self._lock:
+                if entry.value is not None:
+                    return entry.value
+            return self.get_or_compute(route, start_date, end_date, compute, *extra, ttl=ttl)
+
+        try:
+            value = compute()
+        except Exception:
+            with self._lock:
+                entry.refilling = False
+                if not entry.ready.is_set():
+                    # Libera quem aguardava a primeira carga; a próxima chamada tenta de novo
+                    self._entries.pop(key, None)
+                    entry.ready.set()
+            raise
+
+        with self._lock:
+            entry.value = value
+            if entry.generation == generation:
+                entry.expires_at = time.monotonic() + (ttl if ttl is not None else self.ttl_for(first_day, last_day))
+            else:
+                entry.expires_at = 0.0
+            entry.refilling = False
+            entry.ready.set()
+        return value
+
+    def _evict(self, keep=None):
+        """Remove as entradas mais antigas além de max_entries.
+
+        Entradas em recálculo (e `keep`, a recém-criada) são puladas, não
+        interrompem a varredura: o cache só passa do limite enquanto houver
+        mais recálculos simultâneos do que entradas livres para remover.
+        """
+        excess = len(self._entries) - self.max_entries
+        if excess <= 0:
+            return
+        victims = []
+        for key, entry in self._entries.items():
+            if key != keep and not entry.refilling:
+                victims.append(key)
+                if len(victims) == excess:
+                    break
+        for key in victims:
+            del self._entries[key]
+
+    def invalidate_day(self, *days):
+        """Expira as entradas cujo período contém algum dos dias (sem período = sempre)"""
+        days = [day for day in days if day is not None]
+        expired = 0
+        with self._lock:
+            for entry in self._entries.values():
+                if entry.first_day is None or any(
+                        entry.first_day <= day <= entry.last_day for day in days):
+                    entry.generation += 1
+                    entry.expires_at = 0.0
+                    expired += 1
+            self._stats['invalidations'] += expired
+        if expired:
+            logger.info(f"🔄 Cache da dashboard: {expired} entrada(s) invalidada(s) para {days}")
+        return expired
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+            data['entries'] = len(self._entries)
+        data['open_ttl'] = self.open_ttl
+        data['closed_ttl'] = self.closed_ttl
+        return data
+
+
+dashboard_cache = ResponseCache(
+    open_ttl=float(os.getenv('DASHBOARD_CACHE_OPEN_TTL', '30')),
+    closed_ttl=float(os.getenv('DASHBOARD_CACHE_CLOSED_TTL', '3600')),
+    max_entries=int(os.getenv('DASHBOARD_CACHE_MAX_ENTRIES', '500'))
+)
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+Rollup diário do funil (daily_funnel_stats) usado por /api/overview e /api/sales
+
+Cada linha guarda os totais de um dia de negócio fechado (is_closed). Dias
+anteriores a `hoje - ROLLUP_OPEN_DAYS` são fechados por um job (RollupRefresher
+no gateway, ou `python3 -m rollups refresh`) e nunca mais recalculados; os dias
+ainda abertos (hoje e ontem, por padrão - PIX de ontem ainda pode ser pago)
+são somados na hora, só com leitura. Assim, períodos de vários meses somam
+poucas centenas de linhas e as leituras podem ir para a réplica.
+
+As funções recebem um cursor RealDictCursor para serem usadas tanto pelo
+DatabaseManager do gateway quanto pela conexão própria da dashboard-api.
+"""
+
+import os
+import sys
+import logging
+import threading
+from datetime import timedelta
+
+import psycopg2
+import psycopg2.extras
+
+from circuit_breaker import DatabaseUnavailable
+from date_filters import parse_date, business_today, business_date_sql, day_start_sql
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_OPEN_DAYS = int(os.getenv('ROLLUP_OPEN_DAYS', '1'))
+
+# Chave do advisory lock que impede dois fechamentos simultâneos (workers/CLI)
+REFRESH_LOCK_KEY = 720150002
+
+FUNNEL_COLUMNS = ['presell_entries', 'bot_starts', 'pix_generated', 'pix_paid', 'revenue', 'conversions']
+
+_COLUMNS = ', '.join(FUNNEL_COLUMNS)
+_SPAN_FILTER = "created_at >= (SELECT start_at FROM span) AND created_at < (SELECT end_at FROM span)"
+
+# CTEs do funil por dia no período %(first_day)s..%(last_day)s (NULL = do primeiro
+# dado registrado / até hoje): dias fechados vêm da tabela, os demais são
+# agregados na hora (`computed`, updated_at NULL). Só leitura.
+_FUNNEL_DAYS_CTE = f"""
+    bounds AS (
+        SELECT
+            COALESCE(%(first_day)s::date, LEAST(
+                (SELECT MIN(day) FROM daily_funnel_stats),
+                (SELECT {business_date_sql('MIN(created_at)')} FROM tracking_mapping),
+                (SELECT {business_date_sql('MIN(created_at)')} FROM bot_users),
+                (SELECT {business_date_sql('MIN(created_at)')} FROM pix_transactions),
+                (SELECT {business_date_sql('MIN(created_at)')} FROM conversion_logs),
+                %(today)s::date
+            )) AS first_day,
+            COALESCE(%(last_day)s::date, %(today)s::date) AS last_day
+    ),
+    open_days AS (
+        SELECT d::date AS day
+        FROM bounds, generate_series(bounds.first_day::timestamp,
+                                     LEAST(bounds.last_day, %(today)s::date)::timestamp,
+                                     INTERVAL '1 day') d
+        WHERE NOT EXISTS (
+            SELECT 1 FROM daily_funnel_stats s WHERE s.day = d::date AND s.is_closed
+        )
+    ),
+    span AS (
+        SELECT {day_start_sql('MIN(day)')} AS start_at,
+               {day_start_sql('MAX(day) + 1')} AS end_at
+        FROM open_days
+    ),
+    presell AS (
+        SELECT {business_date_sql()} AS day, COUNT(*) AS total
+        FROM tracking_mapping WHERE {_SPAN_FILTER}
+        GROUP BY 1
+    ),
+    starts AS (
+        SELECT {business_date_sql()} AS day, COUNT(*) AS total
+        FROM bot_users WHERE {_SPAN_FILTER}
+        GROUP BY 1
+    ),
+    pix AS (
+        SELECT
+            {business_date_sql()} AS day,
+            COUNT(*) AS generated,
+            COUNT(*) FILTER (WHERE status = 'paid') AS paid,
+            COALESCE(SUM(amount) FILTER (WHERE status = 'paid'), 0) AS revenue
+        FROM pix_transactions WHERE {_SPAN_FILTER}
+        GROUP BY 1
+    ),
+    conversions AS (
+        -- conversion_logs também registra as entregas desistidas ('failed') do outbox
+        SELECT {business_date_sql()} AS day, COUNT(*) AS total
+        FROM conversion_logs WHERE {_SPAN_FILTER} AND status = 'sent'
+        GROUP BY 1
+    ),
+    computed AS (
+        SELECT
+            open_days.day,
+            COALESCE(presell.total, 0) AS presell_entries,
+            COALESCE(starts.total, 0) AS bot_starts,
+            COALESCE(pix.generated, 0) AS pix_generated,
+            COALESCE(pix.paid, 0) AS pix_paid,
+            COALESCE(pix.revenue, 0) AS revenue,
+            COALESCE(conversions.total, 0) AS conversions
+        FROM open_days
+        LEFT JOIN presell USING (day)
+        LEFT JOIN starts USING (day)
+        LEFT JOIN pix USING (day)
+        LEFT JOIN conversions USING (day)
+    ),
+    funnel_days AS (
+        SELECT s.day, {', '.join('s.' + c for c in FUNNEL_COLUMNS)}, s.updated_at
+        FROM daily_funnel_stats s, bounds
+        WHERE s.day BETWEEN bounds.first_day AND bounds.last_day AND s.is_closed
+        UNION ALL
+        SELECT day, {_COLUMNS}, NULL::timestamp FROM computed
+    )
+"""
+
+# Totais do período num único statement
+FUNNEL_TOTALS_SQL = f"""
+    WITH {_FUNNEL_DAYS_CTE}
+    SELECT
+        (SELECT first_day FROM bounds) AS first_day,
+        (SELECT last_day FROM bounds) AS last_day,
+        {', '.join(f'COALESCE(SUM({c}), 0) AS {c}' for c in FUNNEL_COLUMNS)}
+    FROM funnel_days
+"""
+
+# Série diária de vendas; no delta-sync só dias fechados depois de `changed_since`
+# e os dias abertos (sempre: o cliente mescla por data)
+SALES_BY_DATE_SQL = f"""
+    WITH {_FUNNEL_DAYS_CTE}
+    SELECT day, revenue, pix_paid
+    FROM funnel_days
+    WHERE pix_paid > 0
+      AND (%(changed_since)s::timestamp IS NULL OR updated_at IS NULL OR updated_at > %(changed_since)s)
+    ORDER BY day DESC
+"""
+
+# Job de fechamento: grava como fechados os dias do período ainda abertos
+CLOSE_DAYS_SQL = f"""
+    WITH {_FUNNEL_DAYS_CTE}
+    INSERT INTO daily_funnel_stats (day, {_COLUMNS}, is_closed, updated_at)
+    SELECT day, {_COLUMNS}, TRUE, CURRENT_TIMESTAMP
+    FROM computed
+    ON CONFLICT (day) DO UPDATE SET
+        presell_entries = EXCLUDED.presell_entries,
+        bot_starts = EXCLUDED.bot_starts,
+        pix_generated = EXCLUDED.pix_generated,
+        pix_paid = EXCLUDED.pix_paid,
+        revenue = EXCLUDED.revenue,
+        conversions = EXCLUDED.conversions,
+        is_closed = TRUE,
+        updated_at = EXCLUDED.updated_at
+    WHERE NOT daily_funnel_stats.is_closed
+"""
+
+
+def close_before():
+    """Primeiro dia ainda aberto: dias anteriores a ele são congelados"""
+    return business_today() - timedelta(days=ROLLUP_OPEN_DAYS)
+
+
+def funnel_totals(cursor, start_date=None, end_date=None):
+    """Totais do funil no período: (totais, primeiro_dia, último_dia). Só leitura.
+
+    Sem período, cobre do primeiro dado registrado até hoje.
+    """
+    has_range = bool(start_date and end_date)
+    cursor.execute(FUNNEL_TOTALS_SQL, {
+        'first_day': parse_date(start_date) if has_range else None,
+        'last_day': parse_date(end_date) if has_range else None,
+        'today': business_today()
+    })
+    row = cursor.fetchone()
+
+    totals = {column: int(row[column]) for column in FUNNEL_COLUMNS if column != 'revenue'}
+    totals['revenue'] = float(row['revenue'])
+    return totals, row['first_day'], row['last_day']
+
+
+def close_days(cursor):
+    """Fecha (is_closed) os dias anteriores a close_before() ainda abertos. Retorna quantos.
+
+    Escreve no primário; outro fechamento em andamento (outro worker) = nada a fazer.
+    """
+    cursor.execute("SELECT pg_try_advisory_xact_lock(%s) AS locked", (REFRESH_LOCK_KEY,))
+    if not cursor.fetchone()['locked']:
+        return 0
+    cursor.execute(CLOSE_DAYS_SQL, {
+        'first_day': None,
+        'last_day': close_before() - timedelta(days=1),
+        'today': business_today()
+    })
+    closed = cursor.rowcount
+    if closed:
+        logger.info(f"🔄 Rollup diário: {closed} dia(s) fechado(s)")
+    return closed
+
+
+def fetch_sales_by_date(cursor, first_day, last_day, changed_since=None):
+    """Vendas pagas por dia (mais recente primeiro), apenas dias com venda.
+
+    Com `changed_since`, só os dias fechados depois desse instante e os abertos.
+    """
+    cursor.execute(SALES_BY_DATE_SQL, {
+        'first_day': first_day,
+        'last_day': last_day,
+        'today': business_today(),
+        'changed_since': changed_since
+    })
+    return [
+        {
+            'date': row['day'].strftime('%Y-%m-%d'),
+            'revenue': float(row['revenue']),
+            'transactions': row['pix_paid']
+        } for row in cursor.fetchall()
+    ]
+
+
+class RollupRefresher:
+    """Thread que fecha os dias vencidos do rollup a cada `interval` segundos.
+
+    `connection` é um context manager de conexão do primário (commit na saída),
+    ex.: DatabaseManager.dashboard_connection.
+    """
+
+    def __init__(self, connection, interval=900.0, name='rollup-refresher'):
+        self.connection = connection
+        self.interval = interval
+        self.name = name
+
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._stats = {'runs': 0, 'closed_days': 0, 'errors': 0}
+
+    def start(self):
+        """Inicia (ou reinicia, ex.: após fork) a thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Para a thread; com `timeout`, espera o fechamento em andamento terminar"""
+        self._stopped.set()
+        if timeout is not None and self._thread:
+            self._thread.join(timeout)
+
+    def refresh_once(self):
+        with self.connection() as conn:
+            closed = close_days(conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor))
+        with self._lock:
+            self._stats['runs'] += 1
+            self._stats['closed_days'] += closed
+        return closed
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self.refresh_once()
+            except DatabaseUnavailable as e:
+                logger.warning(f"⚠️ {self.name} aguardando o banco: {e}")
+            except Exception as e:
+                with self._lock:
+                    self._stats['errors'] += 1
+                logger.error(f"❌ Erro fechando dias do rollup: {e}")
+            self._stopped.wait(self.interval)
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+        data.update({
+            'running': bool(self._thread and self._thread.is_alive()),
+            'interval': self.interval,
+            'close_before': close_before().isoformat()
+        })
+        return data
+
+
+def create_refresher(connection):
+    """Fechamento periódico do processo, configurado por ROLLUP_REFRESH_INTERVAL e já iniciado"""
+    refresher = RollupRefresher(connection, interval=float(os.getenv('ROLLUP_REFRESH_INTERVAL', '900')))
+    refresher.start()
+    return refresher
+
+
+def main(argv=None):
+    """python3 -m rollups refresh: fecha os dias vencidos (ex.: histórico inteiro no deploy)"""
+    argv = sys.argv[1:] if argv is None else argv
+    if argv != ['refresh']:
+        print(main.__doc__)
+        return 2
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    database_url = os.getenv('DATABASE_URL')
+    if not database_url:
+        logger.error("❌ DATABASE_URL não configurado!")
+        return 1
+
+    conn = psycopg2.connect(database_url, sslmode=os.getenv('DATABASE_SSLMODE', 'require'))
+    try:
+        closed = close_days(conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor))
+        conn.commit()
+        logger.info(f"✅ Rollup diário em dia ({closed} dia(s) fechado(s))")
+        return 0
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
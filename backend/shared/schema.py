@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Registro de capacidades do schema PostgreSQL (colunas/tabelas opcionais)
+"""
+
+import logging
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Colunas opcionais consultadas pelos branches condicionais de SQL: flag -> (tabela, coluna)
+OPTIONAL_COLUMNS = {
+    'has_plano_id': ('pix_transactions', 'plano_id'),
+}
+
+
+class SchemaCapabilities:
+    """Flags de schema resolvidas uma única vez (startup ou após migração).
+
+    Evita consultar information_schema nos caminhos quentes; use `refresh()`
+    para reler o catálogo sem reiniciar o processo.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flags = {flag: False for flag in OPTIONAL_COLUMNS}
+        self.resolved_at = None
+
+    def refresh(self, conn):
+        """Relê o catálogo com uma única query e atualiza todas as flags"""
+        pairs = list(OPTIONAL_COLUMNS.values())
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT table_name, column_name
+            FROM information_schema.columns
+            WHERE table_schema = current_schema()
+            AND (table_name, column_name) IN %s
+        """, (tuple(pairs),))
+        found = set(cursor.fetchall())
+
+        with self._lock:
+            self._flags = {flag: pair in found for flag, pair in OPTIONAL_COLUMNS.items()}
+            self.resolved_at = datetime.now()
+
+        logger.info(f"✅ Capacidades do schema resolvidas: {self._flags}")
+        return self.as_dict()
+
+    def __getattr__(self, name):
+        flags = self.__dict__.get('_flags', {})
+        if name in flags:
+            return flags[name]
+        raise AttributeError(name)
+
+    def as_dict(self):
+        with self._lock:
+            data = dict(self._flags)
+        data['resolved_at'] = self.resolved_at.isoformat() if self.resolved_at else None
+        return data
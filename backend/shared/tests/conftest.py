@@ -0,0 +1,24 @@
+"""
+Configuração dos testes dos módulos compartilhados (python -m pytest, a partir de backend/shared)
+
+Os módulos são planos (import pool, import rollups...), então a pasta do pacote
+entra no sys.path - sem precisar do pip install. Testes que precisam de um
+PostgreSQL real usam a fixture `pg_url` e são pulados sem TEST_DATABASE_URL.
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def pg_url():
+    url = os.getenv('TEST_DATABASE_URL')
+    if not url:
+        pytest.skip("TEST_DATABASE_URL não configurado (PostgreSQL descartável)")
+    if url == os.getenv('DATABASE_URL'):
+        pytest.skip("TEST_DATABASE_URL não pode ser o DATABASE_URL do serviço")
+    return url
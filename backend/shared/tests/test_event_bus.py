@@ -0,0 +1,49 @@
+import json
+from datetime import date
+
+import pytest
+
+from event_bus import EventBus, StreamLimitReached, sse_stream
+
+
+def test_subscribers_are_capped():
+    bus = EventBus('postgresql://unused', max_subscribers=2)
+    first = bus.subscribe()
+    bus.subscribe()
+
+    with pytest.raises(StreamLimitReached):
+        bus.subscribe()
+    bus.unsubscribe(first)
+    bus.subscribe()
+
+    stats = bus.stats()
+    assert (stats['subscribers'], stats['max_subscribers'], stats['rejected_streams']) == (2, 2, 1)
+
+
+def test_publish_reaches_listeners_and_streams():
+    bus = EventBus('postgresql://unused')
+    seen = []
+    bus.add_listener(seen.append)
+    q = bus.subscribe()
+    stream = sse_stream(bus, q, heartbeat=0.01)
+
+    assert next(stream) == "retry: 5000\n\n"
+    assert next(stream) == ": keep-alive\n\n"
+    bus.publish({'type': 'pix_paid', 'amount': 24.9, 'day': date(2024, 5, 1).isoformat()})
+    chunk = next(stream)
+
+    assert chunk.startswith("event: pix_paid\ndata: ")
+    assert json.loads(chunk.split('data: ', 1)[1])['amount'] == 24.9
+    assert seen[0]['type'] == 'pix_paid'
+    stream.close()
+    assert bus.stats()['subscribers'] == 0
+
+
+def test_stream_ends_when_bus_stops():
+    bus = EventBus('postgresql://unused')
+    stream = sse_stream(bus, bus.subscribe(), heartbeat=0.01)
+    next(stream)
+    bus.stop()
+
+    assert list(stream) == []
+    assert bus.stats()['subscribers'] == 0
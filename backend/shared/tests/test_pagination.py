@@ -0,0 +1,49 @@
+from datetime import datetime
+
+import pytest
+
+from pagination import InvalidCursor, decode_cursor, decode_watermark, encode_cursor, encode_watermark
+
+
+def test_cursor_round_trip():
+    when = datetime(2024, 5, 1, 12, 30, 15, 123456)
+    token = encode_cursor(when, 42)
+
+    assert decode_cursor(token) == {'t': when, 'id': 42}
+
+
+def test_cursor_is_url_safe_without_padding():
+    token = encode_cursor(datetime(2024, 5, 1), 7, s=1)
+
+    assert '=' not in token and '+' not in token and '/' not in token
+    assert decode_cursor(token)['s'] == 1
+
+
+def test_cursor_accepts_iso_string_sort_value():
+    token = encode_cursor('2024-05-01T00:00:00', '9')
+
+    assert decode_cursor(token) == {'t': datetime(2024, 5, 1), 'id': 9}
+
+
+@pytest.mark.parametrize('token', ['', 'não-é-base64!', encode_watermark(datetime(2024, 5, 1)),
+                                   encode_cursor('ontem', 1), encode_cursor(datetime(2024, 5, 1), 'x')])
+def test_malformed_cursor_raises_invalid_cursor(token):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(token)
+
+
+def test_invalid_cursor_is_value_error():
+    # Quem só trata ValueError (parse de parâmetros) também responde 400
+    assert issubclass(InvalidCursor, ValueError)
+
+
+def test_watermark_round_trip():
+    when = datetime(2024, 5, 1, 23, 59, 59, 999999)
+
+    assert decode_watermark(encode_watermark(when)) == when
+
+
+@pytest.mark.parametrize('token', ['%%%', encode_cursor(datetime(2024, 5, 1), 1)])
+def test_malformed_watermark_raises_invalid_cursor(token):
+    with pytest.raises(InvalidCursor):
+        decode_watermark(token)
@@ -0,0 +1,143 @@
+import threading
+
+import psycopg2
+import psycopg2.extensions
+import pytest
+
+import pool as pool_module
+from pool import ConnectionPool, PoolTimeout
+
+IDLE = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+INTRANS = psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+UNKNOWN = psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN
+
+
+class FakeConn:
+    """Conexão em memória: só o que o pool consulta"""
+
+    def __init__(self):
+        self.closed = 0
+        self.status = IDLE
+        self.queries = 0
+
+    def get_transaction_status(self):
+        return self.status
+
+    def rollback(self):
+        self.status = IDLE
+
+    def cursor(self):
+        conn = self
+
+        class Cursor:
+            def execute(self, sql):
+                conn.queries += 1
+
+            def close(self):
+                pass
+        return Cursor()
+
+    def close(self):
+        self.closed = 1
+
+
+@pytest.fixture
+def connections(monkeypatch):
+    created = []
+
+    def connect(dsn, **kwargs):
+        conn = FakeConn()
+        created.append(conn)
+        return conn
+
+    monkeypatch.setattr(pool_module.psycopg2, 'connect', connect)
+    return created
+
+
+def make_pool(**kwargs):
+    kwargs.setdefault('idle_timeout', 300)
+    return ConnectionPool('postgresql://teste', **kwargs)
+
+
+def test_min_size_connections_opened_upfront(connections):
+    pool = make_pool(min_size=2, max_size=4)
+
+    assert len(connections) == 2
+    assert pool.stats()['idle'] == 2
+    pool.closeall()
+
+
+def test_returned_connection_is_reused(connections):
+    pool = make_pool(min_size=0, max_size=2)
+    conn = pool.getconn()
+    pool.putconn(conn)
+
+    assert pool.getconn() is conn
+    assert len(connections) == 1
+    pool.closeall()
+
+
+def test_checkout_blocks_then_times_out_at_max_size(connections):
+    pool = make_pool(min_size=0, max_size=1, checkout_timeout=0.05)
+    pool.getconn()
+
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+    assert pool.stats()['timeouts'] == 1
+    pool.closeall()
+
+
+def test_waiting_checkout_gets_connection_released_by_another_thread(connections):
+    pool = make_pool(min_size=0, max_size=1, checkout_timeout=5)
+    held = pool.getconn()
+    threading.Timer(0.05, pool.putconn, args=(held,)).start()
+
+    assert pool.getconn() is held
+    pool.closeall()
+
+
+def test_connection_left_in_transaction_is_discarded(connections):
+    pool = make_pool(min_size=0, max_size=2)
+    conn = pool.getconn()
+    conn.status = INTRANS
+    pool.putconn(conn)
+
+    assert conn.closed
+    assert pool.stats()['idle'] == 0
+    pool.closeall()
+
+
+def test_broken_connection_replaced_on_checkout(connections):
+    pool = make_pool(min_size=1, max_size=2)
+    broken = connections[0]
+    broken.status = UNKNOWN
+
+    conn = pool.getconn()
+    assert conn is not broken and broken.closed
+    assert pool.stats()['broken_discarded'] == 1
+    pool.closeall()
+
+
+def test_long_idle_connection_is_pinged(connections):
+    pool = make_pool(min_size=1, max_size=1, health_check_after=0)
+    conn = pool.getconn()
+
+    assert conn.queries == 1
+    pool.closeall()
+
+
+def test_reaper_keeps_min_size(connections):
+    pool = make_pool(min_size=1, max_size=3, idle_timeout=0)
+    conns = [pool.getconn() for _ in range(3)]
+    for conn in conns:
+        pool.putconn(conn)
+
+    pool.reap_idle()
+    stats = pool.stats()
+    assert stats['idle'] == 1 and stats['idle_reaped'] == 2
+    pool.closeall()
+
+
+def test_invalid_sizes_rejected():
+    with pytest.raises(ValueError):
+        ConnectionPool('postgresql://teste', min_size=3, max_size=2)
@@ -0,0 +1,104 @@
+import threading
+from datetime import timedelta
+
+import pytest
+
+from date_filters import business_today
+from response_cache import ResponseCache
+
+
+def test_hit_until_ttl_expires():
+    cache = ResponseCache(open_ttl=60)
+    calls = []
+    compute = lambda: calls.append(1) or len(calls)
+
+    assert cache.get_or_compute('/api/overview', None, None, compute) == 1
+    assert cache.get_or_compute('/api/overview', None, None, compute) == 1
+    assert cache.stats()['hits'] == 1
+
+
+def test_closed_period_gets_long_ttl():
+    cache = ResponseCache(open_ttl=30, closed_ttl=3600)
+    yesterday = business_today() - timedelta(days=1)
+
+    assert cache.ttl_for(yesterday, yesterday) == 3600
+    assert cache.ttl_for(yesterday, business_today()) == 30
+    assert cache.ttl_for(None, None) == 30
+
+
+def test_invalidate_day_only_expires_periods_containing_it():
+    cache = ResponseCache()
+    today = business_today()
+    old = today - timedelta(days=10)
+    cache.get_or_compute('/api/sales', old.isoformat(), old.isoformat(), lambda: 'old')
+    cache.get_or_compute('/api/sales', today.isoformat(), today.isoformat(), lambda: 'today')
+
+    assert cache.invalidate_day(today) == 1
+    assert cache.get_or_compute('/api/sales', old.isoformat(), old.isoformat(), lambda: 'recomputed') == 'old'
+    assert cache.get_or_compute('/api/sales', today.isoformat(), today.isoformat(), lambda: 'recomputed') == 'recomputed'
+
+
+def test_refill_started_before_invalidation_is_born_expired():
+    cache = ResponseCache()
+
+    def compute():
+        cache.invalidate_day(business_today())
+        return 'stale'
+
+    assert cache.get_or_compute('/api/overview', None, None, compute) == 'stale'
+    assert cache.get_or_compute('/api/overview', None, None, lambda: 'fresh') == 'fresh'
+
+
+def test_single_flight_serves_previous_value_while_refilling():
+    cache = ResponseCache(open_ttl=0)
+    cache.get_or_compute('/api/overview', None, None, lambda: 'v1')
+    started, release = threading.Event(), threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return 'v2'
+
+    worker = threading.Thread(target=cache.get_or_compute, args=('/api/overview', None, None, slow))
+    worker.start()
+    started.wait(5)
+    try:
+        assert cache.get_or_compute('/api/overview', None, None, lambda: pytest.fail("recálculo duplicado")) == 'v1'
+    finally:
+        release.set()
+        worker.join(5)
+    assert cache.stats()['stale_hits'] == 1
+
+
+def test_failed_first_load_releases_waiters():
+    cache = ResponseCache()
+    with pytest.raises(RuntimeError):
+        cache.get_or_compute('/api/overview', None, None, lambda: (_ for _ in ()).throw(RuntimeError('db')))
+    assert cache.get_or_compute('/api/overview', None, None, lambda: 'ok') == 'ok'
+
+
+def test_eviction_skips_refilling_entry_and_stays_bounded():
+    cache = ResponseCache(max_entries=3)
+    started, release = threading.Event(), threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return 'slow'
+
+    # A entrada mais antiga fica em recálculo enquanto outras chegam
+    worker = threading.Thread(target=cache.get_or_compute, args=('/oldest', None, None, slow))
+    worker.start()
+    started.wait(5)
+    try:
+        for i in range(10):
+            cache.get_or_compute(f'/route/{i}', None, None, lambda: i)
+            assert cache.stats()['entries'] <= 3
+    finally:
+        release.set()
+        worker.join(5)
+
+    # A entrada em recálculo não foi removida; as mais antigas livres sim
+    assert ('/oldest', None, None) in cache._entries
+    assert ('/route/9', None, None) in cache._entries
+    assert ('/route/0', None, None) not in cache._entries
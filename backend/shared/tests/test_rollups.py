@@ -0,0 +1,101 @@
+from contextlib import contextmanager
+from datetime import date, timedelta
+from decimal import Decimal
+
+import rollups
+
+
+class FakeCursor:
+    """Cursor em memória: guarda os statements e devolve `rows` em ordem"""
+
+    def __init__(self, rows=(), rowcount=0):
+        self.rows = list(rows)
+        self.rowcount = rowcount
+        self.executed = []
+
+    def execute(self, sql, params=None):
+        self.executed.append((sql, params))
+
+    def fetchone(self):
+        return self.rows.pop(0)
+
+    def fetchall(self):
+        return self.rows
+
+
+def test_read_statements_do_not_write():
+    for sql in (rollups.FUNNEL_TOTALS_SQL, rollups.SALES_BY_DATE_SQL):
+        assert 'INSERT' not in sql and 'UPDATE' not in sql
+
+
+def test_funnel_totals_is_a_single_read(monkeypatch):
+    monkeypatch.setattr(rollups, 'business_today', lambda: date(2024, 5, 10))
+    row = {'first_day': date(2024, 5, 1), 'last_day': date(2024, 5, 10), 'presell_entries': 10, 'bot_starts': 8,
+           'pix_generated': 5, 'pix_paid': 2, 'revenue': Decimal('49.80'), 'conversions': 2}
+    cursor = FakeCursor([row])
+
+    totals, first_day, last_day = rollups.funnel_totals(cursor, '2024-05-01', '2024-05-10')
+
+    assert totals == {'presell_entries': 10, 'bot_starts': 8, 'pix_generated': 5, 'pix_paid': 2,
+                      'revenue': 49.8, 'conversions': 2}
+    assert (first_day, last_day) == (date(2024, 5, 1), date(2024, 5, 10))
+    (sql, params), = cursor.executed
+    assert sql is rollups.FUNNEL_TOTALS_SQL
+    assert params == {'first_day': date(2024, 5, 1), 'last_day': date(2024, 5, 10), 'today': date(2024, 5, 10)}
+
+
+def test_funnel_totals_without_range_covers_all_history():
+    row = {c: 0 for c in rollups.FUNNEL_COLUMNS}
+    row.update(first_day=None, last_day=None)
+    cursor = FakeCursor([row])
+
+    rollups.funnel_totals(cursor, '2024-05-01', None)
+
+    assert cursor.executed[0][1]['first_day'] is None and cursor.executed[0][1]['last_day'] is None
+
+
+def test_close_days_stops_before_open_days(monkeypatch):
+    monkeypatch.setattr(rollups, 'business_today', lambda: date(2024, 5, 10))
+    cursor = FakeCursor([{'locked': True}], rowcount=3)
+
+    assert rollups.close_days(cursor) == 3
+    sql, params = cursor.executed[1]
+    assert sql is rollups.CLOSE_DAYS_SQL
+    # ROLLUP_OPEN_DAYS=1: hoje e ontem continuam abertos
+    assert params['last_day'] == date(2024, 5, 10) - timedelta(days=rollups.ROLLUP_OPEN_DAYS + 1)
+
+
+def test_close_days_skips_when_another_run_holds_the_lock():
+    cursor = FakeCursor([{'locked': False}])
+
+    assert rollups.close_days(cursor) == 0
+    assert len(cursor.executed) == 1
+
+
+def test_refresher_counts_closed_days(monkeypatch):
+    closed = iter([4, 0])
+    monkeypatch.setattr(rollups, 'close_days', lambda cursor: next(closed))
+
+    @contextmanager
+    def connection():
+        class Conn:
+            def cursor(self, cursor_factory=None):
+                return FakeCursor()
+        yield Conn()
+
+    refresher = rollups.RollupRefresher(connection, interval=60)
+    refresher.refresh_once()
+    refresher.refresh_once()
+
+    stats = refresher.stats()
+    assert (stats['runs'], stats['closed_days'], stats['running']) == (2, 4, False)
+
+
+def test_fetch_sales_by_date_passes_changed_since(monkeypatch):
+    monkeypatch.setattr(rollups, 'business_today', lambda: date(2024, 5, 10))
+    cursor = FakeCursor([{'day': date(2024, 5, 9), 'revenue': Decimal('24.90'), 'pix_paid': 1}])
+
+    rows = rollups.fetch_sales_by_date(cursor, date(2024, 5, 1), date(2024, 5, 10), changed_since='ts')
+
+    assert rows == [{'date': '2024-05-09', 'revenue': 24.9, 'transactions': 1}]
+    assert cursor.executed[0][1]['changed_since'] == 'ts'
@@ -4,9 +4,19 @@
 class Dashboard {
     constructor() {
         this.apiUrl = 'https://api-gateway-production-22bb.up.railway.app'; // API Gateway correta - atualizada 22/08/2025
+        // Eventos ao vivo (SSE) vêm da Dashboard API: o gateway de pagamentos não serve streams
+        this.eventsUrl = window.__DASHBOARD_API_URL__ || null;
         this.currentTab = 'overview';
         this.lastUpdate = null;
         this.refreshInterval = null;
+        this.logsCursor = null;
+        this.eventSource = null;
+        // Últimos payloads renderizados (base para aplicar os deltas ao vivo)
+        this.overviewData = null;
+        this.salesData = null;
+        this.logsData = null;
+        // Marca d'água do último payload (base do ?since= do delta-sync)
+        this.watermark = null;
         this.timezone = 'America/Sao_Paulo';
         
         this.initializeApp();
@@ -21,7 +31,8 @@ class Dashboard {
         // Carregar dados iniciais
         await this.loadAllData();
         
-        // Auto-refresh a cada 5 minutos
+        // Deltas ao vivo via SSE + auto-refresh de segurança
+        this.connectEvents();
         this.startAutoRefresh();
         
         console.log('✅ Dashboard inicializada');
@@ -109,6 +120,11 @@ class Dashboard {
         const data = await this.apiRequest('/api/overview', filters);
         
         if (!data) return;
+        this.renderOverview(data);
+    }
+    
+    renderOverview(data) {
+        this.overviewData = data;
         
         // Atualizar cards principais
         this.updateElement('presell-entries', this.formatNumber(data.presell_entries || 0));
@@ -145,6 +161,11 @@ class Dashboard {
         const data = await this.apiRequest('/api/sales', filters);
         
         if (!data) return;
+        this.renderSales(data);
+    }
+    
+    renderSales(data) {
+        this.salesData = data;
         
         // Atualizar cards de vendas
         this.updateElement('total-revenue', this.formatCurrency(data.total_revenue || 0));
@@ -228,18 +249,38 @@ class Dashboard {
         tbody.innerHTML = html;
     }
     
-    async loadLogsData() {
+    async loadLogsData(append = false) {
         console.log('📋 Carregando logs de membros/usuários...');
         
         const filters = this.getDateFilters();
-        const data = await this.apiRequest('/api/logs', { ...filters, limit: 100 });
+        const params = { ...filters, limit: 100 };
+        if (append && this.logsCursor) {
+            params.cursor = this.logsCursor;
+        }
+        const data = await this.apiRequest('/api/logs', params);
         
         if (!data || !data.logs) return;
+        this.renderLogs(data, append);
+    }
+    
+    renderLogs(data, append = false) {
+        if (append && this.logsData) {
+            this.logsData.logs = this.logsData.logs.concat(data.logs);
+        } else {
+            this.logsData = { logs: data.logs.slice() };
+        }
+        
+        // Cursor opaco da próxima página (null = fim da lista)
+        this.logsCursor = data.next_cursor || null;
+        const loadMore = document.getElementById('logs-load-more');
+        if (loadMore) {
+            loadMore.style.display = this.logsCursor ? 'block' : 'none';
+        }
         
         const tbody = document.getElementById('logs-data');
         if (!tbody) return;
         
-        if (data.logs.length === 0) {
+        if (data.logs.length === 0 && !append) {
             tbody.innerHTML = `
                 <tr>
                     <td colspan="5" style="text-align: center; color: #94a3b8; padding: 2rem;">
@@ -275,7 +316,11 @@ class Dashboard {
             `;
         });
         
-        tbody.innerHTML = html;
+        if (append) {
+            tbody.insertAdjacentHTML('beforeend', html);
+        } else {
+            tbody.innerHTML = html;
+        }
         console.log('✅ Logs de membros carregados');
     }
     
@@ -361,17 +406,15 @@ class Dashboard {
         this.setRefreshButtonLoading(true);
         
         try {
-            // Carregar dados baseado na aba ativa
-            switch (this.currentTab) {
-                case 'overview':
-                    await this.loadOverviewData();
-                    break;
-                case 'sales':
-                    await this.loadSalesData();
-                    break;
-                case 'logs':
-                    await this.loadLogsData();
-                    break;
+            // Todos os painéis num único request (mesmo snapshot do banco)
+            const params = { ...this.getDateFilters(), panels: 'overview,sales,logs', limit: 100 };
+            const data = await this.apiRequest('/api/dashboard', params);
+            
+            if (data) {
+                if (data.overview) this.renderOverview(data.overview);
+                if (data.sales) this.renderSales(data.sales);
+                if (data.logs) this.renderLogs(data.logs);
+                this.watermark = data.watermark || null;
             }
             
             this.lastUpdate = new Date();
@@ -399,13 +442,229 @@ class Dashboard {
     }
     
     startAutoRefresh() {
-        // Auto-refresh a cada 5 minutos
+        // Com o SSE conectado os números já chegam ao vivo: o reload completo
+        // vira só uma ressincronização de segurança
+        const minutes = this.eventSource ? 15 : 5;
+        this.stopAutoRefresh();
         this.refreshInterval = setInterval(() => {
             console.log('🔄 Auto-refresh executando...');
-            this.loadAllData();
-        }, 5 * 60 * 1000);
+            this.syncDelta();
+        }, minutes * 60 * 1000);
         
-        console.log('⏰ Auto-refresh configurado para 5 minutos');
+        console.log(`⏰ Auto-refresh configurado para ${minutes} minutos`);
+    }
+    
+    connectEvents() {
+        if (!window.EventSource) {
+            console.warn('⚠️ Navegador sem EventSource - usando apenas auto-refresh');
+            return;
+        }
+        
+        if (!this.eventsUrl) {
+            console.warn('⚠️ Dashboard API não configurada (window.__DASHBOARD_API_URL__) - usando apenas auto-refresh');
+            return;
+        }
+        
+        this.eventSource = new EventSource(`${this.eventsUrl}/api/events`);
+        let hadError = false;
+        
+        this.eventSource.addEventListener('open', () => {
+            console.log('📡 Eventos ao vivo conectados');
+            // Eventos perdidos durante a queda: ressincroniza tudo uma vez
+            if (hadError) {
+                hadError = false;
+                this.syncDelta();
+            }
+        });
+        this.eventSource.addEventListener('error', () => {
+            hadError = true;
+            if (this.eventSource.readyState === EventSource.CLOSED) {
+                // Recusado (ex.: 503 com o limite de streams atingido): sem reconexão automática
+                console.warn('⚠️ Eventos ao vivo indisponíveis - usando apenas auto-refresh');
+                this.stopEvents();
+                this.startAutoRefresh();
+                return;
+            }
+            console.warn('⚠️ Eventos ao vivo desconectados, reconectando...');
+        });
+        
+        ['start', 'pix_generated', 'pix_paid'].forEach(type => {
+            this.eventSource.addEventListener(type, (message) => {
+                try {
+                    this.applyEvent(JSON.parse(message.data));
+                } catch (error) {
+                    console.error('❌ Erro aplicando evento ao vivo:', error);
+                }
+            });
+        });
+    }
+    
+    stopEvents() {
+        if (this.eventSource) {
+            this.eventSource.close();
+            this.eventSource = null;
+        }
+    }
+    
+    eventInRange(event) {
+        const { start_date, end_date } = this.getDateFilters();
+        if (!start_date || !end_date || !event.day) return true;
+        return event.day >= start_date && event.day <= end_date;
+    }
+    
+    applyEvent(event) {
+        if (!this.eventInRange(event)) return;
+        console.log(`📡 Evento ao vivo: ${event.type}`, event);
+        
+        const overview = this.overviewData;
+        const sales = this.salesData;
+        
+        switch (event.type) {
+            case 'start':
+                if (overview) overview.bot_starts = (overview.bot_starts || 0) + 1;
+                this.applyLogEvent(event);
+                break;
+            case 'pix_generated':
+                if (overview) overview.pix_generated = (overview.pix_generated || 0) + 1;
+                this.applyLogEvent(event);
+                break;
+            case 'pix_paid':
+                if (overview) overview.pix_paid = (overview.pix_paid || 0) + 1;
+                if (sales) {
+                    sales.total_revenue = (sales.total_revenue || 0) + (event.amount || 0);
+                    sales.total_transactions = (sales.total_transactions || 0) + 1;
+                    this.applySalesByDate(sales, event);
+                }
+                this.applyLogEvent(event);
+                break;
+            default:
+                return;
+        }
+        
+        if (overview) {
+            // Etapas derivadas de bot_starts/pix_generated (mesma regra do backend)
+            overview.step_1_welcome = overview.bot_starts;
+            overview.step_2_preview = Math.floor(overview.bot_starts * 0.8);
+            overview.step_3_gallery = Math.floor(overview.bot_starts * 0.6);
+            overview.step_4_vip_plans = Math.floor(overview.bot_starts * 0.4);
+            overview.step_5_payment = overview.pix_generated;
+            this.renderOverview(overview);
+        }
+        if (sales) {
+            const paid = sales.total_transactions || 0;
+            sales.average_ticket = paid > 0 ? sales.total_revenue / paid : 0;
+            if (overview && overview.pix_generated > 0) {
+                sales.conversion_rate = (paid / overview.pix_generated) * 100;
+            }
+            this.renderSales(sales);
+        }
+    }
+    
+    applySalesByDate(sales, event) {
+        const rows = sales.sales_by_date || (sales.sales_by_date = []);
+        const row = rows.find(item => item.date === event.day);
+        if (row) {
+            row.revenue += event.amount || 0;
+            row.transactions += 1;
+        } else {
+            rows.unshift({ date: event.day, revenue: event.amount || 0, transactions: 1 });
+        }
+    }
+    
+    applyLogEvent(event) {
+        if (!this.logsData) return;
+        const logs = this.logsData.logs;
+        let row = logs.find(log => log.telegram_id === event.telegram_id);
+        
+        if (event.type === 'start') {
+            if (row) return;
+            const fullName = `${event.first_name || 'Usuário'} ${event.last_name || ''}`.trim();
+            logs.unshift({
+                date: event.created_at,
+                full_name: fullName,
+                user_type: event.username ? `@${event.username}` : 'Bot User',
+                last_step: 'Etapa 1 (Boas-vindas)',
+                pix_status: 'Não gerou PIX',
+                telegram_id: event.telegram_id,
+                total_pix: 0,
+                total_paid: 0,
+                total_amount_paid: 0
+            });
+        } else if (row) {
+            if (event.type === 'pix_generated') {
+                row.total_pix = (row.total_pix || 0) + 1;
+                if (row.pix_status !== 'PAGO') row.pix_status = 'PIX gerado';
+            } else {
+                row.total_paid = (row.total_paid || 0) + 1;
+                row.total_amount_paid = (row.total_amount_paid || 0) + (event.amount || 0);
+                row.pix_status = 'PAGO';
+            }
+        } else {
+            return;
+        }
+        
+        const cursor = this.logsCursor;
+        this.renderLogs({ logs: logs, next_cursor: cursor });
+    }
+    
+    async syncDelta() {
+        // Sem marca d'água (primeira carga falhou) não há base para o delta
+        if (!this.watermark || !this.salesData || !this.logsData) {
+            return this.loadAllData();
+        }
+        
+        try {
+            const params = {
+                ...this.getDateFilters(),
+                panels: 'overview,sales,logs',
+                limit: 100,
+                since: this.watermark
+            };
+            const data = await this.apiRequest('/api/dashboard', params);
+            if (!data) return;
+            
+            // Muitas mudanças desde a última sincronização: recarrega tudo
+            if (data.logs && data.logs.reset) {
+                return this.loadAllData();
+            }
+            
+            if (data.overview) this.renderOverview(data.overview);
+            if (data.sales) this.renderSales(this.mergeSales(data.sales));
+            if (data.logs) this.mergeLogs(data.logs);
+            this.watermark = data.watermark || this.watermark;
+            this.lastUpdate = new Date();
+            console.log('✅ Delta-sync aplicado');
+        } catch (error) {
+            console.error('❌ Erro no delta-sync:', error);
+        }
+    }
+    
+    mergeSales(delta) {
+        if (!delta.delta) return delta;
+        // Totais vêm completos; sales_by_date só com os dias alterados
+        const byDate = new Map((this.salesData.sales_by_date || []).map(row => [row.date, row]));
+        delta.sales_by_date.forEach(row => byDate.set(row.date, row));
+        delta.sales_by_date = Array.from(byDate.values())
+            .sort((a, b) => b.date.localeCompare(a.date));
+        return delta;
+    }
+    
+    mergeLogs(delta) {
+        if (!delta.delta) {
+            this.renderLogs(delta);
+            return;
+        }
+        const logs = this.logsData.logs;
+        delta.logs.forEach(row => {
+            const index = logs.findIndex(log => log.telegram_id === row.telegram_id);
+            if (index >= 0) {
+                logs[index] = row;
+            } else {
+                logs.push(row);
+            }
+        });
+        logs.sort((a, b) => (b.date || '').localeCompare(a.date || ''));
+        this.renderLogs({ logs: logs, next_cursor: this.logsCursor });
     }
     
     stopAutoRefresh() {
@@ -446,6 +705,13 @@ function refreshData() {
     }
 }
 
+function loadMoreLogs() {
+    console.log('📄 Carregando próxima página de membros...');
+    if (window.dashboard) {
+        window.dashboard.loadLogsData(true);
+    }
+}
+
 function applyFilters() {
     console.log('🎯 Aplicando filtros...');
     if (window.dashboard) {
@@ -463,6 +729,7 @@ document.addEventListener('DOMContentLoaded', () => {
 window.addEventListener('beforeunload', () => {
     if (window.dashboard) {
         window.dashboard.stopAutoRefresh();
+        window.dashboard.stopEvents();
     }
 });
 